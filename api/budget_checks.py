@@ -0,0 +1,164 @@
+"""按多种数据规模检查各接口的查询预算
+
+manage.py check_query_budgets 与 api.tests.QueryBudgetTests 共用：逐级补足数据后请求每个用例两次，
+第一次在清空共享缓存与进程内缓存后执行（冷路径），第二次为预热后的请求，两次都不能超出视图声明的预算，
+查询数也不能随数据规模增长。
+"""
+from django.core.cache import cache
+from django.urls import resolve
+from rest_framework.test import APIClient
+
+from prompts import diff
+from prompts.importer import import_records
+from prompts.models import Prompt, Tag
+from users.authentication import issue_token
+from users.models import User
+from . import models, stats
+from .budgets import QueryCounter, budget_for, violations
+from .models import SystemSetting
+
+TAG_NAMES = ['hot'] + [f'tag-{i}' for i in range(9)]
+
+# (名称, 方法, 路径模板, 请求用户, 请求体)
+CASES = [
+    ('prompt list', 'get', '/api/prompts/', 'owner', None),
+    ('prompt list (100)', 'get', '/api/prompts/?page_size=100', 'owner', None),
+    ('prompt list (cursor)', 'get', '/api/prompts/?pagination=cursor', 'other', None),
+    ('prompt create', 'post', '/api/prompts/', 'owner',
+     {'title': 'new prompt {size}', 'content': 'created at size {size}', 'sharing_mode': 'team'}),
+    ('prompt detail', 'get', '/api/prompts/{prompt}/', 'other', None),
+    ('prompt update', 'patch', '/api/prompts/{prompt}/', 'owner', {'content': 'edited {size}'}),
+    ('prompt versions', 'get', '/api/prompts/{prompt}/versions/', 'owner', None),
+    ('prompt search', 'get', '/api/prompts/search/?q=prompt', 'owner', None),
+    ('prompt search (prefix)', 'get', '/api/prompts/search/?q=summ', 'owner', None),
+    ('prompt search (fuzzy)', 'get', '/api/prompts/search/?q=sumarise', 'owner', None),
+    ('prompt search (5 tokens)', 'get', '/api/prompts/search/?q=summarise+the+text+below+sentences', 'owner', None),
+    ('prompt batch', 'post', '/api/prompts/batch/', 'owner', {'ids': '{batch}'}),
+    ('prompts by tag', 'get', '/api/prompts/tags/{tag}/prompts/', 'other', None),
+    ('tag list', 'get', '/api/prompts/tags/', 'other', None),
+    ('profile', 'get', '/api/users/profile/', 'owner', None),
+    ('admin stats', 'get', '/api/users/admin/stats/', 'admin', None),
+    ('admin users', 'get', '/api/users/admin/users/', 'admin', None),
+    ('admin user detail', 'get', '/api/users/admin/users/{user}/', 'admin', None),
+    ('system settings', 'get', '/api/admin/settings/', 'admin', None),
+]
+
+
+class Run:
+    """一个用例在一种数据规模下的测量结果"""
+
+    def __init__(self, size, cold, warm, budget, method, url):
+        self.size = size
+        self.cold = cold
+        self.warm = warm
+        self.budget = budget
+        self.method = method
+        self.url = url
+
+
+def select_cases(names=None):
+    """名称包含 names 中任一字符串的用例，names 为空时返回全部"""
+    return [case for case in CASES if not names or any(name in case[0] for name in names)]
+
+
+def reset_process_state():
+    """模拟新启动的进程：清空共享缓存与进程内的设置快照、差异缓存和每日汇总行记录"""
+    cache.clear()
+    models._snapshot = None
+    stats._daily_rows = (None, set())
+    diff.diff_cache.clear()
+
+
+def run_cases(cases, sizes):
+    """按数据规模依次补足数据并测量各用例，返回 {名称: [Run]}"""
+    # 关闭响应缓存，测量的是实际查询
+    SystemSetting.set_many({'cacheEnabled': False, 'rateLimit': 0}, {'cacheEnabled': 'performance', 'rateLimit': 'performance'})
+    users = {
+        'admin': User.objects.create_user('budget-admin', password='x', role='admin'),
+        'owner': User.objects.create_user('budget-owner', password='x'),
+        'other': User.objects.create_user('budget-other', password='x'),
+    }
+    # 与真实请求一样使用令牌认证，冷路径包含令牌查询
+    clients = {}
+    for name, user in users.items():
+        clients[name] = APIClient()
+        clients[name].credentials(HTTP_AUTHORIZATION=f'Token {issue_token(user).key}')
+
+    results = {case[0]: [] for case in cases}
+    seeded = 0
+    for size in sizes:
+        seed(users, seeded, size)
+        seeded = size
+        context = make_context(users, size)
+        for name, method, path, client_name, body in cases:
+            url = path.format(**context)
+            data = None
+            if body is not None:
+                data = {key: context['batch_ids'] if value == '{batch}' else value.format(**context)
+                        for key, value in body.items()}
+            client = clients[client_name]
+            counts = []
+            for cold in (True, False):
+                if cold:
+                    reset_process_state()
+                with QueryCounter() as counter:
+                    response = getattr(client, method)(url, data, format='json')
+                if response.status_code >= 400:
+                    raise AssertionError(f'{name}: {method.upper()} {url} returned {response.status_code}')
+                counts.append(counter)
+            budget = budget_for(resolve(url.split('?')[0]).func, method)
+            results[name].append(Run(size, counts[0], counts[1], budget, method, url))
+    return results
+
+
+def seed(users, start, end):
+    """每个用户的提示词补足到 end 条；所有提示词带 hot 标签，其余标签轮流分配；首个提示词有 end 个版本"""
+    for user_name in ('owner', 'other'):
+        records = [
+            (f'{user_name}:{i}', {
+                'title': f'{user_name} prompt {i}',
+                'content': f'Prompt {i} by {user_name}: summarise the text below in {i % 7 + 1} sentences.',
+                'sharing_mode': 'team' if i % 2 else 'private',
+                'tags': ['hot', TAG_NAMES[1 + i % 9], TAG_NAMES[1 + (i * 7) % 9]],
+            })
+            for i in range(start, end)
+        ]
+        import_records(records, users[user_name])
+    prompt = Prompt.objects.filter(author=users['owner'], sharing_mode='team').order_by('id').first()
+    for version in range(prompt.versions.count(), end):
+        prompt.commit_version(f'{prompt.content}\nRevision {version}', users['owner'], f'Revision {version}')
+    User.objects.bulk_create(
+        [User(username=f'budget-user-{i}', email=f'budget-user-{i}@example.com') for i in range(start, end)]
+    )
+
+
+def make_context(users, size):
+    owner_prompts = Prompt.objects.filter(author=users['owner']).order_by('id')
+    return {
+        'size': size,
+        'prompt': owner_prompts.filter(sharing_mode='team').first().id,
+        'tag': Tag.objects.get(name='hot').id,
+        'user': users['owner'].id,
+        'batch_ids': list(owner_prompts.values_list('id', flat=True)[:50]),
+    }
+
+
+def problems(runs, check_time=True):
+    """超出预算或查询数随数据规模增长的描述列表；check_time=False 时只检查查询数（耗时受运行环境影响）"""
+    budget = runs[0].budget
+    if budget is None:
+        return ['no budget declared']
+    if not check_time:
+        budget = budget._replace(db_ms=None)
+    found = []
+    for run in runs:
+        for label, counter in (('cold', run.cold), ('warm', run.warm)):
+            found += [
+                f'size {run.size} ({label}): {problem}'
+                for problem in violations(budget, counter.queries, counter.db_time)
+            ]
+    for label in ('cold', 'warm'):
+        first, last = getattr(runs[0], label).queries, getattr(runs[-1], label).queries
+        if last > first:
+            found.append(f'{label} queries grow with data size ({first} -> {last})')
+    return found
@@ -0,0 +1,136 @@
+"""接口查询预算
+
+在视图上声明每个请求允许的最大查询数与数据库耗时：
+
+    @query_budget(queries=6, db_ms=50)
+    @api_view(['GET'])
+    def prompts_by_tag(request, tag_id): ...
+
+    @query_budget(queries=12, methods=['POST'])
+    @query_budget(queries=6)
+    class PromptListCreateView(...): ...
+
+函数视图的装饰器需放在 @api_view 之上；未指定 methods 的预算适用于其他所有方法。
+MetricsMiddleware 在每个请求结束后检查预算，行为由 settings.QUERY_BUDGET_MODE 决定：
+'warn'（默认）记录结构化警告并计数，'raise' 抛出 QueryBudgetExceeded（开发与测试），'off' 不检查。
+manage.py check_query_budgets 在多种数据规模下请求各接口（冷路径与预热后各一次，见 api.budget_checks），
+超出预算或查询数随数据量增长时失败；测试套件中的 QueryBudgetTests 以同样的用例检查查询数。
+"""
+import logging
+import time
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.db import connection
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+ANY_METHOD = '*'
+
+BUDGET_EXCEEDED = metrics.counter('query_budget_exceeded_total', 'Requests over their query budget by URL name', label='view')
+
+
+class QueryBudget(NamedTuple):
+    queries: int
+    db_ms: Optional[float] = None
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(queries, db_ms=None, methods=None):
+    """为视图函数或视图类声明查询预算，可叠加以按方法区分"""
+    def decorator(view):
+        budgets = dict(getattr(view, 'query_budgets', {}))
+        for method in methods or [ANY_METHOD]:
+            budgets[method.upper()] = QueryBudget(queries, db_ms)
+        view.query_budgets = budgets
+        return view
+    return decorator
+
+
+def budget_for(view_func, method):
+    """解析结果对应的视图（函数或 as_view() 返回的函数）在该方法下的预算，未声明时返回 None"""
+    budgets = getattr(view_func, 'query_budgets', None)
+    if budgets is None:
+        budgets = getattr(getattr(view_func, 'view_class', None), 'query_budgets', None)
+    if not budgets:
+        return None
+    return budgets.get(method.upper(), budgets.get(ANY_METHOD))
+
+
+def violations(budget, queries, db_time):
+    """返回超出预算的描述列表，db_time 单位为秒"""
+    problems = []
+    if queries > budget.queries:
+        problems.append(f'{queries} queries > {budget.queries}')
+    if budget.db_ms is not None and db_time * 1000 > budget.db_ms:
+        problems.append(f'{db_time * 1000:.1f} ms in database > {budget.db_ms} ms')
+    return problems
+
+
+def mode():
+    return getattr(settings, 'QUERY_BUDGET_MODE', 'warn')
+
+
+def enforce(request, view, queries, db_time):
+    """检查当前请求是否超出所属视图的预算"""
+    current_mode = mode()
+    if current_mode == 'off':
+        return
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return
+    budget = budget_for(match.func, request.method)
+    if budget is None:
+        return
+    problems = violations(budget, queries, db_time)
+    if not problems:
+        return
+
+    message = f'Query budget exceeded for {request.method} {view}: ' + '; '.join(problems)
+    if current_mode == 'raise':
+        raise QueryBudgetExceeded(message)
+    BUDGET_EXCEEDED[view] += 1
+    logger.warning(message, extra={'query_budget': {
+        'view': view,
+        'method': request.method,
+        'path': request.path,
+        'queries': queries,
+        'query_budget': budget.queries,
+        'db_ms': round(db_time * 1000, 2),
+        'db_ms_budget': budget.db_ms,
+    }})
+
+
+class QueryCounter:
+    """统计代码块内默认数据库连接上的查询数与耗时
+
+        with QueryCounter() as counter:
+            ...
+        counter.queries, counter.db_time
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self._wrapper = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - start
+
+    def __enter__(self):
+        self._wrapper = connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._wrapper.__exit__(*exc_info)
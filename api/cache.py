@@ -0,0 +1,490 @@
+"""两级缓存后端
+
+L1 是进程内有界 LRU，L2 是各 worker 共享的后端：LOCATION 为 redis:// 地址时使用 Redis，
+否则视为目录，使用文件缓存。读先查 L1，未命中再查 L2 并回填 L1；写同时写入 L2 与本进程 L1，
+并广播被修改的键，其他进程收到后丢弃各自 L1 中的副本。
+
+两种 L2 的 add/incr 都是原子的，可用于多进程共享的计数器（见 RingBuffer）。
+
+广播方式随 L2 而定：Redis 使用 pub/sub，由后台线程接收；文件缓存在目录中维护一个追加写入的
+失效日志，每次访问缓存时检查日志是否增长（一次 stat）。广播丢失时，L1 条目最多存活 L1_TIMEOUT 秒。
+
+OPTIONS：
+    L1_MAX_ENTRIES  每个进程 L1 的最大条目数（默认 1000）
+    L1_TIMEOUT      L1 条目的最长存活秒数（默认 60）
+    L2_OPTIONS      传给 L2 后端的 OPTIONS
+"""
+import json
+import os
+import pickle
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.redis import RedisCache
+from django.core.files import locks
+
+from . import metrics
+
+CLEAR_ALL = '*'
+REDIS_SCHEMES = ('redis://', 'rediss://', 'unix://')
+
+_MISSING = object()
+
+
+class LocalStore:
+    """线程安全的 LRU，值以 pickle 保存，避免调用方修改共享对象"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return _MISSING
+            expires, pickled = item
+            if expires <= time.time():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+        return pickle.loads(pickled)
+
+    def set(self, key, value, expires):
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._data[key] = (expires, pickled)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def has_key(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            return item is not None and item[0] > time.time()
+
+    def discard(self, keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class FileBroadcast:
+    """通过共享目录中的追加日志广播失效的键"""
+
+    MAX_LOG_BYTES = 1024 * 1024
+
+    def __init__(self, directory, store):
+        self.path = os.path.join(directory, 'invalidations.log')
+        self.store = store
+        self.origin = uuid.uuid4().hex
+        self._position = None
+        self._lock = threading.Lock()
+
+    def publish(self, keys):
+        lines = ''.join(f'{self.origin}\t{key}\n' for key in keys).encode('utf-8')
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # 无缓冲的 O_APPEND 写入是一次系统调用，多进程并发追加不会交错
+        with open(self.path, 'ab', buffering=0) as log:
+            log.write(lines)
+            size = log.tell()
+        if size > self.MAX_LOG_BYTES:
+            # 以新文件替换日志，其他进程发现 inode 变化后清空 L1
+            temporary = f'{self.path}.{self.origin}'
+            open(temporary, 'w').close()
+            os.replace(temporary, self.path)
+
+    def poll(self):
+        with self._lock:
+            self._poll()
+        return True
+
+    def _poll(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            stat = None
+        position = (stat.st_ino, stat.st_size) if stat else (None, 0)
+        if self._position is None:
+            # 启动时 L1 为空，历史日志无需处理
+            self._position = position
+            return
+        inode, offset = self._position
+        if position[0] != inode or position[1] < offset:
+            self.store.clear()
+            self._position = position
+            return
+        if position[1] == offset:
+            return
+        with open(self.path, 'rb') as log:
+            log.seek(offset)
+            data = log.read(position[1] - offset)
+        # 只处理完整的行，写了一半的行留到下次
+        complete = data.rfind(b'\n') + 1
+        self._position = (inode, offset + complete)
+        self._apply(data[:complete].decode('utf-8').splitlines())
+
+    def _apply(self, lines):
+        keys = []
+        for line in lines:
+            origin, _, key = line.partition('\t')
+            if origin == self.origin:
+                continue
+            if key == CLEAR_ALL:
+                self.store.clear()
+                return
+            keys.append(key)
+        self.store.discard(keys)
+
+
+class RedisBroadcast:
+    """通过 Redis pub/sub 广播失效的键，后台线程接收"""
+
+    CHANNEL = 'cache:invalidate'
+    SUBSCRIBE_TIMEOUT = 1
+
+    def __init__(self, url, store):
+        import redis
+
+        self.store = store
+        self.origin = uuid.uuid4().hex
+        self._client = redis.Redis.from_url(url)
+        self._errors = (redis.RedisError, OSError)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def publish(self, keys):
+        self._client.publish(self.CHANNEL, json.dumps([self.origin, list(keys)]))
+
+    def poll(self):
+        """确保订阅已生效；订阅失败时返回 False，此时 L1 可能错过了广播，不能使用"""
+        if self._thread is not None:
+            return True
+        with self._lock:
+            if self._thread is None:
+                try:
+                    self._subscribe()
+                except self._errors:
+                    return False
+        return True
+
+    def _subscribe(self):
+        pubsub = self._client.pubsub()
+        pubsub.subscribe(**{self.CHANNEL: self._on_message})
+        # 等到服务器确认订阅，之后发布的失效广播都能收到
+        deadline = time.monotonic() + self.SUBSCRIBE_TIMEOUT
+        while True:
+            message = pubsub.get_message(timeout=self.SUBSCRIBE_TIMEOUT)
+            if message is not None and message['type'] == 'subscribe':
+                break
+            if time.monotonic() > deadline:
+                pubsub.close()
+                raise TimeoutError('Timed out subscribing to cache invalidations')
+        # 订阅生效前写入 L1 的条目可能错过了广播
+        self.store.clear()
+        self._thread = pubsub.run_in_thread(sleep_time=1, daemon=True, exception_handler=self._on_error)
+
+    def _on_message(self, message):
+        origin, keys = json.loads(message['data'])
+        if origin == self.origin:
+            return
+        if CLEAR_ALL in keys:
+            self.store.clear()
+        else:
+            self.store.discard(keys)
+
+    def _on_error(self, exc, pubsub, thread):
+        # 连接中断期间可能错过广播，清空 L1，下次访问时重新订阅（订阅成功前不使用 L1）
+        thread.stop()
+        pubsub.close()
+        self.store.clear()
+        self._thread = None
+
+
+class CounterFileCache(FileBasedCache):
+    """支持原子计数的文件缓存，用作限流计数器与两级缓存的文件 L2
+
+    FileBasedCache.incr 是 get + set：会以默认超时覆盖 add() 设置的过期时间，并发时丢失计数；
+    每次 set 还会列出整个目录检查是否需要清理。这里：
+    - add 先写临时文件再以 os.link 创建目标文件，键已存在时失败，多进程不会互相覆盖
+    - incr/decr 持有文件锁原地改写，保留原有的过期时间；读取时持有共享锁，不会读到写了一半的文件
+    - 目录清理每 CULL_INTERVAL 秒最多进行一次
+    """
+
+    CULL_INTERVAL = 60
+
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        self._next_cull = 0
+
+    def get(self, key, default=None, version=None):
+        try:
+            with open(self._key_to_file(key, version), 'rb') as f:
+                locks.lock(f, locks.LOCK_SH)
+                try:
+                    expiry = pickle.load(f)
+                    if expiry is None or expiry >= time.time():
+                        return pickle.loads(zlib.decompress(f.read()))
+                finally:
+                    locks.unlock(f)
+        except (FileNotFoundError, EOFError):
+            pass
+        return default
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._createdir()
+        fname = self._key_to_file(key, version)
+        self._cull()
+        fd, tmp_path = tempfile.mkstemp(dir=self._dir)
+        try:
+            with open(fd, 'wb') as f:
+                self._write_content(f, timeout, value)
+            for _ in range(2):
+                try:
+                    os.link(tmp_path, fname)
+                    return True
+                except FileExistsError:
+                    # has_key() 会删除已过期的文件，删除后重试一次
+                    if self.has_key(key, version):
+                        return False
+            return False
+        finally:
+            os.remove(tmp_path)
+
+    def incr(self, key, delta=1, version=None):
+        try:
+            with open(self._key_to_file(key, version), 'r+b') as f:
+                locks.lock(f, locks.LOCK_EX)
+                try:
+                    expiry = pickle.load(f)
+                    if expiry is not None and expiry < time.time():
+                        raise ValueError(f"Key '{key}' not found")
+                    value = pickle.loads(zlib.decompress(f.read())) + delta
+                    f.seek(0)
+                    f.write(pickle.dumps(expiry, self.pickle_protocol))
+                    f.write(zlib.compress(pickle.dumps(value, self.pickle_protocol)))
+                    f.truncate()
+                finally:
+                    locks.unlock(f)
+        except (FileNotFoundError, EOFError):
+            raise ValueError(f"Key '{key}' not found")
+        return value
+
+    def _cull(self):
+        now = time.monotonic()
+        if now < self._next_cull:
+            return
+        self._next_cull = now + self.CULL_INTERVAL
+        super()._cull()
+
+
+# 每个进程每个 LOCATION 一份 L1 与广播（Django 为每个线程创建独立的缓存实例）
+_process_state = {}
+_process_state_lock = threading.Lock()
+
+
+class TieredCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.l1_max_entries = int(options.get('L1_MAX_ENTRIES', 1000))
+        self.l1_timeout = float(options.get('L1_TIMEOUT', 60))
+        l2_params = {**params, 'OPTIONS': dict(options.get('L2_OPTIONS', {}))}
+        self.location = location
+        if location.startswith(REDIS_SCHEMES):
+            self._l2 = RedisCache(location, l2_params)
+            self._broadcast_class = RedisBroadcast
+        else:
+            self._l2 = CounterFileCache(location, l2_params)
+            self._broadcast_class = FileBroadcast
+
+    def _state(self):
+        """返回本进程的 (L1, 广播)；fork 之后重新创建"""
+        pid = os.getpid()
+        state = _process_state.get(self.location)
+        if state is None or state[0] != pid:
+            with _process_state_lock:
+                state = _process_state.get(self.location)
+                if state is None or state[0] != pid:
+                    store = LocalStore(self.l1_max_entries)
+                    state = (pid, store, self._broadcast_class(self.location, store))
+                    _process_state[self.location] = state
+        if not state[2].poll():
+            # 失效广播不可用时不使用 L1
+            state[1].clear()
+        return state[1], state[2]
+
+    def _local_expiry(self, timeout):
+        expiry = self.get_backend_timeout(timeout)
+        local_expiry = time.time() + self.l1_timeout
+        return local_expiry if expiry is None else min(expiry, local_expiry)
+
+    def _store_local(self, store, key, value, timeout):
+        expiry = self._local_expiry(timeout)
+        if expiry > time.time():
+            store.set(key, value, expiry)
+        else:
+            store.discard([key])
+
+    def get(self, key, default=None, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        store, broadcast = self._state()
+        value = store.get(local_key)
+        if value is not _MISSING:
+            metrics.CACHE_EVENTS['l1_hit'] += 1
+            return value
+        value = self._l2.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            metrics.CACHE_EVENTS['miss'] += 1
+            return default
+        metrics.CACHE_EVENTS['l2_hit'] += 1
+        self._store_local(store, local_key, value, DEFAULT_TIMEOUT)
+        return value
+
+    def get_many(self, keys, version=None):
+        store, broadcast = self._state()
+        found = {}
+        missing = []
+        for key in keys:
+            value = store.get(self.make_and_validate_key(key, version=version))
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        metrics.CACHE_EVENTS['l1_hit'] += len(found)
+        if missing:
+            fetched = self._l2.get_many(missing, version=version)
+            for key, value in fetched.items():
+                self._store_local(store, self.make_and_validate_key(key, version=version), value, DEFAULT_TIMEOUT)
+            found.update(fetched)
+            metrics.CACHE_EVENTS['l2_hit'] += len(fetched)
+            metrics.CACHE_EVENTS['miss'] += len(missing) - len(fetched)
+        return found
+
+    def has_key(self, key, version=None):
+        store, broadcast = self._state()
+        return store.has_key(self.make_and_validate_key(key, version=version)) or self._l2.has_key(
+            key, version=version
+        )
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        self._l2.set(key, value, timeout, version=version)
+        store, broadcast = self._state()
+        self._store_local(store, local_key, value, timeout)
+        broadcast.publish([local_key])
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        added = self._l2.add(key, value, timeout, version=version)
+        store, broadcast = self._state()
+        if added:
+            self._store_local(store, local_key, value, timeout)
+            broadcast.publish([local_key])
+        return added
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self._l2.set_many(data, timeout, version=version)
+        store, broadcast = self._state()
+        local_keys = []
+        for key, value in data.items():
+            local_key = self.make_and_validate_key(key, version=version)
+            local_keys.append(local_key)
+            if key not in failed:
+                self._store_local(store, local_key, value, timeout)
+        broadcast.publish(local_keys)
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._l2.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        deleted = self._l2.delete(key, version=version)
+        self._invalidate([local_key])
+        return deleted
+
+    def delete_many(self, keys, version=None):
+        local_keys = [self.make_and_validate_key(key, version=version) for key in keys]
+        self._l2.delete_many(keys, version=version)
+        self._invalidate(local_keys)
+
+    def incr(self, key, delta=1, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        try:
+            return self._l2.incr(key, delta, version=version)
+        finally:
+            self._invalidate([local_key])
+
+    def clear(self):
+        self._l2.clear()
+        store, broadcast = self._state()
+        store.clear()
+        broadcast.publish([CLEAR_ALL])
+
+    def close(self, **kwargs):
+        self._l2.close(**kwargs)
+
+    def _invalidate(self, local_keys):
+        store, broadcast = self._state()
+        store.discard(local_keys)
+        broadcast.publish(local_keys)
+
+
+class RingBuffer:
+    """共享缓存中的定长环形缓冲区
+
+    每个条目单独一个键，写入位置由原子 incr 分配，并发写入互不覆盖，也没有整表的读改写。
+    """
+
+    def __init__(self, prefix, size, timeout=None, cache=None):
+        from django.core.cache import cache as default_cache
+
+        self.prefix = prefix
+        self.size = size
+        self.timeout = timeout
+        self.cache = cache or default_cache
+        self.sequence_key = f'{prefix}:sequence'
+
+    def slot_key(self, slot):
+        return f'{self.prefix}:{slot % self.size}'
+
+    def next_slot(self):
+        try:
+            return self.cache.incr(self.sequence_key)
+        except ValueError:
+            self.cache.add(self.sequence_key, 0, None)
+            return self.cache.incr(self.sequence_key)
+
+    def append(self, entry):
+        """写入条目，返回其序号"""
+        slot = self.next_slot()
+        self.put(slot, entry)
+        return slot
+
+    def put(self, slot, entry):
+        """写入 next_slot() 分配的位置"""
+        self.cache.set(self.slot_key(slot), (slot, time.time(), entry), self.timeout)
+
+    def entries(self):
+        """返回 [(序号, 条目)]，最新的在前（按写入时间排序，序号计数器被淘汰重置后顺序仍然正确）"""
+        stored = self.cache.get_many([self.slot_key(slot) for slot in range(self.size)])
+        ordered = sorted(stored.values(), key=lambda item: item[1], reverse=True)
+        return [(slot, entry) for slot, _, entry in ordered]
+
+    def clear(self):
+        self.cache.delete_many([self.slot_key(slot) for slot in range(self.size)])
@@ -0,0 +1,353 @@
+import datetime
+import http.client
+import json
+import math
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from api import stats
+from api.budgets import QueryCounter
+from users.models import User
+
+# (名称, 路径模板, 请求用户)；只包含只读请求，不修改数据
+SCENARIOS = [
+    ('prompt-list', '/api/prompts/', 'user'),
+    ('prompt-list-cursor', '/api/prompts/?pagination=cursor', 'user'),
+    ('prompt-detail', '/api/prompts/{prompt}/', 'user'),
+    ('prompt-versions', '/api/prompts/{long_prompt}/versions/', 'user'),
+    ('version-diff', '/api/prompts/{long_prompt}/versions/{old_version}/diff/{new_version}/', 'user'),
+    ('prompts-by-hot-tag', '/api/prompts/tags/{hot_tag}/prompts/', 'user'),
+    ('prompts-by-cold-tag', '/api/prompts/tags/{cold_tag}/prompts/', 'user'),
+    ('tag-list', '/api/prompts/tags/', 'user'),
+    ('search', '/api/prompts/search/?q={word}', 'user'),
+    ('profile', '/api/users/profile/', 'user'),
+    ('admin-stats', '/api/users/admin/stats/', 'admin'),
+    ('admin-users', '/api/users/admin/users/', 'admin'),
+    ('system-settings', '/api/admin/settings/', 'admin'),
+]
+
+
+class InProcessTransport:
+    """通过测试客户端在本进程内请求，可统计每个请求的查询数"""
+
+    name = 'in-process'
+
+    def __init__(self, users):
+        self.users = users
+        self.local = threading.local()
+
+    def client(self, role):
+        clients = getattr(self.local, 'clients', None)
+        if clients is None:
+            clients = self.local.clients = {}
+        if role not in clients:
+            clients[role] = APIClient()
+            clients[role].force_authenticate(self.users[role])
+        return clients[role]
+
+    def request(self, role, path):
+        client = self.client(role)
+        with QueryCounter() as counter:
+            start = time.perf_counter()
+            response = client.get(path)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - start
+        return response.status_code, elapsed, counter.queries, response
+
+    def finish_thread(self):
+        connection.close()
+
+
+class HttpTransport:
+    """通过 HTTP 请求运行中的服务，每个线程一个长连接"""
+
+    def __init__(self, base_url, tokens):
+        parts = urlsplit(base_url)
+        self.name = base_url
+        self.scheme = parts.scheme
+        self.netloc = parts.netloc
+        self.prefix = parts.path.rstrip('/')
+        self.tokens = tokens
+        self.local = threading.local()
+
+    def connection(self):
+        conn = getattr(self.local, 'connection', None)
+        if conn is None:
+            factory = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+            conn = self.local.connection = factory(self.netloc, timeout=60)
+        return conn
+
+    def request(self, role, path):
+        headers = {'Authorization': f'Token {self.tokens[role]}', 'Accept': 'application/json'}
+        start = time.perf_counter()
+        try:
+            conn = self.connection()
+            conn.request('GET', self.prefix + path, headers=headers)
+            response = conn.getresponse()
+            body = response.read()
+        except (OSError, http.client.HTTPException):
+            self.finish_thread()
+            raise
+        elapsed = time.perf_counter() - start
+        return response.status, elapsed, None, body
+
+    def finish_thread(self):
+        conn = getattr(self.local, 'connection', None)
+        if conn is not None:
+            conn.close()
+            self.local.connection = None
+
+    @staticmethod
+    def login(base_url, username, password):
+        parts = urlsplit(base_url)
+        factory = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        conn = factory(parts.netloc, timeout=60)
+        body = json.dumps({'username': username, 'password': password})
+        conn.request('POST', parts.path.rstrip('/') + '/api/users/login/', body=body,
+                     headers={'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        data = json.loads(response.read() or b'{}')
+        conn.close()
+        if response.status != 200 or 'token' not in data:
+            raise CommandError(f'Login as {username} failed: HTTP {response.status} {data}')
+        return data['token']
+
+
+def percentile(sorted_values, percent):
+    if not sorted_values:
+        return None
+    index = max(math.ceil(percent / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[index]
+
+
+def summarize(latencies, statuses, queries, wall_time):
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        'requests': count,
+        'errors': sum(count for status, count in statuses.items() if not 200 <= int(status) < 400),
+        'statuses': statuses,
+        'throughput_rps': round(count / wall_time, 2) if wall_time else None,
+        'mean_ms': round(sum(latencies) / count * 1000, 2) if count else None,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2) if count else None,
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2) if count else None,
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2) if count else None,
+        'max_ms': round(latencies[-1] * 1000, 2) if count else None,
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+    }
+
+
+class Command(BaseCommand):
+    help = '对 API 路由做并发基准测试，报告吞吐量、p50/p95/p99 延迟与每请求查询数，结果可保存为 JSON 以便比较'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='运行中服务的地址（如 http://localhost:8000），省略时在本进程内通过测试客户端请求')
+        parser.add_argument('--concurrency', type=int, default=4, help='并发线程数')
+        parser.add_argument('--requests', type=int, default=200, help='每个场景的请求数')
+        parser.add_argument('--warmup', type=int, default=10, help='每个场景正式计时前的预热请求数')
+        parser.add_argument('--scenario', action='append', help='只运行名称包含该字符串的场景，可多次指定')
+        parser.add_argument('--user', help='普通用户的用户名，默认为提示词最多的普通用户（HTTP 模式默认 bench-user-1）')
+        parser.add_argument('--admin', help='管理员用户名，默认为第一个管理员（HTTP 模式默认 bench-user-0）')
+        parser.add_argument('--password', default='password', help='HTTP 模式下登录使用的密码')
+        parser.add_argument('--throttle', action='store_true', help='本进程模式下保留限流（默认关闭，避免压测被 429 拒绝）')
+        parser.add_argument('--label', default='', help='写入结果的说明文字')
+        parser.add_argument('--output', help='将结果写入该 JSON 文件')
+        parser.add_argument('--compare', help='与之前保存的 JSON 结果比较')
+
+    def handle(self, *args, **options):
+        scenarios = [
+            scenario for scenario in SCENARIOS
+            if not options['scenario'] or any(name in scenario[0] for name in options['scenario'])
+        ]
+        if not scenarios:
+            raise CommandError('No matching scenarios')
+
+        if options['url']:
+            tokens = {
+                'user': HttpTransport.login(options['url'], options['user'] or 'bench-user-1', options['password']),
+                'admin': HttpTransport.login(options['url'], options['admin'] or 'bench-user-0', options['password']),
+            }
+            transport = HttpTransport(options['url'], tokens)
+            results = self.run(transport, scenarios, options)
+        else:
+            transport = InProcessTransport(self.local_users(options))
+            overrides = {'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver']}
+            if not options['throttle']:
+                overrides['CACHES'] = {
+                    **settings.CACHES, 'throttle': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+                }
+            with override_settings(**overrides):
+                results = self.run(transport, scenarios, options)
+
+        self.report(results)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2, ensure_ascii=False)
+            self.stdout.write(f"结果已保存到 {options['output']}")
+        if options['compare']:
+            with open(options['compare']) as source:
+                self.compare(json.load(source), results)
+
+    def local_users(self, options):
+        try:
+            if options['user']:
+                user = User.objects.get(username=options['user'])
+            else:
+                user = (
+                    User.objects.filter(is_active=True).exclude(role='admin')
+                    .annotate(prompt_total=Count('prompts')).order_by('-prompt_total', 'pk').first()
+                )
+                if user is None:
+                    raise User.DoesNotExist
+            if options['admin']:
+                admin = User.objects.get(username=options['admin'])
+            else:
+                admin = User.objects.filter(is_active=True, role='admin').order_by('pk').first()
+                if admin is None:
+                    raise User.DoesNotExist
+        except User.DoesNotExist:
+            raise CommandError('Benchmark users not found; run generate_dataset first or pass --user/--admin')
+        return {'user': user, 'admin': admin}
+
+    def resolve_context(self, transport):
+        """通过 API 找到场景需要的 id：提示词、版本最多的提示词及其新旧版本、最热与最冷的标签、检索词"""
+        context = {}
+        status, _, _, body = transport.request('user', '/api/prompts/?page_size=100')
+        prompts = self.decode(body).get('results', []) if status == 200 else []
+        if prompts:
+            context['prompt'] = prompts[0]['id']
+            context['word'] = prompts[0]['title'].split()[0].lower()
+            long_prompt = max(prompts, key=lambda prompt: prompt.get('version_count') or 0)
+            context['long_prompt'] = long_prompt['id']
+            status, _, _, body = transport.request('user', f"/api/prompts/{long_prompt['id']}/versions/")
+            versions = self.decode(body).get('results', []) if status == 200 else []
+            if len(versions) > 1:
+                context['new_version'] = versions[0]['id']
+                context['old_version'] = versions[-1]['id']
+        status, _, _, body = transport.request('user', '/api/prompts/tags/')
+        tags = self.decode(body) if status == 200 else []
+        tags = [tag for tag in (tags.get('results', []) if isinstance(tags, dict) else tags) if tag.get('prompt_count')]
+        if tags:
+            context['hot_tag'] = max(tags, key=lambda tag: tag['prompt_count'])['id']
+            context['cold_tag'] = min(tags, key=lambda tag: tag['prompt_count'])['id']
+        return context
+
+    @staticmethod
+    def decode(body):
+        if hasattr(body, 'data'):
+            return body.data
+        content = body.content if hasattr(body, 'content') else body
+        return json.loads(content or b'{}')
+
+    def run(self, transport, scenarios, options):
+        context = self.resolve_context(transport)
+        results = {
+            'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'commit': self.git_commit(),
+            'label': options['label'],
+            'target': transport.name,
+            'concurrency': options['concurrency'],
+            'requests_per_scenario': options['requests'],
+            'dataset': stats.current() if isinstance(transport, InProcessTransport) else None,
+            'scenarios': {},
+        }
+        for name, template, role in scenarios:
+            try:
+                path = template.format(**context)
+            except KeyError as exc:
+                self.stdout.write(self.style.WARNING(f'{name}: skipped, dataset has no {exc.args[0]}'))
+                continue
+            for _ in range(options['warmup']):
+                transport.request(role, path)
+            results['scenarios'][name] = self.run_scenario(transport, role, path, options)
+        return results
+
+    def run_scenario(self, transport, role, path, options):
+        concurrency = max(options['concurrency'], 1)
+        shares = [options['requests'] // concurrency + (1 if i < options['requests'] % concurrency else 0)
+                  for i in range(concurrency)]
+        lock = threading.Lock()
+        latencies = []
+        queries = []
+        statuses = {}
+
+        def worker(count):
+            local_latencies, local_queries, local_statuses = [], [], {}
+            try:
+                for _ in range(count):
+                    try:
+                        status, elapsed, query_count, _ = transport.request(role, path)
+                    except (OSError, http.client.HTTPException):
+                        status, elapsed, query_count = 599, 0.0, None
+                    local_latencies.append(elapsed)
+                    local_statuses[str(status)] = local_statuses.get(str(status), 0) + 1
+                    if query_count is not None:
+                        local_queries.append(query_count)
+            finally:
+                transport.finish_thread()
+            with lock:
+                latencies.extend(local_latencies)
+                queries.extend(local_queries)
+                for status, count in local_statuses.items():
+                    statuses[status] = statuses.get(status, 0) + count
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(worker, [share for share in shares if share]))
+        wall_time = time.perf_counter() - start
+        result = summarize(latencies, statuses, queries, wall_time)
+        result['path'] = path
+        return result
+
+    @staticmethod
+    def git_commit():
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, timeout=5,
+            ).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            return None
+
+    def report(self, results):
+        self.stdout.write(
+            f"{'scenario':<22}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}{'errors':>8}"
+        )
+        for name, result in results['scenarios'].items():
+            queries = '-' if result['queries_per_request'] is None else f"{result['queries_per_request']:g}"
+            line = (
+                f"{name:<22}{result['throughput_rps']:>9}{result['p50_ms']:>10}{result['p95_ms']:>10}"
+                f"{result['p99_ms']:>10}{queries:>9}{result['errors']:>8}"
+            )
+            self.stdout.write(self.style.ERROR(line) if result['errors'] else line)
+            if result['statuses'].get('429'):
+                self.stdout.write(self.style.WARNING('    throttled (429); set performance.rateLimit to 0 for benchmarks'))
+
+    def compare(self, baseline, results):
+        self.stdout.write(f"与 {baseline.get('commit') or '?'} {baseline.get('label', '')} 比较（正值表示变慢）:")
+        for name, result in results['scenarios'].items():
+            before = baseline.get('scenarios', {}).get(name)
+            if not before:
+                continue
+            changes = []
+            for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+                if before.get(key):
+                    changes.append(f'{key[:3]} {(result[key] - before[key]) / before[key] * 100:+.1f}%')
+            if before.get('throughput_rps'):
+                changes.append(
+                    f"req/s {(result['throughput_rps'] - before['throughput_rps']) / before['throughput_rps'] * 100:+.1f}%"
+                )
+            if before.get('queries_per_request') is not None and result['queries_per_request'] is not None:
+                changes.append(f"queries {before['queries_per_request']:g} -> {result['queries_per_request']:g}")
+            self.stdout.write(f"{name:<22}" + '  '.join(changes))
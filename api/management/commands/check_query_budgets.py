@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from api.budget_checks import problems, run_cases, select_cases
+
+
+class Command(BaseCommand):
+    help = '在测试数据库中按多种数据规模请求各接口（冷路径与预热后各一次），检查视图声明的查询预算（api/budgets.py）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10,50,200', help='每个用户的提示词数，逗号分隔，依次递增')
+        parser.add_argument('--case', action='append', help='只检查名称包含该字符串的用例，可多次指定')
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        cases = select_cases(options['case'])
+        if not cases:
+            raise CommandError('No matching cases')
+
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        old_config = runner.setup_databases()
+        try:
+            with override_settings(
+                CACHES={
+                    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'budgets'},
+                    'throttle': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+                },
+                QUERY_BUDGET_MODE='off',
+            ):
+                results = run_cases(cases, sizes)
+        except AssertionError as exc:
+            raise CommandError(str(exc))
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+        failures = self.report(results, sizes)
+        if failures:
+            raise CommandError(f'{failures} case(s) over budget or scaling with data size')
+        self.stdout.write(self.style.SUCCESS('All query budgets met'))
+
+    def report(self, results, sizes):
+        """每格为 冷路径/预热后 的查询数与预热后的数据库耗时"""
+        failures = 0
+        header = f"{'case':<26}" + ''.join(f'{size:>16}' for size in sizes) + '  budget'
+        self.stdout.write(header)
+        for name, runs in results.items():
+            budget = runs[0].budget
+            cells = ''.join(
+                f'{f"{run.cold.queries}/{run.warm.queries}":>8} /{run.warm.db_time * 1000:>5.1f}ms' for run in runs
+            )
+            found = problems(runs)
+            budget_text = '-' if budget is None else f'{budget.queries}' + (f'/{budget.db_ms}ms' if budget.db_ms else '')
+            line = f'{name:<26}{cells}  {budget_text}'
+            if found:
+                failures += 1
+                self.stdout.write(self.style.ERROR(line))
+                for problem in found:
+                    self.stdout.write(self.style.ERROR(f'    {problem}'))
+            else:
+                self.stdout.write(line)
+        return failures
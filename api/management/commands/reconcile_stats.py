@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from api import stats
+
+class Command(BaseCommand):
+    help = '根据数据表全量重算管理统计计数器，并修正当天的每日汇总'
+
+    def handle(self, *args, **options):
+        changes = stats.recount()
+        for name, (recorded, actual) in changes.items():
+            self.stdout.write(self.style.WARNING(f'{name}: {recorded} -> {actual}'))
+        self.stdout.write(self.style.SUCCESS(f'校正完成! 共有 {len(changes)} 项统计与实际不符。'))
@@ -0,0 +1,271 @@
+"""进程内指标
+
+计数器与直方图保存在每个 worker 的内存中，记录一次只是几次字典与列表操作。
+worker 每隔 FLUSH_INTERVAL 秒把快照写入 METRICS_DIR 下以 pid 命名的文件，
+aggregate() 读取同一主机上所有 worker 的快照并求和，供系统状态接口与 Prometheus 导出使用。
+已退出 worker 的最终计数并入 retired 文件后继续计入总和，导出的计数器不会因 worker 退出而变小。
+多线程下并发累加可能偶尔丢失一次计数，这里不加锁。
+"""
+import bisect
+import json
+import os
+import resource
+import socket
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.files import locks
+
+FLUSH_INTERVAL = 5
+# 其他主机写入的快照无法检查进程是否存在，超过该秒数未更新视为 worker 已退出
+STALE_AFTER = 120
+RETIRED_FILE = 'retired.state'
+RETIRED_LOCK = 'retired.lock'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_metrics = {}
+_started = time.time()
+_next_flush = 0.0
+
+
+class LabeledCounter(Counter):
+    """按单个标签计数的计数器，用法与 collections.Counter 相同：counter['label'] += 1"""
+
+    def __init__(self, name, help_text, label):
+        super().__init__()
+        self.name = name
+        self.help = help_text
+        self.label = label
+
+    def snapshot(self):
+        return dict(self)
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+class Histogram:
+    """按单个标签分组的直方图，桶为累计前的各区间计数"""
+
+    def __init__(self, name, help_text, label, buckets):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def observe(self, label, value):
+        series = self._series.get(label)
+        if series is None:
+            series = self._series[label] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def snapshot(self):
+        return {label: {'buckets': list(counts), 'sum': total, 'count': count}
+                for label, (counts, total, count) in self._series.items()}
+
+
+def counter(name, help_text, label='name'):
+    """获取或注册计数器"""
+    if name not in _metrics:
+        _metrics[name] = LabeledCounter(name, help_text, label)
+    return _metrics[name]
+
+
+def histogram(name, help_text, label='name', buckets=LATENCY_BUCKETS):
+    """获取或注册直方图"""
+    if name not in _metrics:
+        _metrics[name] = Histogram(name, help_text, label, buckets)
+    return _metrics[name]
+
+
+REQUEST_LATENCY = histogram('http_request_duration_seconds', 'Request latency by URL name', label='view')
+REQUESTS = counter('http_requests_total', 'Requests by status class', label='status')
+DB_QUERIES = counter('db_queries_total', 'Database queries by URL name', label='view')
+DB_QUERY_TIME = counter('db_query_seconds_total', 'Database time by URL name', label='view')
+DB_DUPLICATE_QUERIES = counter('db_duplicate_queries_total', 'Repeated identical queries by URL name', label='view')
+CACHE_EVENTS = counter('cache_requests_total', 'Cache lookups by result', label='result')
+
+
+def process_info():
+    """当前进程的常驻内存（字节）与累计 CPU 时间（秒）"""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    rss = None
+    try:
+        with open('/proc/self/statm') as statm:
+            rss = int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # 非 Linux 平台退回到峰值内存（Linux 以 KB 计，macOS 以字节计）
+        rss = usage.ru_maxrss * 1024
+    return {
+        'pid': os.getpid(),
+        'rss_bytes': rss,
+        'cpu_seconds': usage.ru_utime + usage.ru_stime,
+        'started_at': _started,
+    }
+
+
+def snapshot():
+    return {
+        'host': socket.gethostname(),
+        'time': time.time(),
+        'process': process_info(),
+        'metrics': {name: metric.snapshot() for name, metric in _metrics.items()},
+    }
+
+
+def metrics_dir():
+    return getattr(settings, 'METRICS_DIR', None) or os.path.join(settings.CACHE_DIR, 'metrics')
+
+
+def flush(force=False):
+    """把本进程快照写入共享目录；未到间隔时不写"""
+    global _next_flush
+    now = time.monotonic()
+    if not force and now < _next_flush:
+        return
+    _next_flush = now + FLUSH_INTERVAL
+    directory = metrics_dir()
+    os.makedirs(directory, exist_ok=True)
+    # 文件名带上启动时间，pid 被复用时不会覆盖尚未并入 retired 的旧快照
+    path = os.path.join(directory, f'{os.getpid()}-{int(_started * 1000)}.json')
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as output:
+        json.dump(snapshot(), output)
+    os.replace(temporary, path)
+
+
+def aggregate():
+    """合并所有 worker 的快照与已退出 worker 的计数，返回 (合并后的指标, 存活 worker 的进程信息)"""
+    flush(force=True)
+    directory = metrics_dir()
+    now = time.time()
+    merged = {}
+    processes = []
+    exited = []
+    for filename in os.listdir(directory):
+        if not filename.endswith('.json'):
+            continue
+        path = os.path.join(directory, filename)
+        try:
+            with open(path) as source:
+                worker = json.load(source)
+            alive = _is_alive(worker, path, now)
+        except (OSError, ValueError):
+            continue
+        if not alive:
+            exited.append((path, worker))
+            continue
+        processes.append(worker['process'])
+        for name, series in worker['metrics'].items():
+            _merge(merged.setdefault(name, {}), series)
+
+    for name, series in _retire(directory, exited).items():
+        _merge(merged.setdefault(name, {}), series)
+    return merged, processes
+
+
+def _is_alive(worker, path, now):
+    if worker.get('host') != socket.gethostname():
+        return now - os.path.getmtime(path) <= STALE_AFTER
+    try:
+        os.kill(worker['process']['pid'], 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _retire(directory, exited):
+    """把已退出 worker 的快照并入 retired 文件并删除快照，返回 retired 中的累计计数"""
+    retired_path = os.path.join(directory, RETIRED_FILE)
+    with open(os.path.join(directory, RETIRED_LOCK), 'a') as lock:
+        locks.lock(lock, locks.LOCK_EX)
+        try:
+            try:
+                with open(retired_path) as source:
+                    retired = json.load(source)
+            except (OSError, ValueError):
+                retired = {}
+            changed = False
+            for path, worker in exited:
+                try:
+                    # 删除成功的进程负责并入，其他进程看到文件已不存在则跳过，不会重复计数
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                for name, series in worker['metrics'].items():
+                    _merge(retired.setdefault(name, {}), series)
+                changed = True
+            if changed:
+                temporary = f'{retired_path}.tmp'
+                with open(temporary, 'w') as output:
+                    json.dump(retired, output)
+                os.replace(temporary, retired_path)
+        finally:
+            locks.unlock(lock)
+    return retired
+
+
+def _merge(target, series):
+    for label, value in series.items():
+        if isinstance(value, dict):
+            current = target.get(label)
+            if current is None:
+                target[label] = {'buckets': list(value['buckets']), 'sum': value['sum'], 'count': value['count']}
+                continue
+            current['buckets'] = [a + b for a, b in zip(current['buckets'], value['buckets'])]
+            current['sum'] += value['sum']
+            current['count'] += value['count']
+        else:
+            target[label] = target.get(label, 0) + value
+
+
+def quantile(series, buckets, q):
+    """由直方图估算分位数（取所在桶的上界）"""
+    if not series['count']:
+        return None
+    rank = q * series['count']
+    seen = 0
+    for bound, count in zip(buckets + (float('inf'),), series['buckets']):
+        seen += count
+        if seen >= rank:
+            return bound if bound != float('inf') else buckets[-1]
+    return buckets[-1]
+
+
+def render_prometheus(merged, processes):
+    """Prometheus 文本格式（0.0.4）"""
+    lines = []
+    for name, metric in _metrics.items():
+        series = merged.get(name, {})
+        if isinstance(metric, Histogram):
+            lines += [f'# HELP {name} {metric.help}', f'# TYPE {name} histogram']
+            for label, data in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (float('inf'),), data['buckets']):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{name}_bucket{{{metric.label}="{_escape(label)}",le="{le}"}} {cumulative}')
+                lines.append(f'{name}_sum{{{metric.label}="{_escape(label)}"}} {data["sum"]}')
+                lines.append(f'{name}_count{{{metric.label}="{_escape(label)}"}} {data["count"]}')
+        else:
+            lines += [f'# HELP {name} {metric.help}', f'# TYPE {name} counter']
+            for label, value in sorted(series.items()):
+                lines.append(f'{name}{{{metric.label}="{_escape(label)}"}} {value}')
+
+    lines += ['# HELP process_resident_memory_bytes Resident memory per worker',
+              '# TYPE process_resident_memory_bytes gauge']
+    lines += [f'process_resident_memory_bytes{{pid="{p["pid"]}"}} {p["rss_bytes"]}' for p in processes]
+    lines += ['# HELP process_cpu_seconds_total CPU time per worker',
+              '# TYPE process_cpu_seconds_total counter']
+    lines += [f'process_cpu_seconds_total{{pid="{p["pid"]}"}} {p["cpu_seconds"]}' for p in processes]
+    return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,106 @@
+"""请求指标中间件
+
+记录每个请求的耗时、状态码类别、期间执行的数据库查询数、耗时与重复查询数，按 URL 名称分组。
+数据库查询由 connection.execute_wrappers 中的 record_query 计时，语句记录到当前线程的请求状态上，
+请求结束后由 api.querylog 分析，慢请求写入日志，并按 api.budgets 检查视图声明的查询预算。
+"""
+import threading
+import time
+
+from . import budgets, metrics, profiling, querylog
+
+_local = threading.local()
+
+
+class RequestState:
+    __slots__ = ('queries', 'query_time', 'statements')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        # (sql, params, 耗时, 是否 executemany)
+        self.statements = []
+
+    def duplicate_count(self):
+        """SQL 与参数完全相同的重复查询次数"""
+        distinct = {(sql, querylog.params_key(params)) for sql, params, _, _ in self.statements}
+        return len(self.statements) - len(distinct)
+
+
+def current_request():
+    """当前线程正在处理的请求状态，不在请求中时返回 None"""
+    return getattr(_local, 'request', None)
+
+
+def record_query(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        state = getattr(_local, 'request', None)
+        if state is not None:
+            elapsed = time.perf_counter() - start
+            state.queries += 1
+            state.query_time += elapsed
+            if len(state.statements) < querylog.MAX_STATEMENTS:
+                state.statements.append((sql, params, elapsed, many))
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """connection_created 信号处理函数，为每个新建的数据库连接安装计时包装"""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or 'unmatched'
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = _local.request = RequestState()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _local.request = None
+        duration = time.perf_counter() - start
+
+        view = view_name(request)
+        metrics.REQUEST_LATENCY.observe(view, duration)
+        metrics.REQUESTS[f'{response.status_code // 100}xx'] += 1
+        if state.queries:
+            metrics.DB_QUERIES[view] += state.queries
+            metrics.DB_QUERY_TIME[view] += state.query_time
+            duplicates = state.duplicate_count()
+            if duplicates:
+                metrics.DB_DUPLICATE_QUERIES[view] += duplicates
+        querylog.record_slow_request(request, response, view, duration, state)
+        metrics.flush()
+        budgets.enforce(request, view, state.queries, state.query_time)
+        return response
+
+
+class ProfilingMiddleware:
+    """携带有效 X-Profile 令牌的请求按令牌指定的方式剖析，报告编号写入 X-Profile-Id 响应头"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = request.META.get(profiling.META_HEADER)
+        if token is None:
+            return self.get_response(request)
+        modes = profiling.read_token(token, request)
+        if modes is None:
+            return self.get_response(request)
+        response, report = profiling.profile_request(request, self.get_response, modes)
+        profiling.save_report(report)
+        response[profiling.RESULT_HEADER] = report['id']
+        return response
@@ -0,0 +1,85 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:19
+
+from collections import Counter, defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def backfill_stats(apps, schema_editor):
+    """计数器按当前数据初始化；每日汇总按创建时间回填（已删除的对象无从统计）"""
+    StatCounter = apps.get_model('api', 'StatCounter')
+    DailyStat = apps.get_model('api', 'DailyStat')
+    User = apps.get_model('users', 'User')
+    Prompt = apps.get_model('prompts', 'Prompt')
+    PromptVersion = apps.get_model('prompts', 'PromptVersion')
+    Tag = apps.get_model('prompts', 'Tag')
+
+    sources = {
+        'users': User.objects.all(),
+        'prompts': Prompt.objects.all(),
+        'team_prompts': Prompt.objects.filter(sharing_mode='team'),
+        'private_prompts': Prompt.objects.exclude(sharing_mode='team'),
+        'versions': PromptVersion.objects.all(),
+        'tags': Tag.objects.all(),
+    }
+    added = defaultdict(Counter)
+    for name, queryset in sources.items():
+        rows = queryset.order_by().annotate(day=TruncDate('created_at')).values('day').annotate(count=Count('pk'))
+        for row in rows:
+            added[row['day']][name] += row['count']
+
+    totals = Counter()
+    daily = []
+    for day in sorted(added):
+        for name, count in added[day].items():
+            totals[name] += count
+            daily.append(DailyStat(date=day, name=name, added=count, value=totals[name]))
+    active_users = User.objects.filter(is_active=True).count()
+    daily.append(DailyStat(date=timezone.localdate(), name='active_users', value=active_users))
+    DailyStat.objects.bulk_create(daily, batch_size=1000, ignore_conflicts=True)
+
+    totals['active_users'] = active_users
+    StatCounter.objects.bulk_create([
+        StatCounter(name=name, value=totals[name])
+        for name in ('users', 'active_users', 'prompts', 'private_prompts', 'team_prompts', 'versions', 'tags')
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+        ('prompts', '0008_tag_updated_at'),
+        ('users', '0001_init'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('name', models.CharField(max_length=50)),
+                ('added', models.BigIntegerField(default=0)),
+                ('removed', models.BigIntegerField(default=0)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['date', 'name'],
+                'unique_together': {('date', 'name')},
+            },
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,36 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.cache import cache
+from django.utils import timezone
+from types import MappingProxyType
 import json
+import uuid
+
+SETTINGS_VERSION_KEY = 'system_settings:version'
+
+
+class SettingsSnapshot:
+    """某一版本全部设置的只读快照，值已解析"""
+
+    def __init__(self, version, settings):
+        values = {}
+        categories = {}
+        updated_at = None
+        for setting in settings:
+            value = setting.parsed_value
+            values[setting.key] = value
+            categories.setdefault(setting.category, {})[setting.key] = value
+            if updated_at is None or setting.updated_at > updated_at:
+                updated_at = setting.updated_at
+        self.version = version
+        self.values = MappingProxyType(values)
+        self.categories = MappingProxyType(
+            {category: MappingProxyType(items) for category, items in categories.items()}
+        )
+        self.updated_at = updated_at
+
+
+# 每个进程持有一份快照，设置版本号变化时重新加载
+_snapshot = None
 
 class SystemSetting(models.Model):
     """系统设置模型"""
@@ -27,32 +57,60 @@ class SystemSetting(models.Model):
         except (json.JSONDecodeError, ValueError):
             return self.value
 
+    @staticmethod
+    def serialize_value(value):
+        """序列化设置值：dict/list 保存为 JSON，其他值保存为 str()"""
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, ensure_ascii=False)
+        return str(value)
+
     def set_value(self, value):
         """设置值，自动序列化为JSON"""
-        if isinstance(value, (dict, list)):
-            self.value = json.dumps(value, ensure_ascii=False)
-        else:
-            self.value = str(value)
+        self.value = self.serialize_value(value)
         self.save()
-        # 清除缓存
-        cache.delete(f'system_setting_{self.key}')
+
+    @classmethod
+    def get_version(cls):
+        """当前设置版本号，保存在共享缓存中，任何写入后更换"""
+        version = cache.get(SETTINGS_VERSION_KEY)
+        if version is None:
+            cache.add(SETTINGS_VERSION_KEY, uuid.uuid4().hex, None)
+            version = cache.get(SETTINGS_VERSION_KEY)
+        return version
+
+    @classmethod
+    def bump_version(cls):
+        """设置变化后调用；在事务中时推迟到提交之后，所有进程随后重新加载快照"""
+        transaction.on_commit(lambda: cache.set(SETTINGS_VERSION_KEY, uuid.uuid4().hex, None))
+
+    @classmethod
+    def snapshot(cls):
+        """返回当前版本的设置快照；版本未变时不查询数据库"""
+        global _snapshot
+        version = cls.get_version()
+        if _snapshot is None or _snapshot.version != version:
+            _snapshot = SettingsSnapshot(version, cls.objects.all())
+        return _snapshot
 
     @classmethod
     def get_setting(cls, key, default=None):
         """获取设置值"""
-        cache_key = f'system_setting_{key}'
-        cached_value = cache.get(cache_key)
-        
-        if cached_value is not None:
-            return cached_value
-        
+        return cls.snapshot().values.get(key, default)
+
+    @classmethod
+    def get_bool(cls, key, default=False):
+        """获取布尔设置；值可能以 JSON 或 str(bool) 形式保存"""
+        value = cls.get_setting(key, default)
+        if isinstance(value, str):
+            return value.strip().lower() in ('true', '1', 'yes', 'on')
+        return bool(value)
+
+    @classmethod
+    def get_int(cls, key, default=0):
+        """获取整数设置，无法解析时返回默认值"""
         try:
-            setting = cls.objects.get(key=key)
-            value = setting.parsed_value
-            # 缓存1小时
-            cache.set(cache_key, value, 3600)
-            return value
-        except cls.DoesNotExist:
+            return int(float(cls.get_setting(key, default)))
+        except (TypeError, ValueError):
             return default
 
     @classmethod
@@ -61,31 +119,78 @@ class SystemSetting(models.Model):
         setting, created = cls.objects.get_or_create(
             key=key,
             defaults={
-                'value': json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else str(value),
+                'value': cls.serialize_value(value),
                 'category': category,
                 'description': description
             }
         )
         if not created:
-            setting.set_value(value)
+            setting.value = cls.serialize_value(value)
             setting.category = category
             setting.description = description
             setting.save()
         return setting
 
+    @classmethod
+    def set_many(cls, values, categories=None):
+        """在一个事务中批量写入 {key: value}，categories 为 {key: 分类}，已有设置的描述保持不变"""
+        categories = categories or {}
+        now = timezone.now()
+        with transaction.atomic():
+            existing = {
+                setting.key: setting
+                for setting in cls.objects.select_for_update().filter(key__in=list(values))
+            }
+            changed = []
+            created = []
+            for key, value in values.items():
+                category = categories.get(key, 'general')
+                setting = existing.get(key)
+                if setting is None:
+                    created.append(cls(key=key, value=cls.serialize_value(value), category=category))
+                    continue
+                setting.value = cls.serialize_value(value)
+                setting.category = category
+                # bulk_update 不会触发 auto_now
+                setting.updated_at = now
+                changed.append(setting)
+            cls.objects.bulk_update(changed, ['value', 'category', 'updated_at'])
+            cls.objects.bulk_create(created)
+            # 批量写入不发送 save 信号
+            cls.bump_version()
+
     @classmethod
     def get_category_settings(cls, category):
         """获取某个分类的所有设置"""
-        settings = cls.objects.filter(category=category)
-        return {setting.key: setting.parsed_value for setting in settings}
+        return dict(cls.snapshot().categories.get(category, {}))
 
     @classmethod
     def get_all_settings(cls):
         """获取所有设置，按分类组织"""
-        settings = cls.objects.all()
-        result = {}
-        for setting in settings:
-            if setting.category not in result:
-                result[setting.category] = {}
-            result[setting.category][setting.key] = setting.parsed_value
-        return result
+        return {category: dict(items) for category, items in cls.snapshot().categories.items()}
+
+
+class StatCounter(models.Model):
+    """管理统计计数器，由信号与批量写入增量维护，见 api.stats"""
+    name = models.CharField(max_length=50, unique=True)
+    value = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}={self.value}"
+
+
+class DailyStat(models.Model):
+    """每日汇总：当天的增加数、减少数与当天最后一次变化后的计数值"""
+    date = models.DateField()
+    name = models.CharField(max_length=50)
+    added = models.BigIntegerField(default=0)
+    removed = models.BigIntegerField(default=0)
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('date', 'name')
+        ordering = ['date', 'name']
+
+    def __str__(self):
+        return f"{self.date} {self.name}={self.value}"
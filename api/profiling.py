@@ -0,0 +1,266 @@
+"""按需性能剖析
+
+管理员通过 POST /api/admin/profiling/token/ 获取签名令牌，之后携带 X-Profile: <令牌> 请求头的请求
+会被剖析，响应头 X-Profile-Id 给出报告编号。令牌只对签发它的管理员本人有效：请求必须同时以该管理员的
+Token 认证，泄露的令牌不能被其他人（包括匿名请求）用来触发剖析。未携带请求头的请求只多一次字典查找。
+
+剖析方式（令牌中指定，默认 sample 与 memory）：
+- sample：后台线程每隔 PROFILING_SAMPLE_INTERVAL_MS 毫秒采样一次请求线程的调用栈，
+  汇总为折叠栈格式（flamegraph.pl、speedscope 可直接读取）
+- cprofile：cProfile 确定性剖析，记录每个函数的调用次数与耗时（开销较大，会放大耗时）
+- memory：tracemalloc 在请求前后各取一次快照，按代码行比较分配差异；
+  tracemalloc 作用于整个进程，同时处理的其他请求的分配也会计入
+
+报告保存在共享缓存中的环形缓冲区，最多保留 PROFILING_LOG_SIZE 份，新报告覆盖最旧的报告。
+"""
+import cProfile
+import io
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from rest_framework import exceptions
+
+from .cache import RingBuffer
+
+HEADER = 'X-Profile'
+META_HEADER = 'HTTP_X_PROFILE'
+RESULT_HEADER = 'X-Profile-Id'
+MODES = ('sample', 'cprofile', 'memory')
+DEFAULT_MODES = ('sample', 'memory')
+TOKEN_SALT = 'api.profiling'
+INDEX_PREFIX = 'profiling:index'
+REPORT_KEY = 'profiling:report:{}'
+REPORT_TIMEOUT = 7 * 24 * 3600
+TOP_COUNT = 30
+TRACEMALLOC_FRAMES = 25
+
+_memory_lock = threading.Lock()
+_memory_users = 0
+
+
+def token_max_age():
+    return getattr(settings, 'PROFILING_TOKEN_MAX_AGE', 3600)
+
+
+def sample_interval():
+    return getattr(settings, 'PROFILING_SAMPLE_INTERVAL_MS', 1) / 1000
+
+
+def log_size():
+    return getattr(settings, 'PROFILING_LOG_SIZE', 20)
+
+
+def make_token(user, modes=DEFAULT_MODES):
+    return signing.dumps({'user': user.pk, 'modes': list(modes)}, salt=TOKEN_SALT, compress=True)
+
+
+def requesting_user(request):
+    """按 Authorization: Token 解析请求用户（中间件运行时 DRF 尚未认证）；未认证时返回 None"""
+    from users.authentication import CachedTokenAuthentication
+
+    try:
+        result = CachedTokenAuthentication().authenticate(request)
+    except exceptions.AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+def read_token(value, request):
+    """校验请求头中的令牌，返回剖析方式列表
+
+    令牌无效或过期、请求未以签发令牌的管理员身份认证、或该用户已不是管理员时返回 None。
+    """
+    try:
+        payload = signing.loads(value, salt=TOKEN_SALT, max_age=token_max_age())
+    except signing.BadSignature:
+        return None
+    user = requesting_user(request)
+    if user is None or user.pk != payload.get('user') or user.role != 'admin':
+        return None
+    return [mode for mode in payload.get('modes', []) if mode in MODES] or None
+
+
+def frame_name(frame):
+    code = frame.f_code
+    module = frame.f_globals.get('__name__', '?')
+    name = getattr(code, 'co_qualname', code.co_name)
+    # 折叠栈格式以分号分隔栈帧、以空格分隔计数
+    return f'{module}.{name}'.replace(';', ':').replace(' ', '_')
+
+
+class StackSampler:
+    """定时采样目标线程的调用栈，按折叠栈计数"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiling-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                names.append(frame_name(frame))
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+def _start_tracemalloc():
+    global _memory_users
+    with _memory_lock:
+        if _memory_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            _memory_users = 1
+        elif _memory_users:
+            _memory_users += 1
+        tracemalloc.reset_peak()
+    return tracemalloc.take_snapshot()
+
+
+def _stop_tracemalloc(before):
+    global _memory_users
+    after = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    with _memory_lock:
+        if _memory_users:
+            _memory_users -= 1
+            if _memory_users == 0:
+                tracemalloc.stop()
+    # 排除 tracemalloc 自身与采样线程的分配
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+    differences = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), 'lineno')
+    return {
+        'peak_bytes': peak,
+        'traced_bytes': current,
+        'net_bytes': sum(stat.size_diff for stat in differences),
+        'top': [
+            {
+                'location': f'{stat.traceback[0].filename}:{stat.traceback[0].lineno}',
+                'size_diff': stat.size_diff,
+                'count_diff': stat.count_diff,
+                'size': stat.size,
+            }
+            for stat in differences[:TOP_COUNT]
+        ],
+    }
+
+
+def _cprofile_report(profile):
+    stream = io.StringIO()
+    stats = pstats.Stats(profile, stream=stream)
+    stats.sort_stats('cumulative').print_stats(TOP_COUNT)
+    functions = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:TOP_COUNT]
+    return {
+        'text': stream.getvalue(),
+        'functions': [
+            {
+                'function': f'{filename}:{line}({name})',
+                'calls': calls,
+                'tottime_ms': round(tottime * 1000, 3),
+                'cumtime_ms': round(cumtime * 1000, 3),
+            }
+            for (filename, line, name), (_, calls, tottime, cumtime, _) in functions
+        ],
+    }
+
+
+def profile_request(request, get_response, modes):
+    """剖析一次请求，返回 (响应, 报告)"""
+    sampler = profile = memory_before = None
+    if 'memory' in modes:
+        memory_before = _start_tracemalloc()
+    if 'sample' in modes:
+        sampler = StackSampler(threading.get_ident(), sample_interval())
+        sampler.start()
+    if 'cprofile' in modes:
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # 同一线程已有其他剖析器在运行
+            profile = None
+
+    start = time.perf_counter()
+    try:
+        response = get_response(request)
+    finally:
+        duration = time.perf_counter() - start
+        if profile is not None:
+            profile.disable()
+        if sampler is not None:
+            sampler.stop()
+        memory = _stop_tracemalloc(memory_before) if memory_before is not None else None
+
+    match = getattr(request, 'resolver_match', None)
+    report = {
+        'id': uuid.uuid4().hex,
+        'time': time.time(),
+        'method': request.method,
+        'path': request.get_full_path(),
+        'view': match.view_name if match else None,
+        'status': response.status_code,
+        'duration_ms': round(duration * 1000, 2),
+        'modes': modes,
+        'samples': sum(sampler.stacks.values()) if sampler else None,
+        'sample_interval_ms': sample_interval() * 1000 if sampler else None,
+        'collapsed': sampler.collapsed() if sampler else None,
+        'cprofile': _cprofile_report(profile) if profile is not None else None,
+        'memory': memory,
+    }
+    return response, report
+
+
+def index():
+    return RingBuffer(INDEX_PREFIX, log_size(), REPORT_TIMEOUT)
+
+
+def save_report(report):
+    """报告与摘要写入同一序号对应的位置，覆盖旧报告时不会留下孤立的键"""
+    buffer = index()
+    slot = buffer.next_slot()
+    cache.set(REPORT_KEY.format(slot % buffer.size), report, REPORT_TIMEOUT)
+    summary = {key: report[key] for key in ('id', 'time', 'method', 'path', 'view', 'status', 'duration_ms', 'modes', 'samples')}
+    buffer.put(slot, summary)
+
+
+def recent_reports():
+    """最近的报告摘要，最新的在前"""
+    return [summary for _, summary in index().entries()]
+
+
+def get_report(report_id):
+    buffer = index()
+    for slot, summary in buffer.entries():
+        if summary['id'] == report_id:
+            report = cache.get(REPORT_KEY.format(slot % buffer.size))
+            # 读取期间该位置可能已被新报告覆盖
+            return report if report is not None and report['id'] == report_id else None
+    return None
+
+
+def clear_reports():
+    buffer = index()
+    buffer.clear()
+    cache.delete_many([REPORT_KEY.format(position) for position in range(buffer.size)])
@@ -0,0 +1,168 @@
+"""请求级 SQL 记录与慢请求日志
+
+MetricsMiddleware 在每个请求期间记录执行的语句（SQL、参数、耗时）。请求结束后 analyze() 统计：
+- 完全相同（SQL 与参数都相同）的重复查询，通常可以复用结果；
+- 相同 SQL 不同参数的查询，出现多次通常是 N+1；
+- 最慢的几条语句。
+请求耗时超过 SLOW_REQUEST_THRESHOLD_MS，或任一语句超过 SLOW_QUERY_THRESHOLD_MS 时，
+为最慢的 SELECT 语句捕获执行计划（SQLite 为 EXPLAIN QUERY PLAN，PostgreSQL 为 EXPLAIN），
+写入日志并保存到共享缓存中的环形缓冲区，管理员可通过 /api/admin/slow-requests/ 查看。
+
+报告中的 SQL 参数默认只保留数字、日期等非文本值，文本参数（令牌、密码哈希、两步验证密钥等）
+替换为占位符；SLOW_REQUEST_LOG_PARAMS = True 时保留全部参数。
+"""
+import logging
+import time
+from collections import Counter
+
+import datetime
+import decimal
+import uuid
+
+from django.conf import settings
+from django.db import connection
+
+from .cache import RingBuffer
+
+logger = logging.getLogger(__name__)
+
+BUFFER_PREFIX = 'querylog:slow_requests'
+# 每个请求最多保留的语句数，超出后只计数
+MAX_STATEMENTS = 1000
+SLOWEST_COUNT = 5
+# 报告中重复/相似查询列表的最大条数
+REPORTED_QUERIES = 20
+SQL_PREVIEW_LENGTH = 2000
+REDACTED = '<redacted>'
+SAFE_PARAM_TYPES = (int, float, decimal.Decimal, datetime.date, datetime.time, datetime.timedelta, uuid.UUID)
+
+
+def slow_request_threshold():
+    return getattr(settings, 'SLOW_REQUEST_THRESHOLD_MS', 500) / 1000
+
+
+def slow_query_threshold():
+    return getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', 100) / 1000
+
+
+def buffer_size():
+    return getattr(settings, 'SLOW_REQUEST_LOG_SIZE', 50)
+
+
+def buffer():
+    return RingBuffer(BUFFER_PREFIX, buffer_size())
+
+
+def params_key(params):
+    try:
+        return repr(params)
+    except Exception:
+        return id(params)
+
+
+def preview_param(value):
+    if value is None or isinstance(value, SAFE_PARAM_TYPES) or getattr(settings, 'SLOW_REQUEST_LOG_PARAMS', False):
+        return str(value)[:200]
+    return REDACTED
+
+
+def preview_params(params):
+    if not params:
+        return None
+    if isinstance(params, dict):
+        return {key: preview_param(value) for key, value in params.items()}
+    return [preview_param(param) for param in params]
+
+
+def analyze(statements):
+    """返回 (完全重复的查询, 同 SQL 不同参数的查询, 最慢的语句)"""
+    exact = Counter((sql, params_key(params)) for sql, params, duration, many in statements)
+    by_sql = Counter(sql for sql, params, duration, many in statements)
+    duplicates = [
+        {'sql': sql[:SQL_PREVIEW_LENGTH], 'count': count}
+        for (sql, _), count in exact.most_common(REPORTED_QUERIES) if count > 1
+    ]
+    similar = [
+        {'sql': sql[:SQL_PREVIEW_LENGTH], 'count': count}
+        for sql, count in by_sql.most_common(REPORTED_QUERIES) if count > 1
+    ]
+    slowest = sorted(statements, key=lambda statement: statement[2], reverse=True)[:SLOWEST_COUNT]
+    return duplicates, similar, slowest
+
+
+def explain(sql, params, many):
+    """返回语句的执行计划文本；非 SELECT、批量执行或不支持的数据库返回 None"""
+    if many or not sql.lstrip()[:6].upper() == 'SELECT':
+        return None
+    if connection.vendor == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    elif connection.vendor == 'postgresql':
+        prefix = 'EXPLAIN '
+    else:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            rows = cursor.fetchall()
+    except Exception as exc:
+        return f'EXPLAIN failed: {exc}'
+    if connection.vendor == 'sqlite':
+        # (id, parent, notused, detail)
+        return '\n'.join(row[-1] for row in rows)
+    return '\n'.join(row[0] for row in rows)
+
+
+def build_report(request, response, view, duration, state):
+    duplicates, similar, slowest = analyze(state.statements)
+    return {
+        'time': time.time(),
+        'method': request.method,
+        'path': request.get_full_path(),
+        'view': view,
+        'status': response.status_code,
+        'user_id': getattr(getattr(request, 'user', None), 'pk', None),
+        'duration_ms': round(duration * 1000, 2),
+        'queries': state.queries,
+        'db_time_ms': round(state.query_time * 1000, 2),
+        'duplicates': duplicates,
+        'similar': similar,
+        'slowest': [
+            {
+                'sql': sql[:SQL_PREVIEW_LENGTH],
+                'params': preview_params(params) if not many else None,
+                'duration_ms': round(elapsed * 1000, 2),
+                'plan': explain(sql, params, many),
+            }
+            for sql, params, elapsed, many in slowest
+        ],
+    }
+
+
+def is_slow(duration, state):
+    if duration >= slow_request_threshold():
+        return True
+    threshold = slow_query_threshold()
+    return any(elapsed >= threshold for _, _, elapsed, _ in state.statements)
+
+
+def record_slow_request(request, response, view, duration, state):
+    """请求较慢时写入日志与环形缓冲区"""
+    if not is_slow(duration, state):
+        return None
+    report = build_report(request, response, view, duration, state)
+    logger.warning(
+        'Slow request %s %s (%s): %.1f ms, %d queries, %.1f ms in database',
+        report['method'], report['path'], view, report['duration_ms'], report['queries'], report['db_time_ms'],
+        extra={'sql_report': report},
+    )
+    buffer().append(report)
+    return report
+
+
+def recent_slow_requests():
+    """最近的慢请求，最新的在前"""
+    return [report for _, report in buffer().entries()]
+
+
+def clear_slow_requests():
+    buffer().clear()
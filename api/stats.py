@@ -0,0 +1,198 @@
+"""管理统计
+
+StatCounter 保存各项总数，由模型信号以及绕过信号的批量写入（导入、批量操作）增量维护，
+读取只需一次查询。每次变化同时累加当天 DailyStat 行的 added/removed 并记录变化后的值，
+用于趋势图；没有变化的日期沿用前一天的值。recount() 全量重算，用于校正。
+
+计数器行是所有写入共用的热点行。事务内的增量先在进程内累计，提交后一次写入，
+回滚（包括保存点回滚）的增量随提交回调一起丢弃；写入失败只记录日志，由 recount() 校正。
+不在事务中时立即写入。
+"""
+import datetime
+import functools
+import threading
+
+from django.db import transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Value, When
+from django.utils import timezone
+
+from .models import DailyStat, StatCounter
+
+METRICS = ('users', 'active_users', 'prompts', 'private_prompts', 'team_prompts', 'versions', 'tags')
+
+# (日期, 已确认存在当天汇总行的指标)
+_daily_rows = (None, set())
+
+# 每个线程（即每个数据库连接）当前事务的增量批次
+_local = threading.local()
+
+
+def sharing_metric(sharing_mode):
+    return 'team_prompts' if sharing_mode == 'team' else 'private_prompts'
+
+
+class _Batch:
+    """一个事务内的增量
+
+    每次 adjust 注册一个确认回调，保存点回滚时随之丢弃；写入回调不属于任何保存点，
+    每次 adjust 后重新排到末尾，只有最后注册的一个写入，此时本事务的确认回调都已执行。
+    """
+
+    def __init__(self):
+        self.changes = {}
+        self.registered = 0
+        self.done = False
+
+    def confirm(self, changes):
+        for name, delta in changes.items():
+            self.changes[name] = self.changes.get(name, 0) + delta
+
+    def flush(self, registration):
+        if self.done or registration != self.registered:
+            return
+        self.done = True
+        _apply({name: delta for name, delta in self.changes.items() if delta})
+
+
+def adjust(changes):
+    """按 {指标: 增量} 更新计数器与当天汇总；在事务中时累计到提交后一次写入"""
+    changes = {name: delta for name, delta in changes.items() if delta}
+    if not changes:
+        return
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        _apply(changes)
+        return
+    batch = getattr(_local, 'batch', None)
+    # 事务回滚时提交回调全部清空，旧批次不再有效
+    if batch is None or batch.done or not any(
+        getattr(func, 'batch', None) is batch for _, func, _ in connection.run_on_commit
+    ):
+        batch = _local.batch = _Batch()
+    transaction.on_commit(functools.partial(batch.confirm, changes))
+
+    batch.registered += 1
+    registration = batch.registered
+
+    def flush():
+        batch.flush(registration)
+
+    flush.batch = batch
+    # 与 on_commit 登记的格式相同，保存点为空集合，不随保存点回滚丢弃
+    connection.run_on_commit.append((set(), flush, True))
+
+
+def _apply(changes):
+    if not changes:
+        return
+    names = list(changes)
+    StatCounter.objects.filter(name__in=names).update(
+        value=F('value') + Case(*[When(name=name, then=Value(delta)) for name, delta in changes.items()]),
+        updated_at=timezone.now(),
+    )
+
+    today = timezone.localdate()
+    _ensure_daily_rows(today, names)
+    DailyStat.objects.filter(date=today, name__in=names).update(
+        added=F('added') + Case(
+            *[When(name=name, then=Value(max(delta, 0))) for name, delta in changes.items()]
+        ),
+        removed=F('removed') + Case(
+            *[When(name=name, then=Value(max(-delta, 0))) for name, delta in changes.items()]
+        ),
+        value=Subquery(StatCounter.objects.filter(name=OuterRef('name')).values('value')[:1]),
+    )
+
+
+def _ensure_daily_rows(date, names):
+    """每个进程每天每项只需建一次当天的汇总行"""
+    global _daily_rows
+    if _daily_rows[0] != date:
+        _daily_rows = (date, set())
+    missing = [name for name in names if name not in _daily_rows[1]]
+    if missing:
+        DailyStat.objects.bulk_create([DailyStat(date=date, name=name) for name in missing], ignore_conflicts=True)
+        # 事务回滚时新建的行也会撤销，提交后才记下
+        ensured = _daily_rows
+        transaction.on_commit(lambda: ensured[1].update(missing))
+
+
+def current():
+    """返回 {指标: 当前值}"""
+    values = dict.fromkeys(METRICS, 0)
+    values.update(StatCounter.objects.values_list('name', 'value'))
+    return values
+
+
+def history(days=30):
+    """最近 days 天每天结束时的各项数值，按日期升序"""
+    end = timezone.localdate()
+    start = end - datetime.timedelta(days=days - 1)
+    rows = DailyStat.objects.filter(date__gte=start, date__lte=end)
+
+    # 起始日之前最后一次变化后的值作为初始值
+    values = dict.fromkeys(METRICS, 0)
+    before = DailyStat.objects.filter(date__lt=start, name=OuterRef('name')).order_by('-date')
+    values.update(
+        DailyStat.objects.filter(date__lt=start).values('name').distinct()
+        .annotate(last=Subquery(before.values('value')[:1])).values_list('name', 'last')
+    )
+
+    by_date = {}
+    for row in rows:
+        by_date.setdefault(row.date, {})[row.name] = row
+    series = []
+    for offset in range(days):
+        date = start + datetime.timedelta(days=offset)
+        entry = {'date': date}
+        for name in METRICS:
+            row = by_date.get(date, {}).get(name)
+            if row is not None:
+                values[name] = row.value
+            entry[name] = values[name]
+            entry[f'{name}_added'] = row.added if row else 0
+            entry[f'{name}_removed'] = row.removed if row else 0
+        series.append(entry)
+    return series
+
+
+def compute():
+    """从数据表全量统计各项数值"""
+    from prompts.models import Prompt, PromptVersion, Tag
+    from users.models import User
+
+    users = User.objects.aggregate(users=Count('pk'), active_users=Count('pk', filter=Q(is_active=True)))
+    prompts = Prompt.objects.aggregate(
+        prompts=Count('pk'), team_prompts=Count('pk', filter=Q(sharing_mode='team')),
+    )
+    return {
+        **users,
+        'prompts': prompts['prompts'],
+        'team_prompts': prompts['team_prompts'],
+        'private_prompts': prompts['prompts'] - prompts['team_prompts'],
+        'versions': PromptVersion.objects.count(),
+        'tags': Tag.objects.count(),
+    }
+
+
+@transaction.atomic
+def recount():
+    """全量重算计数器并更新当天汇总的值，返回 {指标: (原值, 新值)} 中发生变化的项"""
+    actual = compute()
+    recorded = current()
+    StatCounter.objects.bulk_create(
+        [StatCounter(name=name) for name in METRICS], ignore_conflicts=True
+    )
+    now = timezone.now()
+    counters = list(StatCounter.objects.filter(name__in=METRICS))
+    for counter in counters:
+        counter.value = actual[counter.name]
+        counter.updated_at = now
+    StatCounter.objects.bulk_update(counters, ['value', 'updated_at'])
+
+    today = timezone.localdate()
+    DailyStat.objects.bulk_create(
+        [DailyStat(date=today, name=name, value=value) for name, value in actual.items()],
+        update_conflicts=True, unique_fields=['date', 'name'], update_fields=['value'],
+    )
+    return {name: (recorded[name], actual[name]) for name in METRICS if recorded[name] != actual[name]}
@@ -0,0 +1,131 @@
+"""主机状态采样
+
+读取 /proc（Linux），其他平台上相应字段返回 None。CPU 使用率与网络速率需要两次采样之差，
+上一次的采样保存在共享缓存中，因此任意 worker 响应请求都能得到相邻两次轮询之间的平均值。
+"""
+import os
+import shutil
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+SAMPLE_KEY = 'system_status:sample'
+GB = 1024 ** 3
+
+
+def _read(path):
+    try:
+        with open(path) as source:
+            return source.read()
+    except OSError:
+        return None
+
+
+def cpu_times():
+    """返回 (总时间, 空闲时间)，单位为 jiffies"""
+    stat = _read('/proc/stat')
+    if not stat:
+        return None
+    fields = [int(value) for value in stat.split('\n', 1)[0].split()[1:]]
+    # idle + iowait
+    return sum(fields), fields[3] + (fields[4] if len(fields) > 4 else 0)
+
+
+def network_bytes():
+    """返回除回环外所有网卡的 (接收字节, 发送字节)"""
+    dev = _read('/proc/net/dev')
+    if not dev:
+        return None
+    received = sent = 0
+    for line in dev.splitlines()[2:]:
+        name, _, data = line.partition(':')
+        if name.strip() == 'lo':
+            continue
+        fields = data.split()
+        received += int(fields[0])
+        sent += int(fields[8])
+    return received, sent
+
+
+def memory():
+    meminfo = _read('/proc/meminfo')
+    if not meminfo:
+        return None
+    values = {}
+    for line in meminfo.splitlines():
+        key, _, rest = line.partition(':')
+        values[key] = int(rest.split()[0]) * 1024
+    total = values.get('MemTotal', 0)
+    used = total - values.get('MemAvailable', values.get('MemFree', 0))
+    return {
+        'used': round(used / GB, 2),
+        'total': round(total / GB, 2),
+        'percentage': round(used / total * 100, 1) if total else 0,
+    }
+
+
+def disk():
+    usage = shutil.disk_usage(settings.BASE_DIR)
+    return {
+        'used': round(usage.used / GB, 2),
+        'total': round(usage.total / GB, 2),
+        'percentage': round(usage.used / usage.total * 100, 1) if usage.total else 0,
+    }
+
+
+def uptime():
+    data = _read('/proc/uptime')
+    return float(data.split()[0]) if data else None
+
+
+def process_count():
+    try:
+        return sum(1 for name in os.listdir('/proc') if name.isdigit())
+    except OSError:
+        return None
+
+
+def load_average():
+    try:
+        return [round(value, 2) for value in os.getloadavg()]
+    except OSError:
+        return None
+
+
+def rates():
+    """与上一次采样相比的 CPU 使用率（%）与网络速率（KB/s）"""
+    now = time.time()
+    sample = {'time': now, 'cpu': cpu_times(), 'network': network_bytes()}
+    previous = cache.get(SAMPLE_KEY)
+    cache.set(SAMPLE_KEY, sample, 3600)
+
+    cpu_usage = None
+    inbound = outbound = None
+    if previous and now > previous['time']:
+        elapsed = now - previous['time']
+        if sample['cpu'] and previous['cpu']:
+            total = sample['cpu'][0] - previous['cpu'][0]
+            idle = sample['cpu'][1] - previous['cpu'][1]
+            cpu_usage = round((total - idle) / total * 100, 1) if total > 0 else 0.0
+        if sample['network'] and previous['network']:
+            inbound = round((sample['network'][0] - previous['network'][0]) / elapsed / 1024, 1)
+            outbound = round((sample['network'][1] - previous['network'][1]) / elapsed / 1024, 1)
+    if cpu_usage is None:
+        # 首次采样时用 1 分钟负载近似
+        load = load_average()
+        cpu_usage = round(min(load[0] / (os.cpu_count() or 1) * 100, 100), 1) if load else None
+    return cpu_usage, inbound, outbound
+
+
+def database_ping():
+    """执行 SELECT 1 的耗时（毫秒），失败时返回 None"""
+    start = time.perf_counter()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+    except Exception:
+        return None
+    return round((time.perf_counter() - start) * 1000, 2)
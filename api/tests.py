@@ -0,0 +1,459 @@
+import datetime
+import io
+import json
+import multiprocessing
+import os
+import pickle
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from users.authentication import issue_token
+from users.models import User
+from . import budget_checks
+from . import cache as tiered
+from . import metrics, models, profiling, querylog, stats
+from .models import DailyStat, StatCounter, SystemSetting
+
+try:
+    import fakeredis
+except ImportError:  # 可选依赖：未安装时跳过 Redis 相关测试
+    fakeredis = None
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def _set_in_child(location, key, value):
+    backend = tiered.TieredCache(location, {})
+    backend.set(key, value)
+
+
+class FileTieredCacheTests(SimpleTestCase):
+    """文件 L2：读穿透、L1 上限与跨进程失效"""
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location, ignore_errors=True)
+        self.addCleanup(tiered._process_state.pop, self.location, None)
+
+    def make_cache(self, **options):
+        return tiered.TieredCache(self.location, {'OPTIONS': options})
+
+    def local(self, backend):
+        return backend._state()[0]
+
+    def test_read_through_fills_l1(self):
+        backend = self.make_cache()
+        backend.set('key', {'value': 1})
+        self.local(backend).clear()
+        self.assertFalse(self.local(backend).has_key(backend.make_key('key')))
+        self.assertEqual(backend.get('key'), {'value': 1})
+        self.assertTrue(self.local(backend).has_key(backend.make_key('key')))
+
+    def test_get_many_uses_the_same_local_keys(self):
+        backend = self.make_cache()
+        backend.set_many({'a': 1, 'b': 2})
+        self.local(backend).clear()
+        self.assertEqual(backend.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2})
+        backend.delete('a')
+        self.assertIsNone(backend.get('a'))
+        self.assertEqual(backend.get_many(['a', 'b']), {'b': 2})
+
+    def test_l1_is_bounded(self):
+        backend = self.make_cache(L1_MAX_ENTRIES=3)
+        for i in range(10):
+            backend.set(f'key-{i}', i)
+        self.assertEqual(len(self.local(backend)), 3)
+        # 被挤出 L1 的键仍可从 L2 读取
+        self.assertEqual([backend.get(f'key-{i}') for i in range(10)], list(range(10)))
+        self.assertEqual(len(self.local(backend)), 3)
+
+    def test_l1_entries_expire(self):
+        backend = self.make_cache(L1_TIMEOUT=0.05)
+        backend.set('key', 1)
+        time.sleep(0.1)
+        self.assertFalse(self.local(backend).has_key(backend.make_key('key')))
+        self.assertEqual(backend.get('key'), 1)
+
+    def test_cross_process_invalidation(self):
+        backend = self.make_cache()
+        backend.set('key', 'old')
+        self.assertEqual(backend.get('key'), 'old')
+        child = multiprocessing.get_context('fork').Process(
+            target=_set_in_child, args=(self.location, 'key', 'new')
+        )
+        child.start()
+        child.join()
+        self.assertEqual(child.exitcode, 0)
+        self.assertEqual(backend.get('key'), 'new')
+
+    def test_clear_reaches_other_processes(self):
+        backend = self.make_cache()
+        backend.set('key', 'value')
+        self.assertEqual(backend.get('key'), 'value')
+        # 模拟另一进程的广播：追加一条来自其他来源的清空记录
+        with open(backend._state()[1].path, 'ab') as log:
+            log.write(f'other\t{tiered.CLEAR_ALL}\n'.encode('utf-8'))
+        self.assertEqual(len(self.local(backend)), 0)
+
+
+@unittest.skipIf(fakeredis is None, 'fakeredis is not installed')
+class RedisTieredCacheTests(SimpleTestCase):
+    """Redis L2 与 pub/sub 失效广播，使用 fakeredis 作为本地替身服务器"""
+
+    def setUp(self):
+        self.server = fakeredis.FakeServer()
+        patcher = mock.patch('redis.Redis.from_url', side_effect=lambda url: fakeredis.FakeRedis(server=self.server))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.caches = []
+
+    def tearDown(self):
+        for backend in self.caches:
+            tiered._process_state.pop(backend.location, None)
+
+    def make_cache(self, location):
+        # 不同的 LOCATION 各有一份 L1 与订阅，用来模拟两个进程；它们连接同一个替身服务器
+        backend = tiered.TieredCache(location, {'OPTIONS': {'L2_OPTIONS': {
+            'connection_class': fakeredis.FakeConnection, 'server': self.server,
+        }}})
+        self.caches.append(backend)
+        return backend
+
+    def test_read_through_and_invalidation(self):
+        first = self.make_cache('redis://first:6379/0')
+        second = self.make_cache('redis://second:6379/0')
+        first.set('key', 'old')
+        self.assertEqual(second.get('key'), 'old')
+        local_key = second.make_key('key')
+        self.assertTrue(second._state()[0].has_key(local_key))
+
+        first.set('key', 'new')
+        self.assertTrue(wait_for(lambda: not second._state()[0].has_key(local_key)))
+        self.assertEqual(second.get('key'), 'new')
+
+    def test_subscribed_before_serving_l1(self):
+        second = self.make_cache('redis://second:6379/0')
+        second.set('key', 'old')
+        # 订阅在第一次访问时同步建立，之后的广播不会丢失
+        first = self.make_cache('redis://first:6379/0')
+        first.delete('key')
+        self.assertTrue(wait_for(lambda: second.get('key') is None))
+
+    def test_l1_disabled_while_unsubscribed(self):
+        backend = self.make_cache('redis://first:6379/0')
+        backend.set('key', 'value')
+        store, broadcast = backend._state()
+        with mock.patch.object(broadcast, 'poll', return_value=False):
+            self.assertEqual(backend.get('key'), 'value')
+            self.assertEqual(len(store), 1)
+            backend._state()
+            self.assertEqual(len(store), 0)
+
+
+def _incr_in_child(location, key, times):
+    backend = tiered.CounterFileCache(location, {})
+    for _ in range(times):
+        backend.incr(key)
+
+
+class CounterFileCacheTests(SimpleTestCase):
+    """限流计数器：incr 保留过期时间，多进程并发计数不丢失"""
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location, ignore_errors=True)
+        self.backend = tiered.CounterFileCache(self.location, {})
+
+    def expiry(self, key):
+        with open(self.backend._key_to_file(key), 'rb') as f:
+            return pickle.load(f)
+
+    def test_incr_keeps_expiry(self):
+        self.assertTrue(self.backend.add('counter', 1, 7200))
+        expiry = self.expiry('counter')
+        self.assertEqual(self.backend.incr('counter'), 2)
+        self.assertEqual(self.backend.decr('counter'), 1)
+        self.assertEqual(self.expiry('counter'), expiry)
+        self.assertEqual(self.backend.get('counter'), 1)
+
+    def test_add_does_not_overwrite(self):
+        self.assertTrue(self.backend.add('counter', 1, 60))
+        self.assertFalse(self.backend.add('counter', 5, 60))
+        self.assertEqual(self.backend.get('counter'), 1)
+
+    def test_expired_counter(self):
+        self.backend.add('counter', 1, 0.05)
+        time.sleep(0.1)
+        with self.assertRaises(ValueError):
+            self.backend.incr('counter')
+        self.assertTrue(self.backend.add('counter', 1, 60))
+
+    def test_concurrent_incr(self):
+        self.backend.add('counter', 0, 60)
+        context = multiprocessing.get_context('fork')
+        children = [
+            context.Process(target=_incr_in_child, args=(self.location, 'counter', 50)) for _ in range(4)
+        ]
+        for child in children:
+            child.start()
+        for child in children:
+            child.join()
+        self.assertEqual(self.backend.get('counter'), 200)
+
+
+class MetricsAggregateTests(SimpleTestCase):
+    """已退出 worker 的计数并入 retired 后，汇总的计数器不会变小"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        settings_override = override_settings(METRICS_DIR=self.directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def write_worker(self, pid, requests):
+        worker = metrics.snapshot()
+        worker['process']['pid'] = pid
+        worker['metrics'] = {'http_requests_total': {'2xx': requests}}
+        with open(os.path.join(self.directory, f'{pid}-1.json'), 'w') as output:
+            json.dump(worker, output)
+
+    def test_exited_workers_stay_counted(self):
+        # 一个不存在的 pid 代表已退出的 worker
+        child = multiprocessing.get_context('fork').Process(target=time.sleep, args=(0,))
+        child.start()
+        child.join()
+        self.write_worker(child.pid, 100)
+
+        before, processes = metrics.aggregate()
+        self.assertNotIn(child.pid, [process['pid'] for process in processes])
+        self.assertFalse(os.path.exists(os.path.join(self.directory, f'{child.pid}-1.json')))
+        after, _ = metrics.aggregate()
+        self.assertGreaterEqual(before['http_requests_total']['2xx'], 100)
+        self.assertEqual(after['http_requests_total']['2xx'], before['http_requests_total']['2xx'])
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'api-settings-tests'},
+})
+class SettingsSnapshotTests(TestCase):
+    """设置快照：set_many 提交后更换共享版本号，各进程持有的旧快照在下次读取时重新加载"""
+
+    def test_set_many_reloads_stale_snapshots(self):
+        SystemSetting.set_many({'cacheTimeout': 60}, {'cacheTimeout': 'performance'})
+        stale = SystemSetting.snapshot()
+        # 其他进程的写入只更换共享版本号，本进程的快照对象保持不变，与其他 worker 的处境相同
+        with self.captureOnCommitCallbacks(execute=True):
+            SystemSetting.set_many({'cacheTimeout': 120, 'cacheEnabled': False}, {'cacheTimeout': 'performance'})
+        self.assertIs(models._snapshot, stale)
+        self.assertNotEqual(SystemSetting.get_version(), stale.version)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(SystemSetting.get_int('cacheTimeout'), 120)
+        self.assertFalse(SystemSetting.get_bool('cacheEnabled', True))
+        with self.assertNumQueries(0):
+            self.assertEqual(SystemSetting.get_category_settings('performance')['cacheTimeout'], 120)
+
+    def test_rolled_back_write_keeps_version(self):
+        version = SystemSetting.snapshot().version
+        with self.assertRaises(RuntimeError), self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                SystemSetting.set_many({'cacheTimeout': 5})
+                raise RuntimeError
+        self.assertEqual(SystemSetting.get_version(), version)
+        self.assertIsNone(SystemSetting.get_setting('cacheTimeout'))
+
+
+class StatsTests(TestCase):
+    """管理统计：事务内的增量提交后一次写入，历史沿用前一天的值，校正命令全量重算"""
+
+    def setUp(self):
+        # 已确认存在的当天汇总行记在进程内，其他测试回滚后这些行已不存在
+        patcher = mock.patch.object(stats, '_daily_rows', (None, set()))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        stats.recount()
+
+    def test_adjust_applies_once_on_commit(self):
+        before = stats.current()
+        with self.captureOnCommitCallbacks() as callbacks:
+            stats.adjust({'prompts': 1, 'team_prompts': 1})
+            with transaction.atomic():
+                stats.adjust({'prompts': 1, 'private_prompts': 1, 'versions': 0})
+            stats.adjust({'team_prompts': -1, 'private_prompts': 1})
+        self.assertEqual(stats.current(), before)
+        with self.assertNumQueries(3):
+            for callback in callbacks:
+                callback()
+
+        after = stats.current()
+        self.assertEqual(after['prompts'], before['prompts'] + 2)
+        self.assertEqual(after['private_prompts'], before['private_prompts'] + 2)
+        self.assertEqual(after['team_prompts'], before['team_prompts'])
+        today = DailyStat.objects.get(date=timezone.localdate(), name='prompts')
+        self.assertEqual((today.added, today.removed, today.value), (2, 0, after['prompts']))
+        self.assertFalse(DailyStat.objects.filter(date=timezone.localdate(), name='team_prompts', added__gt=0).exists())
+
+    def test_rolled_back_savepoint_is_discarded(self):
+        before = stats.current()
+        with self.captureOnCommitCallbacks(execute=True):
+            stats.adjust({'tags': 1})
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                stats.adjust({'tags': 10})
+                raise RuntimeError
+        self.assertEqual(stats.current()['tags'], before['tags'] + 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                stats.adjust({'tags': 10})
+                raise RuntimeError
+            stats.adjust({'tags': 1})
+        self.assertEqual(stats.current()['tags'], before['tags'] + 2)
+
+    def test_history_carries_values_forward(self):
+        today = timezone.localdate()
+        DailyStat.objects.bulk_create([
+            DailyStat(date=today - datetime.timedelta(days=5), name='tags', value=3),
+            DailyStat(date=today - datetime.timedelta(days=1), name='tags', added=2, removed=1, value=4),
+        ])
+        series = stats.history(3)
+        self.assertEqual([entry['date'] for entry in series], [today - datetime.timedelta(days=n) for n in (2, 1, 0)])
+        self.assertEqual([entry['tags'] for entry in series[:2]], [3, 4])
+        self.assertEqual((series[0]['tags_added'], series[1]['tags_added'], series[1]['tags_removed']), (0, 2, 1))
+
+    def test_reconcile_command_fixes_drift(self):
+        StatCounter.objects.filter(name='users').update(value=42)
+        output = io.StringIO()
+        call_command('reconcile_stats', stdout=output)
+        self.assertIn('users: 42 -> ', output.getvalue())
+        self.assertEqual(stats.current(), stats.compute())
+        self.assertEqual(
+            DailyStat.objects.get(date=timezone.localdate(), name='users').value, stats.compute()['users']
+        )
+
+
+@override_settings(
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'api-querylog-tests'},
+        'throttle': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+    },
+    QUERY_BUDGET_MODE='off', SLOW_REQUEST_THRESHOLD_MS=0, SLOW_REQUEST_LOG_SIZE=3,
+)
+class SlowRequestLogTests(TestCase):
+    """慢请求日志：文本参数默认脱敏，环形缓冲区只保留最近的若干条"""
+
+    def setUp(self):
+        querylog.clear_slow_requests()
+        self.admin = User.objects.create_user('querylog-admin', password='x', role='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def logged_params(self):
+        with self.assertLogs('api.querylog', 'WARNING'):
+            self.assertEqual(self.client.get('/api/users/admin/users/?search=needle').status_code, 200)
+        report = querylog.recent_slow_requests()[0]
+        self.assertEqual(report['path'], '/api/users/admin/users/?search=needle')
+        return [param for statement in report['slowest'] for param in statement['params'] or ()]
+
+    def test_text_params_are_redacted(self):
+        params = self.logged_params()
+        self.assertIn(querylog.REDACTED, params)
+        self.assertFalse(any('needle' in param for param in params))
+
+    @override_settings(SLOW_REQUEST_LOG_PARAMS=True)
+    def test_params_kept_when_enabled(self):
+        params = self.logged_params()
+        self.assertIn('%needle%', params)
+        self.assertNotIn(querylog.REDACTED, params)
+
+    def test_buffer_keeps_latest_entries(self):
+        with self.assertLogs('api.querylog', 'WARNING'):
+            for page in range(1, 6):
+                self.client.get(f'/api/users/admin/users/?page={page}')
+        reports = querylog.recent_slow_requests()
+        self.assertEqual(len(reports), 3)
+        self.assertEqual(
+            [report['path'] for report in reports], [f'/api/users/admin/users/?page={page}' for page in (5, 4, 3)]
+        )
+
+
+@override_settings(
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'api-budget-tests'},
+        'throttle': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+    },
+    QUERY_BUDGET_MODE='off',
+)
+class QueryBudgetTests(TransactionTestCase):
+    """各接口的冷路径与预热后查询数不超出预算，也不随数据规模增长；事务真实提交，提交回调中的查询也计入
+
+    数据库耗时受运行环境影响，只由 check_query_budgets 检查。
+    """
+
+    def test_budgets_hold_as_data_grows(self):
+        results = budget_checks.run_cases(budget_checks.CASES, [10, 50])
+        for name, runs in results.items():
+            with self.subTest(name):
+                self.assertEqual(budget_checks.problems(runs, check_time=False), [])
+
+
+@override_settings(
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'api-profiling-tests'},
+        'throttle': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+    },
+    QUERY_BUDGET_MODE='off', PROFILING_LOG_SIZE=2,
+)
+class ProfilingTests(TestCase):
+    """按需剖析：令牌只对签发它的管理员有效，报告数不超过 PROFILING_LOG_SIZE"""
+
+    def setUp(self):
+        profiling.clear_reports()
+        self.admin = self.client_for(User.objects.create_user('profiling-admin', password='x', role='admin'))
+        self.other_admin = self.client_for(User.objects.create_user('profiling-other', password='x', role='admin'))
+        response = self.admin.post('/api/admin/profiling/token/', {'modes': ['sample']}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.token = response.data['token']
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {issue_token(user).key}')
+        return client
+
+    def profiled(self, client):
+        response = client.get('/api/users/profile/', HTTP_X_PROFILE=self.token)
+        return response.get(profiling.RESULT_HEADER)
+
+    def test_token_bound_to_issuer(self):
+        self.assertIsNotNone(self.profiled(self.admin))
+        self.assertIsNone(self.profiled(self.other_admin))
+        self.assertIsNone(self.profiled(APIClient()))
+        self.assertEqual(len(profiling.recent_reports()), 1)
+
+    def test_expired_token_rejected(self):
+        expired = time.time() + profiling.token_max_age() + 1
+        with mock.patch('django.core.signing.time.time', return_value=expired):
+            self.assertIsNone(self.profiled(self.admin))
+        self.assertEqual(profiling.recent_reports(), [])
+
+    def test_log_size_caps_reports(self):
+        report_ids = [self.profiled(self.admin) for _ in range(3)]
+        self.assertEqual([summary['id'] for summary in profiling.recent_reports()], report_ids[:0:-1])
+        self.assertIsNone(profiling.get_report(report_ids[0]))
+        self.assertEqual(profiling.get_report(report_ids[-1])['id'], report_ids[-1])
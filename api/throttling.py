@@ -0,0 +1,147 @@
+"""请求限流
+
+滑动窗口计数：每个窗口一个计数器，请求数估算为
+    上一窗口计数 × 上一窗口仍在滑动范围内的比例 + 当前窗口计数。
+每个请求只对当前窗口计数器做一次 incr；上一窗口已经结束，其计数在每个进程中只读取一次。
+计数器保存在 'throttle' 缓存中（共享后端，不经过 L1 与失效广播）。
+
+- UserRateThrottle / AnonRateThrottle：按用户 / IP 限制，速率为系统设置 performance.rateLimit（次/小时，0 表示不限）
+- AuthRateThrottle：登录、注册、密码重置等接口按 IP 限制，速率为 settings.AUTH_THROTTLE_RATE
+- TwoFactorRateThrottle：两步验证按目标用户限制，防止分布式猜测验证码
+
+被拒绝时返回 429，Retry-After 为估算的等待秒数。
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+from .models import SystemSetting
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+MAX_REMEMBERED_WINDOWS = 10000
+
+# 已结束窗口的计数：{缓存键: 计数}
+_finished_windows = {}
+
+
+def parse_rate(rate):
+    """'10/min' -> (10, 60)；空值返回 None"""
+    if not rate:
+        return None
+    num, period = rate.split('/')
+    return int(num), PERIODS[period.strip()[0]]
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    scope = None
+
+    def get_rate(self):
+        """返回 (次数, 窗口秒数)，None 表示不限流"""
+        raise NotImplementedError
+
+    def get_ident_key(self, request, view):
+        """返回限流对象的标识，None 表示本限流器不适用"""
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        self.retry_after = None
+        rate = self.get_rate()
+        if rate is None:
+            return True
+        ident = self.get_ident_key(request, view)
+        if ident is None:
+            return True
+
+        num, duration = rate
+        now = time.time()
+        window = int(now // duration)
+        elapsed = now - window * duration
+        key = f'{self.scope}:{ident}:{duration}:{window}'
+        current = self._incr(key, duration)
+        previous = self._finished_count(f'{self.scope}:{ident}:{duration}:{window - 1}')
+
+        remaining = (duration - elapsed) / duration
+        if previous * remaining + current <= num:
+            return True
+
+        # 被拒绝的请求不计数，遵守 Retry-After 的客户端不会被额外惩罚
+        self._decr(key)
+        current -= 1
+        if current >= num or not previous:
+            self.retry_after = duration - elapsed
+        else:
+            # 上一窗口的权重随时间线性下降，求估算值回到限额以内的时刻
+            self.retry_after = max(duration * (1 - (num - current) / previous) - elapsed, 1)
+        return False
+
+    def wait(self):
+        return self.retry_after
+
+    @property
+    def cache(self):
+        return caches['throttle']
+
+    def _incr(self, key, duration):
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # 窗口内的第一个请求；计数器需保留到下一窗口结束
+            if self.cache.add(key, 1, duration * 2):
+                return 1
+            return self.cache.incr(key)
+
+    def _decr(self, key):
+        try:
+            self.cache.decr(key)
+        except ValueError:
+            pass
+
+    def _finished_count(self, key):
+        count = _finished_windows.get(key)
+        if count is None:
+            if len(_finished_windows) >= MAX_REMEMBERED_WINDOWS:
+                _finished_windows.clear()
+            count = _finished_windows[key] = self.cache.get(key, 0)
+        return count
+
+
+class UserRateThrottle(SlidingWindowThrottle):
+    scope = 'user'
+
+    def get_rate(self):
+        limit = SystemSetting.get_int('rateLimit', 1000)
+        return (limit, PERIODS['h']) if limit > 0 else None
+
+    def get_ident_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return None
+
+
+class AnonRateThrottle(UserRateThrottle):
+    scope = 'anon'
+
+    def get_ident_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return None
+        return self.get_ident(request)
+
+
+class AuthRateThrottle(SlidingWindowThrottle):
+    scope = 'auth'
+
+    def get_rate(self):
+        return parse_rate(getattr(settings, 'AUTH_THROTTLE_RATE', '10/min'))
+
+    def get_ident_key(self, request, view):
+        return self.get_ident(request)
+
+
+class TwoFactorRateThrottle(AuthRateThrottle):
+    scope = 'two_factor'
+
+    def get_ident_key(self, request, view):
+        user_id = request.data.get('user_id') if hasattr(request.data, 'get') else None
+        return str(user_id) if user_id else None
@@ -6,4 +6,11 @@ urlpatterns = [
     path('prompts/', include('prompts.urls')),
     path('admin/settings/', views.system_settings, name='system_settings'),
     path('admin/settings/<str:category>/', views.system_settings_category, name='system_settings_category'),
+    path('admin/system-status/', views.system_status, name='system_status'),
+    path('admin/metrics/', views.metrics_export, name='metrics'),
+    path('admin/slow-requests/', views.slow_requests, name='slow_requests'),
+    path('admin/profiling/', views.profiling_reports, name='profiling_reports'),
+    path('admin/profiling/token/', views.profiling_token, name='profiling_token'),
+    path('admin/profiling/<str:report_id>/', views.profiling_report, name='profiling_report'),
+    path('admin/profiling/<str:report_id>/collapsed/', views.profiling_collapsed, name='profiling_collapsed'),
 ]
\ No newline at end of file
@@ -1,8 +1,16 @@
+import os
+import time
+
+from django.conf import settings as django_settings
+from django.http import HttpResponse
 from rest_framework import status, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from users.views import IsAdmin
+from . import metrics, profiling, querylog, system_status as host
+from .budgets import query_budget
+from .conditional import conditional, make_etag
 from .models import SystemSetting
 from .serializers import SystemSettingSerializer, SystemSettingsUpdateSerializer
 import json
@@ -14,8 +22,15 @@ class IsAdminOrReadOnly(permissions.BasePermission):
             return True
         return request.user.is_authenticated and request.user.role == 'admin'
 
+def settings_validators(request, *args, **kwargs):
+    # 设置版本号随任何写入更换，校验值无需查询数据库
+    snapshot = SystemSetting.snapshot()
+    return make_etag('settings', snapshot.version), snapshot.updated_at
+
+@query_budget(queries=2, methods=['GET'])
 @api_view(['GET', 'PUT'])
 @permission_classes([IsAdmin])
+@conditional(settings_validators)
 def system_settings(request):
     """获取或更新系统设置"""
     if request.method == 'GET':
@@ -36,11 +51,10 @@ def system_settings(request):
         if not isinstance(settings_data, dict):
             return Response({'error': 'Settings must be a dictionary'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # 更新设置
-        for key, value in settings_data.items():
-            # 根据键名确定分类
-            category = determine_category(key)
-            SystemSetting.set_setting(key, value, category=category)
+        # 在一个事务中批量更新，分类根据键名确定
+        SystemSetting.set_many(
+            settings_data, categories={key: determine_category(key) for key in settings_data}
+        )
         
         # 返回更新后的设置
         updated_settings = SystemSetting.get_all_settings()
@@ -53,6 +67,137 @@ def system_settings_category(request, category):
     settings = SystemSetting.get_category_settings(category)
     return Response(settings)
 
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def system_status(request):
+    """主机、worker 进程、数据库与请求指标的实时状态"""
+    merged, processes = metrics.aggregate()
+    cpu_usage, inbound, outbound = host.rates()
+    now = time.time()
+
+    latency = merged.get(metrics.REQUEST_LATENCY.name, {})
+    db_queries = merged.get(metrics.DB_QUERIES.name, {})
+    db_time = merged.get(metrics.DB_QUERY_TIME.name, {})
+    db_duplicates = merged.get(metrics.DB_DUPLICATE_QUERIES.name, {})
+    buckets = metrics.REQUEST_LATENCY.buckets
+    endpoints = []
+    for view, series in latency.items():
+        count = series['count']
+        endpoints.append({
+            'view': view,
+            'count': count,
+            'avg_ms': round(series['sum'] / count * 1000, 2) if count else None,
+            'p95_ms': round(metrics.quantile(series, buckets, 0.95) * 1000, 2) if count else None,
+            'db_queries_avg': round(db_queries.get(view, 0) / count, 2) if count else 0,
+            'db_time_avg_ms': round(db_time.get(view, 0) / count * 1000, 2) if count else 0,
+            'db_duplicates_avg': round(db_duplicates.get(view, 0) / count, 2) if count else 0,
+        })
+    endpoints.sort(key=lambda entry: entry['count'], reverse=True)
+
+    cache_events = merged.get(metrics.CACHE_EVENTS.name, {})
+    lookups = sum(cache_events.values())
+    hits = cache_events.get('l1_hit', 0) + cache_events.get('l2_hit', 0)
+
+    return Response({
+        'timestamp': now,
+        'cpu': {'usage': cpu_usage, 'cores': os.cpu_count()},
+        'memory': host.memory(),
+        'disk': host.disk(),
+        'network': {'inbound': inbound, 'outbound': outbound},
+        'uptime': host.uptime(),
+        'processes': host.process_count(),
+        'loadAverage': host.load_average(),
+        'workers': [
+            {
+                'pid': process['pid'],
+                'memory': process['rss_bytes'],
+                'cpuSeconds': round(process['cpu_seconds'], 2),
+                'uptime': round(now - process['started_at']),
+            }
+            for process in sorted(processes, key=lambda process: process['pid'])
+        ],
+        'database': {'latency_ms': host.database_ping()},
+        'requests': {
+            'total': sum(merged.get(metrics.REQUESTS.name, {}).values()),
+            'byStatus': merged.get(metrics.REQUESTS.name, {}),
+            'endpoints': endpoints,
+        },
+        'cache': {
+            **cache_events,
+            'hit_ratio': round(hits / lookups, 4) if lookups else None,
+            'prompts': merged.get('prompt_cache_events_total', {}),
+        },
+    })
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAdmin])
+def slow_requests(request):
+    """最近的慢请求及其 SQL 分析；DELETE 清空"""
+    if request.method == 'DELETE':
+        querylog.clear_slow_requests()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    return Response({
+        'threshold_ms': getattr(django_settings, 'SLOW_REQUEST_THRESHOLD_MS', 500),
+        'query_threshold_ms': getattr(django_settings, 'SLOW_QUERY_THRESHOLD_MS', 100),
+        'results': querylog.recent_slow_requests(),
+    })
+
+@api_view(['POST'])
+@permission_classes([IsAdmin])
+def profiling_token(request):
+    """签发剖析令牌，请求携带 X-Profile: <令牌> 即被剖析"""
+    modes = request.data.get('modes') or list(profiling.DEFAULT_MODES)
+    if not isinstance(modes, list) or not modes or any(mode not in profiling.MODES for mode in modes):
+        return Response(
+            {'error': f"modes must be a list containing {', '.join(profiling.MODES)}"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    return Response({
+        'token': profiling.make_token(request.user, modes),
+        'header': profiling.HEADER,
+        'modes': modes,
+        'expires_in': profiling.token_max_age(),
+    }, status=status.HTTP_201_CREATED)
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAdmin])
+def profiling_reports(request):
+    """最近的剖析报告摘要；DELETE 清空"""
+    if request.method == 'DELETE':
+        profiling.clear_reports()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    return Response({'results': profiling.recent_reports()})
+
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def profiling_report(request, report_id):
+    """剖析报告详情"""
+    report = profiling.get_report(report_id)
+    if report is None:
+        return Response({'error': 'Report not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(report)
+
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def profiling_collapsed(request, report_id):
+    """下载折叠栈文本，可直接用于 flamegraph.pl 或 speedscope"""
+    report = profiling.get_report(report_id)
+    if report is None or not report['collapsed']:
+        return Response({'error': 'Report not found or has no stack samples'}, status=status.HTTP_404_NOT_FOUND)
+    response = HttpResponse(report['collapsed'], content_type='text/plain; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="profile-{report_id}.collapsed"'
+    return response
+
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def metrics_export(request):
+    """Prometheus 文本格式的指标导出"""
+    merged, processes = metrics.aggregate()
+    return HttpResponse(
+        metrics.render_prometheus(merged, processes),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
 def get_default_settings():
     """获取默认设置"""
     return {
@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { useTranslation } from 'react-i18next';
+import { useSelector } from 'react-redux';
 import {
   Box,
   Typography,
@@ -31,17 +32,25 @@ import {
 } from '@mui/icons-material';
 import { motion } from 'framer-motion';
 
+const emptyStatus = {
+  cpu: { usage: 0, cores: 0 },
+  memory: { used: 0, total: 0, percentage: 0 },
+  disk: { used: 0, total: 0, percentage: 0 },
+  network: { inbound: 0, outbound: 0 },
+  uptime: 0,
+  processes: 0,
+  loadAverage: [0, 0, 0],
+  workers: [],
+  database: { latency_ms: null },
+  requests: { total: 0, endpoints: [] },
+  cache: { hit_ratio: null },
+};
+
 function SystemMonitor() {
   const { t } = useTranslation();
-  const [systemStatus, setSystemStatus] = useState({
-    cpu: { usage: 0, cores: 0 },
-    memory: { used: 0, total: 0, percentage: 0 },
-    disk: { used: 0, total: 0, percentage: 0 },
-    network: { inbound: 0, outbound: 0 },
-    uptime: 0,
-    processes: 0,
-    loadAverage: [0, 0, 0],
-  });
+  const { token } = useSelector((state) => state.auth);
+  const [systemStatus, setSystemStatus] = useState(emptyStatus);
+  const [error, setError] = useState(null);
   
   const [recentLogs, setRecentLogs] = useState([
     { timestamp: '2024-08-04 10:30:15', level: 'INFO', message: 'User login successful' },
@@ -62,40 +71,40 @@ function SystemMonitor() {
   const fetchSystemStatus = async () => {
     try {
       setLoading(true);
-      // 这里应该调用真实的API
-      // const response = await fetch('/api/admin/system-status/', {
-      //   headers: {
-      //     'Authorization': `Bearer ${token}`,
-      //   },
-      // });
-      // const data = await response.json();
-      
-      // 模拟数据
-      setTimeout(() => {
-        setSystemStatus({
-          cpu: { usage: Math.random() * 100, cores: 8 },
-          memory: { 
-            used: 4.2, 
-            total: 16, 
-            percentage: (4.2 / 16) * 100 
-          },
-          disk: { 
-            used: 45.6, 
-            total: 120, 
-            percentage: (45.6 / 120) * 100 
-          },
-          network: { 
-            inbound: Math.random() * 1000, 
-            outbound: Math.random() * 500 
-          },
-          uptime: 172800, // 2 days in seconds
-          processes: 156,
-          loadAverage: [0.8, 1.2, 1.5],
-        });
-        setLoading(false);
-      }, 1000);
+      setError(null);
+
+      const API_BASE_URL = process.env.REACT_APP_API_URL || 'http://localhost:8000/api';
+      const response = await fetch(`${API_BASE_URL}/admin/system-status/`, {
+        headers: {
+          'Authorization': `Token ${token}`,
+          'Content-Type': 'application/json',
+        },
+      });
+
+      if (!response.ok) {
+        throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+      }
+
+      const data = await response.json();
+
+      // 非 Linux 主机或首次采样时部分字段为 null，按 0 显示
+      setSystemStatus({
+        ...emptyStatus,
+        ...data,
+        cpu: { usage: data.cpu?.usage ?? 0, cores: data.cpu?.cores ?? 0 },
+        memory: data.memory || emptyStatus.memory,
+        network: {
+          inbound: data.network?.inbound ?? 0,
+          outbound: data.network?.outbound ?? 0,
+        },
+        uptime: data.uptime ?? 0,
+        processes: data.processes ?? 0,
+        loadAverage: data.loadAverage || emptyStatus.loadAverage,
+      });
     } catch (error) {
       console.error('Failed to fetch system status:', error);
+      setError(error.message);
+    } finally {
       setLoading(false);
     }
   };
@@ -168,6 +177,21 @@ function SystemMonitor() {
     },
   ];
 
+  const systemInfo = [
+    { label: t('admin.monitor.systemInfo.uptime'), value: formatUptime(systemStatus.uptime) },
+    { label: t('admin.monitor.systemInfo.processes'), value: systemStatus.processes },
+    { label: t('admin.monitor.systemInfo.loadAverage'), value: systemStatus.loadAverage.join(' / ') },
+    { label: t('admin.monitor.systemInfo.workers'), value: systemStatus.workers.length },
+    {
+      label: t('admin.monitor.systemInfo.dbLatency'),
+      value: systemStatus.database.latency_ms == null ? '-' : `${systemStatus.database.latency_ms} ms`,
+    },
+    {
+      label: t('admin.monitor.systemInfo.cacheHitRatio'),
+      value: systemStatus.cache.hit_ratio == null ? '-' : `${(systemStatus.cache.hit_ratio * 100).toFixed(1)}%`,
+    },
+  ];
+
   return (
     <Box>
       <Box sx={{ display: 'flex', justifyContent: 'space-between', alignItems: 'center', mb: 3 }}>
@@ -181,6 +205,12 @@ function SystemMonitor() {
         </Tooltip>
       </Box>
 
+      {error && (
+        <Alert severity="error" sx={{ mb: 3 }}>
+          {error}
+        </Alert>
+      )}
+
       {/* 系统状态卡片 */}
       <Grid container spacing={3} sx={{ mb: 4 }}>
         {systemCards.map((card, index) => (
@@ -222,6 +252,70 @@ function SystemMonitor() {
       </Grid>
 
       <Grid container spacing={3}>
+        {/* 系统信息 */}
+        <Grid item xs={12} md={4}>
+          <Card sx={{ height: '100%', borderRadius: 2 }}>
+            <CardContent>
+              <Typography variant="h6" sx={{ mb: 2, fontWeight: 600 }}>
+                {t('admin.monitor.systemInfo.title')}
+              </Typography>
+              <Table size="small">
+                <TableBody>
+                  {systemInfo.map((item) => (
+                    <TableRow key={item.label}>
+                      <TableCell>{item.label}</TableCell>
+                      <TableCell align="right">{item.value}</TableCell>
+                    </TableRow>
+                  ))}
+                </TableBody>
+              </Table>
+            </CardContent>
+          </Card>
+        </Grid>
+
+        {/* 接口性能 */}
+        <Grid item xs={12} md={8}>
+          <Card sx={{ height: '100%', borderRadius: 2 }}>
+            <CardContent>
+              <Typography variant="h6" sx={{ mb: 2, fontWeight: 600 }}>
+                {t('admin.monitor.endpoints.title')}
+              </Typography>
+              <TableContainer component={Paper} variant="outlined">
+                <Table size="small">
+                  <TableHead>
+                    <TableRow>
+                      <TableCell>{t('admin.monitor.endpoints.view')}</TableCell>
+                      <TableCell align="right">{t('admin.monitor.endpoints.count')}</TableCell>
+                      <TableCell align="right">{t('admin.monitor.endpoints.avg')}</TableCell>
+                      <TableCell align="right">{t('admin.monitor.endpoints.p95')}</TableCell>
+                      <TableCell align="right">{t('admin.monitor.endpoints.queries')}</TableCell>
+                    </TableRow>
+                  </TableHead>
+                  <TableBody>
+                    {systemStatus.requests.endpoints.slice(0, 10).map((endpoint) => (
+                      <TableRow key={endpoint.view}>
+                        <TableCell sx={{ fontFamily: 'monospace', fontSize: '0.875rem' }}>
+                          {endpoint.view}
+                        </TableCell>
+                        <TableCell align="right">{endpoint.count}</TableCell>
+                        <TableCell align="right">{endpoint.avg_ms}</TableCell>
+                        <TableCell align="right">
+                          <Chip
+                            label={endpoint.p95_ms}
+                            color={getStatusColor(endpoint.p95_ms, { warning: 250, critical: 1000 })}
+                            size="small"
+                          />
+                        </TableCell>
+                        <TableCell align="right">{endpoint.db_queries_avg}</TableCell>
+                      </TableRow>
+                    ))}
+                  </TableBody>
+                </Table>
+              </TableContainer>
+            </CardContent>
+          </Card>
+        </Grid>
+
         {/* 日志 */}
         <Grid item xs={12}>
           <Card sx={{ borderRadius: 2 }}>
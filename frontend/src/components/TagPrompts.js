@@ -37,7 +37,9 @@ function TagPrompts() {
   const { t } = useTranslation();
   const [tag, setTag] = useState(null);
   const [prompts, setPrompts] = useState([]);
+  const [nextUrl, setNextUrl] = useState(null);
   const [isLoading, setIsLoading] = useState(true);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
   const [error, setError] = useState(null);
 
   useEffect(() => {
@@ -56,6 +58,7 @@ function TagPrompts() {
       
       setTag(response.data.tag);
       setPrompts(response.data.prompts);
+      setNextUrl(response.data.next);
     } catch (err) {
       console.error('Failed to fetch tag prompts:', err);
       setError('Failed to load prompts for this tag');
@@ -64,6 +67,23 @@ function TagPrompts() {
     }
   };
 
+  // 加载下一页
+  const loadMore = async () => {
+    try {
+      setIsLoadingMore(true);
+      const token = localStorage.getItem('token');
+      const response = await axios.get(nextUrl, {
+        headers: { Authorization: `Token ${token}` }
+      });
+      setPrompts((current) => [...current, ...response.data.prompts]);
+      setNextUrl(response.data.next);
+    } catch (err) {
+      console.error('Failed to fetch tag prompts:', err);
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+
   const handleCopy = async (content) => {
     try {
       await navigator.clipboard.writeText(content);
@@ -155,7 +175,7 @@ function TagPrompts() {
             </Typography>
             {tag && (
               <Chip
-                label={`${prompts.length} ${prompts.length === 1 ? 'prompt' : 'prompts'}`}
+                label={`${tag.prompt_count} ${tag.prompt_count === 1 ? 'prompt' : 'prompts'}`}
                 sx={{ 
                   backgroundColor: tag.color + '20',
                   color: tag.color,
@@ -396,6 +416,14 @@ function TagPrompts() {
           </AnimatePresence>
         )}
 
+        {nextUrl && (
+          <Box sx={{ display: 'flex', justifyContent: 'center', mt: 4 }}>
+            <Button variant="outlined" onClick={loadMore} disabled={isLoadingMore}>
+              {isLoadingMore ? <CircularProgress size={20} /> : t('common.loadMore')}
+            </Button>
+          </Box>
+        )}
+
         {/* Floating Action Button */}
         <motion.div
           initial={{ scale: 0 }}
@@ -12,7 +12,9 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 import environ
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -53,6 +55,9 @@ CORS_ALLOWED_ORIGINS = [
 # 增强安全配置
 CORS_ALLOW_CREDENTIALS = True
 CORS_ALLOW_ALL_ORIGINS = False
+# 按需剖析的请求头与报告编号（见 api/profiling.py）
+CORS_ALLOW_HEADERS = (*default_headers, 'x-profile')
+CORS_EXPOSE_HEADERS = ['X-Profile-Id']
 
 # 安全头设置
 SECURE_BROWSER_XSS_FILTER = True
@@ -67,15 +72,83 @@ AUTH_USER_MODEL = 'users.User'
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.UserRateThrottle',
+        'api.throttling.AnonRateThrottle',
+    ],
+    # 反向代理层数，按 X-Forwarded-For 识别客户端 IP（经 nginx 部署时设为 1）
+    'NUM_PROXIES': int(os.environ['NUM_PROXIES']) if os.environ.get('NUM_PROXIES') else None,
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
 }
 
+# 缓存：进程内 LRU（L1）+ 各 worker 共享的 L2，写入时广播失效键（见 api/cache.py）
+# 设置 REDIS_URL 时 L2 使用 Redis，否则使用 CACHE_DIR 目录下的文件缓存（同一主机的 worker 共享）
+REDIS_URL = os.environ.get('REDIS_URL', '')
+CACHE_DIR = os.environ.get('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'prompt_management_cache'))
+CACHES = {
+    'default': {
+        'BACKEND': 'api.cache.TieredCache',
+        'LOCATION': REDIS_URL or CACHE_DIR,
+        'OPTIONS': {
+            'L1_MAX_ENTRIES': int(os.environ.get('CACHE_L1_MAX_ENTRIES', 1000)),
+            'L1_TIMEOUT': int(os.environ.get('CACHE_L1_TIMEOUT', 60)),
+            'L2_OPTIONS': {} if REDIS_URL else {
+                'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 10000)),
+            },
+        },
+    },
+    # 限流计数器每次请求都会修改，直接使用共享后端，不经过 L1 与失效广播；
+    # 两种后端的 incr 都是原子的，并保留 add() 设置的过期时间
+    'throttle': {
+        'BACKEND': (
+            'django.core.cache.backends.redis.RedisCache' if REDIS_URL
+            else 'api.cache.CounterFileCache'
+        ),
+        'LOCATION': REDIS_URL or os.path.join(CACHE_DIR, 'throttle'),
+        'KEY_PREFIX': 'throttle',
+        'OPTIONS': {} if REDIS_URL else {'MAX_ENTRIES': 10000},
+    },
+}
+
+# 各 worker 每隔几秒把进程内指标快照写入此目录，系统状态接口汇总同一主机的所有 worker（见 api/metrics.py）
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(CACHE_DIR, 'metrics'))
+
+# 请求耗时或任一 SQL 语句耗时超过阈值（毫秒）时记录慢请求日志与执行计划（见 api/querylog.py）
+SLOW_REQUEST_THRESHOLD_MS = int(os.environ.get('SLOW_REQUEST_THRESHOLD_MS', 500))
+SLOW_QUERY_THRESHOLD_MS = int(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 100))
+SLOW_REQUEST_LOG_SIZE = int(os.environ.get('SLOW_REQUEST_LOG_SIZE', 50))
+# 是否在慢请求报告中保留文本类 SQL 参数（可能包含令牌、密码哈希等），默认替换为占位符
+SLOW_REQUEST_LOG_PARAMS = os.environ.get('SLOW_REQUEST_LOG_PARAMS', 'False').lower() == 'true'
+
+# 按需剖析：令牌有效期（秒）、调用栈采样间隔（毫秒）、保留的报告数（见 api/profiling.py）
+PROFILING_TOKEN_MAX_AGE = int(os.environ.get('PROFILING_TOKEN_MAX_AGE', 3600))
+PROFILING_SAMPLE_INTERVAL_MS = float(os.environ.get('PROFILING_SAMPLE_INTERVAL_MS', 1))
+PROFILING_LOG_SIZE = int(os.environ.get('PROFILING_LOG_SIZE', 20))
+
+# 超出视图查询预算时：warn 记录警告，raise 抛出异常（开发与测试），off 不检查（见 api/budgets.py）
+QUERY_BUDGET_MODE = os.environ.get('QUERY_BUDGET_MODE', 'warn')
+
+# 登录、注册、两步验证、密码重置接口的限流速率（按 IP）；其他接口使用系统设置 performance.rateLimit
+AUTH_THROTTLE_RATE = os.environ.get('AUTH_THROTTLE_RATE', '10/min')
+
+# 版本历史检查点间隔：每隔 N 个版本完整保存一次，其余版本保存反向增量；设为 1 则全部完整保存
+PROMPT_VERSION_CHECKPOINT_INTERVAL = int(os.environ.get('PROMPT_VERSION_CHECKPOINT_INTERVAL', 10))
+
+# 正文超过该字节数时压缩保存（安装 zstandard 时使用 zstd，否则使用 zlib）
+CONTENT_BLOB_COMPRESS_THRESHOLD = int(os.environ.get('CONTENT_BLOB_COMPRESS_THRESHOLD', 1024))
+
+# 版本差异：每个进程缓存的版本对数量与结果总字符数，以及超过后改用线性时间算法的行数/字符数上限
+PROMPT_DIFF_CACHE_SIZE = int(os.environ.get('PROMPT_DIFF_CACHE_SIZE', 256))
+PROMPT_DIFF_CACHE_MAX_CHARS = int(os.environ.get('PROMPT_DIFF_CACHE_MAX_CHARS', 20000000))
+PROMPT_DIFF_MAX_LINES = int(os.environ.get('PROMPT_DIFF_MAX_LINES', 5000))
+PROMPT_DIFF_MAX_CHARS = int(os.environ.get('PROMPT_DIFF_MAX_CHARS', 500000))
+
 
 # Application definition
 
@@ -95,6 +168,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
+    'api.middleware.ProfilingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
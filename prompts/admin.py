@@ -1,16 +1,50 @@
+from django import forms
 from django.contrib import admin
+from . import search
 from .models import Prompt, PromptVersion
 
+class PromptAdminForm(forms.ModelForm):
+    content = forms.CharField(widget=forms.Textarea)
+    
+    class Meta:
+        model = Prompt
+        exclude = ('content_blob', 'head_version', 'version_count')
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.fields['content'].initial = self.instance.content
+    
+    def save(self, commit=True):
+        # content 存放在内容寻址 blob 中，不是模型字段，需要手动赋值
+        self.instance.content = self.cleaned_data['content']
+        return super().save(commit)
+
 @admin.register(Prompt)
 class PromptAdmin(admin.ModelAdmin):
-    list_display = ('title', 'author', 'sharing_mode', 'is_active', 'created_at', 'updated_at')
+    form = PromptAdminForm
+    list_display = ('title', 'author', 'sharing_mode', 'is_active', 'version_count', 'created_at', 'updated_at')
     list_filter = ('sharing_mode', 'is_active', 'created_at', 'author')
-    search_fields = ('title', 'content', 'author__username')
-    readonly_fields = ('created_at', 'updated_at')
+    search_fields = ('title', 'author__username')
+    readonly_fields = ('created_at', 'updated_at', 'head_version', 'version_count')
+    
+    def save_related(self, request, form, formsets, change):
+        # 标签在 save_model 之后才保存，标签就绪后再更新索引
+        super().save_related(request, form, formsets, change)
+        search.index_prompt(form.instance)
+    
+    def delete_model(self, request, obj):
+        search.remove_prompt(obj)
+        super().delete_model(request, obj)
+    
+    def delete_queryset(self, request, queryset):
+        search.remove_prompts(list(queryset.values_list('pk', flat=True)))
+        super().delete_queryset(request, queryset)
 
 @admin.register(PromptVersion)
 class PromptVersionAdmin(admin.ModelAdmin):
-    list_display = ('prompt', 'version_number', 'author', 'created_at')
+    list_display = ('prompt', 'version_number', 'author', 'is_delta', 'created_at')
     list_filter = ('created_at', 'author')
-    search_fields = ('prompt__title', 'content', 'author__username')
-    readonly_fields = ('created_at',)
+    search_fields = ('prompt__title', 'author__username')
+    exclude = ('content_blob', 'delta')
+    readonly_fields = ('created_at', 'is_delta', 'get_content')
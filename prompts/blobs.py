@@ -0,0 +1,47 @@
+"""内容寻址存储的编码工具
+
+正文以 sha256 为键去重保存；超过阈值的正文压缩保存，
+安装了 zstandard 时使用 zstd，否则使用 zlib。
+"""
+import hashlib
+import zlib
+
+from django.conf import settings
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖
+    zstandard = None
+
+CODEC_NONE = 'none'
+CODEC_ZLIB = 'zlib'
+CODEC_ZSTD = 'zstd'
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def encode(text):
+    """返回 (codec, data)，压缩后不更小时保存原文"""
+    raw = text.encode('utf-8')
+    if len(raw) < settings.CONTENT_BLOB_COMPRESS_THRESHOLD:
+        return CODEC_NONE, raw
+    if zstandard is not None:
+        codec, data = CODEC_ZSTD, zstandard.ZstdCompressor(level=10).compress(raw)
+    else:
+        codec, data = CODEC_ZLIB, zlib.compress(raw, 6)
+    if len(data) >= len(raw):
+        return CODEC_NONE, raw
+    return codec, data
+
+
+def decode(codec, data):
+    data = bytes(data)
+    if codec == CODEC_ZLIB:
+        data = zlib.decompress(data)
+    elif codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError('zstandard is required to read zstd-compressed content')
+        data = zstandard.ZstdDecompressor().decompress(data)
+    return data.decode('utf-8')
@@ -0,0 +1,209 @@
+"""提示词批量操作
+
+对一组提示词依次执行若干操作（增删标签、修改共享模式、更新内容、删除），
+全部操作在同一事务中以批量语句完成，权限判定只需一次查询。
+权限规则与 IsAdminOrOwnerOrShared 一致：管理员、作者或团队共享的提示词可操作。
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+
+from api import stats
+from . import response_cache, search, tag_counts
+from .models import ContentBlob, Prompt, PromptVersion, Tag
+
+OPERATIONS = ('add_tags', 'remove_tags', 'set_sharing_mode', 'update_content', 'delete')
+# 改变标签或内容的操作需要重建索引
+REINDEX_OPERATIONS = {'add_tags', 'remove_tags', 'update_content'}
+
+Link = Prompt.tags.through
+
+
+def can_operate(user, author_id, sharing_mode):
+    return user.role == 'admin' or author_id == user.pk or sharing_mode == 'team'
+
+
+def check_access(user, prompt_ids):
+    """返回 (可操作的 id 列表, {id: 'not_found' 或 'forbidden'})"""
+    rows = Prompt.objects.filter(pk__in=prompt_ids).values_list('pk', 'author_id', 'sharing_mode')
+    found = {pk: (author_id, sharing_mode) for pk, author_id, sharing_mode in rows}
+    allowed = []
+    failures = {}
+    for pk in prompt_ids:
+        if pk not in found:
+            failures[pk] = 'not_found'
+        elif can_operate(user, *found[pk]):
+            allowed.append(pk)
+        else:
+            failures[pk] = 'forbidden'
+    return allowed, failures
+
+
+def apply_operations(user, prompt_ids, operations):
+    """执行批量操作，返回按请求顺序排列的逐项结果"""
+    prompt_ids = list(dict.fromkeys(prompt_ids))
+    allowed, failures = check_access(user, prompt_ids)
+    deleting = any(operation['op'] == 'delete' for operation in operations)
+
+    with transaction.atomic():
+        prompts = list(
+            Prompt.objects.select_for_update(of=('self',)).select_related('head_version__content_blob')
+            .filter(pk__in=allowed).order_by('pk')
+        )
+        # 校验与加锁之间作者或共享模式可能已变化，按加锁后的行重新判定
+        for prompt in prompts:
+            if not can_operate(user, prompt.author_id, prompt.sharing_mode):
+                failures[prompt.pk] = 'forbidden'
+        prompts = [prompt for prompt in prompts if prompt.pk not in failures]
+        for operation in operations:
+            if prompts:
+                HANDLERS[operation['op']](prompts, operation, user)
+        if prompts and not deleting and any(op['op'] in REINDEX_OPERATIONS for op in operations):
+            fresh = Prompt.objects.filter(pk__in=[prompt.pk for prompt in prompts])
+            search.reindex_prompts(fresh.select_related('content_blob').prefetch_related('tags'))
+        if prompts:
+            response_cache.bump_generation()
+
+    done = {prompt.pk for prompt in prompts}
+    results = []
+    for pk in prompt_ids:
+        if pk in done:
+            results.append({'id': pk, 'status': 'deleted' if deleting else 'updated'})
+        else:
+            # 校验与加锁之间被删除的提示词也视为不存在
+            results.append({'id': pk, 'status': failures.get(pk, 'not_found')})
+    return results
+
+
+def add_tags(prompts, operation, user):
+    tag_ids = [tag.pk for tag in operation['tag_ids']]
+    existing = set(
+        Link.objects.filter(prompt_id__in=[prompt.pk for prompt in prompts], tag_id__in=tag_ids)
+        .values_list('prompt_id', 'tag_id')
+    )
+    new = [(prompt, tag_id) for prompt in prompts for tag_id in tag_ids if (prompt.pk, tag_id) not in existing]
+    _link(new)
+    _touch({prompt for prompt, _ in new})
+
+
+def remove_tags(prompts, operation, user):
+    tag_ids = [tag.pk for tag in operation['tag_ids']]
+    by_id = {prompt.pk: prompt for prompt in prompts}
+    links = list(
+        Link.objects.filter(prompt_id__in=list(by_id), tag_id__in=tag_ids).values_list('pk', 'prompt_id', 'tag_id')
+    )
+    if not links:
+        return
+    # 直接删除关联行不会触发 m2m_changed，计数器在这里更新
+    Link.objects.filter(pk__in=[pk for pk, _, _ in links]).delete()
+    tag_counts.adjust_links(
+        ((tag_id, by_id[prompt_id].sharing_mode, by_id[prompt_id].author_id) for _, prompt_id, tag_id in links),
+        delta=-1,
+    )
+
+    # 与单个编辑一致：没有标签的提示词归入默认标签
+    tagged = set(Link.objects.filter(prompt_id__in=list(by_id)).values_list('prompt_id', flat=True).distinct())
+    untagged = [prompt for prompt in prompts if prompt.pk not in tagged]
+    if untagged:
+        default_tag, created = Tag.objects.get_or_create(name='Default', defaults={'color': '#9e9e9e'})
+        _link([(prompt, default_tag.pk) for prompt in untagged])
+    _touch({by_id[prompt_id] for _, prompt_id, _ in links})
+
+
+def set_sharing_mode(prompts, operation, user):
+    sharing_mode = operation['sharing_mode']
+    changing = {prompt.pk: prompt for prompt in prompts if prompt.sharing_mode != sharing_mode}
+    if not changing:
+        return
+    links = list(Link.objects.filter(prompt_id__in=list(changing)).values_list('prompt_id', 'tag_id'))
+    tag_counts.adjust_links(
+        ((tag_id, changing[prompt_id].sharing_mode, changing[prompt_id].author_id) for prompt_id, tag_id in links),
+        delta=-1,
+    )
+    tag_counts.adjust_links(
+        (tag_id, sharing_mode, changing[prompt_id].author_id) for prompt_id, tag_id in links
+    )
+    previous = Counter(stats.sharing_metric(prompt.sharing_mode) for prompt in changing.values())
+    stats.adjust({**{name: -count for name, count in previous.items()}, stats.sharing_metric(sharing_mode): len(changing)})
+    # QuerySet.update() 不会触发 auto_now 与 save 信号
+    now = timezone.now()
+    Prompt.objects.filter(pk__in=list(changing)).update(sharing_mode=sharing_mode, updated_at=now)
+    for prompt in changing.values():
+        prompt.sharing_mode = sharing_mode
+        prompt.updated_at = now
+
+
+def update_content(prompts, operation, user):
+    content = operation['content']
+    digest = ContentBlob.objects.intern(content)
+    for prompt in prompts:
+        if prompt.head_version is None:
+            prompt.head_version, prompt.version_count = prompt.recover_head()
+
+    # 与 Prompt.commit_version() 相同：非检查点的旧 head 改为反向增量
+    converted = [
+        prompt.head_version for prompt in prompts
+        if prompt.head_version and prompt.head_version.should_store_as_delta()
+        and prompt.head_version.store_as_delta(content, save=False)
+    ]
+    PromptVersion.objects.bulk_update(converted, ['content_blob', 'delta', 'is_delta'], batch_size=500)
+
+    versions = PromptVersion.objects.bulk_create([
+        PromptVersion(
+            prompt=prompt,
+            version_number=(prompt.head_version.version_number + 1) if prompt.head_version else 1,
+            content_blob_id=digest,
+            author=user,
+            commit_message=operation.get('commit_message', ''),
+        )
+        for prompt in prompts
+    ], batch_size=500)
+
+    stats.adjust({'versions': len(versions)})
+
+    now = timezone.now()
+    for prompt, version in zip(prompts, versions):
+        prompt.head_version = version
+        prompt.version_count += 1
+        prompt.content_blob_id = digest
+        prompt.updated_at = now
+    Prompt.objects.bulk_update(
+        prompts, ['head_version', 'version_count', 'content_blob', 'updated_at'], batch_size=500
+    )
+
+
+def delete(prompts, operation, user):
+    prompt_ids = [prompt.pk for prompt in prompts]
+    search.remove_prompts(prompt_ids)
+    # QuerySet.delete() 会逐个发送 pre_delete，标签计数由信号处理
+    Prompt.objects.filter(pk__in=prompt_ids).delete()
+
+
+def _touch(prompts):
+    """更新 updated_at；直接写关联表时需要手动更新，片段缓存与条件请求依赖它"""
+    if not prompts:
+        return
+    now = timezone.now()
+    Prompt.objects.filter(pk__in=[prompt.pk for prompt in prompts]).update(updated_at=now)
+    for prompt in prompts:
+        prompt.updated_at = now
+
+
+def _link(pairs):
+    """为 (提示词, 标签 id) 批量建立关联并更新计数"""
+    if not pairs:
+        return
+    Link.objects.bulk_create(
+        [Link(prompt_id=prompt.pk, tag_id=tag_id) for prompt, tag_id in pairs], batch_size=500
+    )
+    tag_counts.adjust_links((tag_id, prompt.sharing_mode, prompt.author_id) for prompt, tag_id in pairs)
+
+
+HANDLERS = {
+    'add_tags': add_tags,
+    'remove_tags': remove_tags,
+    'set_sharing_mode': set_sharing_mode,
+    'update_content': update_content,
+    'delete': delete,
+}
@@ -0,0 +1,188 @@
+"""合成测试数据
+
+批量生成用户、标签与带版本历史的提示词，用于压测与基准测试。全部通过 bulk_create 写入，
+计数器、标签计数、搜索索引与 commit_version() 产生的存储形态（最新版本完整保存，
+非检查点的旧版本保存为相对下一版本的反向增量）保持一致。
+
+- 作者与标签按 Zipf 分布抽取：少数用户写了大部分提示词，少数热门标签覆盖大部分提示词
+- 版本数服从指数分布（均值 mean_versions，上限 max_versions），少数提示词有很长的历史
+"""
+import random
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from api import stats
+from users.models import User
+from . import importer
+from .delta import make_delta
+from .models import ContentBlob, Prompt, PromptVersion, Tag
+
+WORDS = (
+    'summarise translate explain review refactor classify extract rewrite outline draft answer compare '
+    'customer email report code python query policy contract invoice meeting product release research '
+    'article tweet headline abstract bullet table json schema tone formal friendly concise detailed '
+    'step example context audience persona constraint format citation source language english chinese'
+).split()
+COMMIT_MESSAGES = ['Tweak wording', 'Add examples', 'Fix typo', 'Tighten constraints', 'Restructure', 'Update format']
+TAG_COLORS = ['#1976d2', '#388e3c', '#f57c00', '#7b1fa2', '#c2185b', '#0097a7', '#5d4037', '#455a64']
+
+
+def zipf_weights(count, skew):
+    return [1 / (rank + 1) ** skew for rank in range(count)]
+
+
+class DatasetGenerator:
+    def __init__(self, users=100, prompts=1000, mean_versions=5, max_versions=200, tags=50, max_tags_per_prompt=3,
+                 skew=1.1, team_ratio=0.5, content_length=800, password='password', prefix='bench', seed=0,
+                 batch_size=1000, log=None):
+        self.user_count = users
+        self.prompt_count = prompts
+        self.mean_versions = mean_versions
+        self.max_versions = max_versions
+        self.tag_count = tags
+        self.max_tags_per_prompt = max_tags_per_prompt
+        self.skew = skew
+        self.team_ratio = team_ratio
+        self.content_length = content_length
+        self.password = password
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.rng = random.Random(seed)
+        self.log = log or (lambda message: None)
+        self.interval = settings.PROMPT_VERSION_CHECKPOINT_INTERVAL
+        self.counts = Counter()
+
+    def generate(self):
+        started = time.perf_counter()
+        users = self.create_users()
+        tags = self.create_tags()
+        user_weights = zipf_weights(len(users), self.skew)
+        tag_weights = zipf_weights(len(tags), self.skew)
+        for start in range(0, self.prompt_count, self.batch_size):
+            size = min(self.batch_size, self.prompt_count - start)
+            specs = [self.prompt_spec(start + i, users, user_weights, tags, tag_weights) for i in range(size)]
+            with transaction.atomic():
+                self.write_prompts(specs)
+            self.log(f'{start + size}/{self.prompt_count} prompts, {self.counts["versions"]} versions')
+        self.counts['seconds'] = round(time.perf_counter() - started, 2)
+        return dict(self.counts)
+
+    def create_users(self):
+        password = make_password(self.password)
+        users = [
+            User(
+                username=f'{self.prefix}-user-{i}', email=f'{self.prefix}-user-{i}@example.com', password=password,
+                role='admin' if i == 0 else 'user',
+            )
+            for i in range(self.user_count)
+        ]
+        User.objects.bulk_create(users, batch_size=1000)
+        stats.adjust({'users': len(users), 'active_users': len(users)})
+        self.counts['users'] = len(users)
+        return list(User.objects.filter(username__startswith=f'{self.prefix}-user-').values_list('pk', flat=True))
+
+    def create_tags(self):
+        names = [f'{self.prefix}-tag-{i}' for i in range(self.tag_count)]
+        existing = set(Tag.objects.filter(name__in=names).values_list('name', flat=True))
+        Tag.objects.bulk_create(
+            [Tag(name=name, color=self.rng.choice(TAG_COLORS)) for name in names if name not in existing],
+            ignore_conflicts=True,
+        )
+        stats.adjust({'tags': len(names) - len(existing)})
+        self.counts['tags'] = len(names) - len(existing)
+        ids = dict(Tag.objects.filter(name__in=names).values_list('name', 'id'))
+        # 按名称顺序排列，排在前面的是热门标签
+        return [(ids[name], name) for name in names]
+
+    def sentence(self):
+        words = self.rng.choices(WORDS, k=self.rng.randint(6, 16))
+        ending = '\n' if self.rng.random() < 0.2 else ' '
+        return ' '.join(words).capitalize() + '.' + ending
+
+    def prompt_spec(self, index, users, user_weights, tags, tag_weights):
+        sentences = []
+        target = self.rng.randint(self.content_length // 2, self.content_length * 3 // 2)
+        while sum(map(len, sentences)) < target:
+            sentences.append(self.sentence())
+        version_count = 1
+        if self.mean_versions > 1:
+            version_count = min(1 + int(self.rng.expovariate(1 / (self.mean_versions - 1))), self.max_versions)
+
+        contents = [''.join(sentences)]
+        for _ in range(version_count - 1):
+            # 每个版本改写、插入或删除一两句
+            for _ in range(self.rng.randint(1, 2)):
+                position = self.rng.randrange(len(sentences))
+                action = self.rng.random()
+                if action < 0.6:
+                    sentences[position] = self.sentence()
+                elif action < 0.85 or len(sentences) == 1:
+                    sentences.insert(position, self.sentence())
+                else:
+                    del sentences[position]
+            contents.append(''.join(sentences))
+
+        picked = dict.fromkeys(
+            self.rng.choices(tags, weights=tag_weights, k=self.rng.randint(1, self.max_tags_per_prompt))
+        )
+        return {
+            'title': f'{" ".join(self.rng.choices(WORDS, k=3)).capitalize()} #{index}',
+            'author_id': self.rng.choices(users, weights=user_weights)[0],
+            'sharing_mode': 'team' if self.rng.random() < self.team_ratio else 'private',
+            'contents': contents,
+            'tags': list(picked),
+        }
+
+    def version_rows(self, spec):
+        """按 commit_version() 的存储方式返回 [(版本号, 完整内容或 None, 增量)]"""
+        contents = spec['contents']
+        rows = []
+        for number, content in enumerate(contents, start=1):
+            if number < len(contents) and self.interval > 1 and number % self.interval != 0:
+                delta = make_delta(contents[number], content)
+                if len(delta) < len(content):
+                    rows.append((number, None, delta))
+                    continue
+            rows.append((number, content, ''))
+        return rows
+
+    def write_prompts(self, specs):
+        rows = [self.version_rows(spec) for spec in specs]
+        full_texts = [content for prompt_rows in rows for _, content, _ in prompt_rows if content is not None]
+        hashes = iter(ContentBlob.objects.intern_many(full_texts))
+        blob_ids = [[next(hashes) if content is not None else None for _, content, _ in prompt_rows] for prompt_rows in rows]
+
+        prompts = []
+        for spec, prompt_blobs in zip(specs, blob_ids):
+            prompt = Prompt(
+                title=spec['title'], content_blob_id=prompt_blobs[-1], author_id=spec['author_id'],
+                sharing_mode=spec['sharing_mode'], version_count=len(spec['contents']),
+            )
+            # 正文已写入 blob，缓存文本供索引使用
+            prompt.__dict__['_content_blob_text'] = spec['contents'][-1]
+            prompts.append(prompt)
+        Prompt.objects.bulk_create(prompts, batch_size=500)
+
+        versions = [
+            PromptVersion(
+                prompt_id=prompt.pk, version_number=number, content_blob_id=blob_id, is_delta=content is None,
+                delta=delta, author_id=prompt.author_id,
+                commit_message='Initial version' if number == 1 else self.rng.choice(COMMIT_MESSAGES),
+            )
+            for prompt, prompt_rows, prompt_blobs in zip(prompts, rows, blob_ids)
+            for (number, content, delta), blob_id in zip(prompt_rows, prompt_blobs)
+        ]
+        PromptVersion.objects.bulk_create(versions, batch_size=1000)
+        links = [(prompt.pk, tag_id) for prompt, spec in zip(prompts, specs) for tag_id, _ in spec['tags']]
+        importer.finish_new_prompts(
+            prompts, links,
+            {prompt.pk: [name for _, name in spec['tags']] for prompt, spec in zip(prompts, specs)},
+            len(versions),
+        )
+        self.counts['prompts'] += len(prompts)
+        self.counts['versions'] += len(versions)
+        self.counts['delta_versions'] += sum(version.is_delta for version in versions)
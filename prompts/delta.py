@@ -0,0 +1,46 @@
+"""版本内容的增量编码
+
+增量以 JSON 列表保存，由两种操作组成：
+- [i, j]：复制基准文本的第 i 到 j 个片段
+- "text"：插入一段文本
+片段按换行和句末标点切分，切分后拼接可还原原文。
+"""
+import json
+import re
+from difflib import SequenceMatcher
+
+SEGMENT_RE = re.compile(r'(?<=[\n。！？.!?])')
+
+
+def split_segments(text):
+    return [segment for segment in SEGMENT_RE.split(text) if segment]
+
+
+def make_delta(base, target):
+    """生成从 base 还原 target 的增量（JSON 字符串）"""
+    base_segments = split_segments(base)
+    target_segments = split_segments(target)
+    matcher = SequenceMatcher(None, base_segments, target_segments, autojunk=False)
+    ops = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif tag in ('replace', 'insert'):
+            text = ''.join(target_segments[j1:j2])
+            if ops and isinstance(ops[-1], str):
+                ops[-1] += text
+            else:
+                ops.append(text)
+    return json.dumps(ops, ensure_ascii=False, separators=(',', ':'))
+
+
+def apply_delta(base, delta):
+    """将增量应用到 base，返回目标文本"""
+    base_segments = split_segments(base)
+    parts = []
+    for op in json.loads(delta):
+        if isinstance(op, str):
+            parts.append(op)
+        else:
+            parts.extend(base_segments[op[0]:op[1]])
+    return ''.join(parts)
@@ -0,0 +1,221 @@
+"""版本差异计算
+
+版本内容不可变，差异结果按版本对缓存在进程内的 LRU 中，永不过期；
+缓存同时限制条数与结果的总字符数，单个结果超过总量上限时不缓存。
+超过大小上限时改用线性时间算法：只剥离公共前后缀，中间部分整体视为替换。
+"""
+import re
+import threading
+from collections import OrderedDict
+from difflib import SequenceMatcher
+
+from django.conf import settings
+
+from .models import PromptVersion
+
+WORD_RE = re.compile(r'\s+|\w+|[^\w\s]')
+MAX_WORD_DIFF_LINES = 200
+
+
+def linear_opcodes(a, b):
+    """线性时间的差异：公共前缀、公共后缀之外的部分整体替换"""
+    prefix = 0
+    limit = min(len(a), len(b))
+    while prefix < limit and a[prefix] == b[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and a[-suffix - 1] == b[-suffix - 1]:
+        suffix += 1
+
+    opcodes = []
+    if prefix:
+        opcodes.append(('equal', 0, prefix, 0, prefix))
+    a_end, b_end = len(a) - suffix, len(b) - suffix
+    if prefix < a_end and prefix < b_end:
+        opcodes.append(('replace', prefix, a_end, prefix, b_end))
+    elif prefix < a_end:
+        opcodes.append(('delete', prefix, a_end, prefix, prefix))
+    elif prefix < b_end:
+        opcodes.append(('insert', prefix, prefix, prefix, b_end))
+    if suffix:
+        opcodes.append(('equal', a_end, len(a), b_end, len(b)))
+    return opcodes
+
+
+def group_opcodes(opcodes, context=3):
+    """按 unified diff 的方式把 opcodes 分成带上下文的 hunk（同 difflib.get_grouped_opcodes）"""
+    if not opcodes:
+        return []
+    codes = list(opcodes)
+    if codes[0][0] == 'equal':
+        tag, i1, i2, j1, j2 = codes[0]
+        codes[0] = tag, max(i1, i2 - context), i2, max(j1, j2 - context), j2
+    if codes[-1][0] == 'equal':
+        tag, i1, i2, j1, j2 = codes[-1]
+        codes[-1] = tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)
+
+    groups = []
+    group = []
+    for tag, i1, i2, j1, j2 in codes:
+        if tag == 'equal' and i2 - i1 > context * 2:
+            group.append((tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)))
+            groups.append(group)
+            group = []
+            i1, j1 = max(i1, i2 - context), max(j1, j2 - context)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == 'equal'):
+        groups.append(group)
+    return groups
+
+
+def _format_range(start, stop):
+    length = stop - start
+    beginning = start + 1
+    if length == 1:
+        return str(beginning)
+    if not length:
+        beginning -= 1
+    return f'{beginning},{length}'
+
+
+def unified_diff(a, b, opcodes, from_label, to_label, context=3):
+    lines = [f'--- {from_label}', f'+++ {to_label}']
+    for group in group_opcodes(opcodes, context):
+        first, last = group[0], group[-1]
+        lines.append('@@ -{} +{} @@'.format(
+            _format_range(first[1], last[2]), _format_range(first[3], last[4])
+        ))
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                lines.extend(' ' + line for line in a[i1:i2])
+                continue
+            lines.extend('-' + line for line in a[i1:i2])
+            lines.extend('+' + line for line in b[j1:j2])
+    return '\n'.join(lines) if len(lines) > 2 else ''
+
+
+def word_diff(old_lines, new_lines):
+    old_words = WORD_RE.findall('\n'.join(old_lines))
+    new_words = WORD_RE.findall('\n'.join(new_lines))
+    matcher = SequenceMatcher(None, old_words, new_words, autojunk=False)
+    words = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            words.append({'op': 'equal', 'text': ''.join(old_words[i1:i2])})
+            continue
+        if i2 > i1:
+            words.append({'op': 'delete', 'text': ''.join(old_words[i1:i2])})
+        if j2 > j1:
+            words.append({'op': 'insert', 'text': ''.join(new_words[j1:j2])})
+    return words
+
+
+def compute_diff(old_text, new_text, from_label='a', to_label='b'):
+    """返回包含 unified 文本与结构化变更的差异结果"""
+    a = old_text.splitlines()
+    b = new_text.splitlines()
+    linear = (
+        len(a) + len(b) > settings.PROMPT_DIFF_MAX_LINES
+        or len(old_text) + len(new_text) > settings.PROMPT_DIFF_MAX_CHARS
+    )
+    if linear:
+        opcodes = linear_opcodes(a, b)
+    else:
+        opcodes = SequenceMatcher(None, a, b, autojunk=False).get_opcodes()
+
+    changes = []
+    insertions = deletions = 0
+    for tag, i1, i2, j1, j2 in opcodes:
+        change = {
+            'op': tag,
+            'old_start': i1 + 1, 'old_end': i2,
+            'new_start': j1 + 1, 'new_end': j2,
+            'old_lines': a[i1:i2],
+            'new_lines': b[j1:j2],
+        }
+        if tag != 'equal':
+            deletions += i2 - i1
+            insertions += j2 - j1
+        if tag == 'replace' and not linear and (i2 - i1) + (j2 - j1) <= MAX_WORD_DIFF_LINES:
+            change['words'] = word_diff(a[i1:i2], b[j1:j2])
+        changes.append(change)
+
+    return {
+        'algorithm': 'linear' if linear else 'sequence',
+        'unified': unified_diff(a, b, opcodes, from_label, to_label),
+        'changes': changes,
+        'stats': {'insertions': insertions, 'deletions': deletions},
+    }
+
+
+def result_size(result):
+    """差异结果中字符串的总字符数，用于限制缓存占用"""
+    size = len(result['unified'])
+    for change in result['changes']:
+        size += sum(map(len, change['old_lines'])) + sum(map(len, change['new_lines']))
+        size += sum(len(word['text']) for word in change.get('words', ()))
+    return size
+
+
+class DiffCache:
+    """按条数与总字符数限制的 LRU"""
+
+    def __init__(self, max_entries, max_chars):
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self.entries = OrderedDict()
+        self.chars = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+
+    def set(self, key, result):
+        size = result_size(result)
+        if size > self.max_chars:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.chars -= self.entries.pop(key)[1]
+            self.entries[key] = (result, size)
+            self.chars += size
+            while len(self.entries) > self.max_entries or self.chars > self.max_chars:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.chars -= evicted
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.chars = 0
+
+
+diff_cache = DiffCache(settings.PROMPT_DIFF_CACHE_SIZE, settings.PROMPT_DIFF_CACHE_MAX_CHARS)
+
+
+def version_diff(from_version_id, to_version_id):
+    """按版本对缓存的差异结果；版本不可变，缓存无需失效"""
+    key = (from_version_id, to_version_id)
+    result = diff_cache.get(key)
+    if result is None:
+        result = _version_diff(from_version_id, to_version_id)
+        diff_cache.set(key, result)
+    return result
+
+
+def _version_diff(from_version_id, to_version_id):
+    versions = {
+        version.pk: version
+        for version in PromptVersion.objects.select_related('content_blob').filter(
+            pk__in=[from_version_id, to_version_id]
+        )
+    }
+    PromptVersion.load_contents(list(versions.values()))
+    old, new = versions[from_version_id], versions[to_version_id]
+    return compute_diff(
+        old.get_content(), new.get_content(),
+        from_label=f'v{old.version_number}', to_label=f'v{new.version_number}',
+    )
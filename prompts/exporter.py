@@ -0,0 +1,127 @@
+"""提示词流式导出
+
+输出 NDJSON，每行一个提示词，字段与批量导入（prompts.importer）兼容，可选附带完整版本历史。
+提示词与版本均以分块 iterator() 读取，逐行序列化输出，内存占用与导出规模无关。
+"""
+import datetime
+import zlib
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from . import blobs
+from .delta import apply_delta
+from .models import BrokenVersionChain, Prompt, PromptVersion
+
+
+def parse_timestamp(value):
+    """解析 ISO 日期或日期时间，无时区时按当前时区处理"""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        date = parse_date(value)
+        if date is None:
+            raise ValueError(f'Invalid date: {value}')
+        parsed = datetime.datetime.combine(date, datetime.time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def export_queryset(user=None, tag_id=None, author=None, updated_after=None, updated_before=None):
+    """按可见性与筛选条件返回待导出的提示词；user 为 None 时导出全部"""
+    prompts = Prompt.objects.all()
+    if user is not None and user.role != 'admin':
+        prompts = prompts.filter(Q(author=user) | Q(sharing_mode='team'))
+    if tag_id is not None:
+        prompts = prompts.filter(tags__id=tag_id)
+    if author:
+        prompts = prompts.filter(author__username=author)
+    if updated_after:
+        prompts = prompts.filter(updated_at__gte=updated_after)
+    if updated_before:
+        prompts = prompts.filter(updated_at__lt=updated_before)
+    return prompts.select_related('author', 'content_blob').prefetch_related('tags').order_by('pk')
+
+
+def iter_records(prompts, include_history=False, chunk_size=500):
+    """逐个产出提示词的导出记录"""
+    rows = prompts.iterator(chunk_size=chunk_size)
+    while batch := list(islice(rows, chunk_size)):
+        histories = _iter_histories([prompt.pk for prompt in batch]) if include_history else None
+        history = next(histories, None) if histories else None
+        for prompt in batch:
+            record = {
+                'id': prompt.pk,
+                'title': prompt.title,
+                'content': prompt.content,
+                'sharing_mode': prompt.sharing_mode,
+                'tags': [tag.name for tag in prompt.tags.all()],
+                'author': prompt.author.username,
+                'created_at': prompt.created_at,
+                'updated_at': prompt.updated_at,
+            }
+            if include_history:
+                versions = []
+                # 版本按提示词 id 升序分组产出，与 batch 顺序一致
+                if history is not None and history[0] == prompt.pk:
+                    versions = history[1]
+                    history = next(histories, None)
+                record['versions'] = versions
+            yield record
+
+
+def _iter_histories(prompt_ids):
+    """按提示词产出 (prompt_id, 版本列表)，版本从新到旧，增量版本依次还原"""
+    rows = PromptVersion.objects.filter(prompt_id__in=prompt_ids).order_by(
+        'prompt_id', '-version_number'
+    ).values_list(
+        'prompt_id', 'version_number', 'is_delta', 'delta', 'content_blob__codec', 'content_blob__data',
+        'author__username', 'commit_message', 'created_at',
+    )
+    current_prompt = None
+    versions = []
+    content = None
+    for prompt_id, number, is_delta, delta, codec, data, author, message, created_at in rows.iterator(chunk_size=2000):
+        if prompt_id != current_prompt:
+            if current_prompt is not None:
+                yield current_prompt, versions
+            current_prompt, versions, content = prompt_id, [], None
+        if not is_delta:
+            content = blobs.decode(codec, data)
+        elif content is None or versions[-1]['version_number'] != number + 1:
+            raise BrokenVersionChain(prompt_id, number)
+        else:
+            content = apply_delta(content, delta)
+        versions.append({
+            'version_number': number,
+            'content': content,
+            'author': author,
+            'commit_message': message,
+            'created_at': created_at,
+        })
+    if current_prompt is not None:
+        yield current_prompt, versions
+
+
+def iter_ndjson(records):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for record in records:
+        yield (encoder.encode(record) + '\n').encode('utf-8')
+
+
+def gzip_stream(chunks, flush_bytes=64 * 1024):
+    """把字节流压缩为 gzip，每累积一定输入即输出一次，首个字节可以尽快发出"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    pending = 0
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        pending += len(chunk)
+        if pending >= flush_bytes:
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            pending = 0
+        if data:
+            yield data
+    yield compressor.flush()
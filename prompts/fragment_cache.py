@@ -0,0 +1,80 @@
+"""单个提示词序列化结果的片段缓存
+
+PromptSerializer 的输出与请求用户无关，只随提示词本身（updated_at）、作者与最新版本作者的信息
+（各自的 updated_at）以及标签的名称、颜色变化。片段键包含这些值，提示词更新后旧片段自然失效；
+标签修改或删除不会改变 updated_at，因此递增标签代号使全部片段失效（标签改动很少）。
+
+列表页以 get_many 批量取出片段，只序列化未命中的提示词，再以 set_many 写回。
+与 response_cache 共用 performance.cacheEnabled / performance.cacheTimeout 设置。
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from api.models import SystemSetting
+from . import response_cache
+
+TAG_GENERATION_KEY = 'prompts:fragment:tag_generation'
+KEY_PREFIX = 'prompts:fragment'
+
+
+def get_tag_generation():
+    generation = cache.get(TAG_GENERATION_KEY)
+    if generation is None:
+        # 与 response_cache 相同，用时间戳作为初始值，避免与被淘汰前的代号重合
+        cache.add(TAG_GENERATION_KEY, time.time_ns(), None)
+        generation = cache.get(TAG_GENERATION_KEY)
+    return generation
+
+
+def _bump_tag_generation():
+    try:
+        cache.incr(TAG_GENERATION_KEY)
+    except ValueError:
+        cache.add(TAG_GENERATION_KEY, time.time_ns(), None)
+
+
+def bump_tag_generation():
+    """标签修改或删除后调用；在事务中时推迟到提交之后"""
+    transaction.on_commit(_bump_tag_generation)
+
+
+def _user_version(user):
+    if user is None:
+        return 'none'
+    return f'{user.pk}:{user.updated_at.timestamp() if user.updated_at else 0}'
+
+
+def fragment_key(prompt, tag_generation):
+    # latest_version.author_username 来自最新版本的作者，它可能不是提示词作者
+    head_author = prompt.head_version.author if prompt.head_version is not None else None
+    return (
+        f'{KEY_PREFIX}:{tag_generation}:{prompt.pk}:{prompt.updated_at.timestamp()}:'
+        f'{_user_version(prompt.author)}:{_user_version(head_author)}'
+    )
+
+
+def serialize_many(prompts, serialize):
+    """按顺序返回 prompts 的序列化结果，只对未命中的提示词调用 serialize(prompt)"""
+    prompts = list(prompts)
+    if not prompts or not SystemSetting.get_bool('cacheEnabled', True):
+        return [serialize(prompt) for prompt in prompts]
+
+    tag_generation = get_tag_generation()
+    keys = [fragment_key(prompt, tag_generation) for prompt in prompts]
+    cached = cache.get_many(keys)
+
+    results = []
+    missed = {}
+    for prompt, key in zip(prompts, keys):
+        fragment = cached.get(key)
+        if fragment is None:
+            fragment = missed[key] = serialize(prompt)
+        results.append(fragment)
+
+    response_cache.stats['fragment_hits'] += len(prompts) - len(missed)
+    response_cache.stats['fragment_misses'] += len(missed)
+    if missed:
+        cache.set_many(missed, SystemSetting.get_int('cacheTimeout', 3600))
+    return results
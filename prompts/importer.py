@@ -0,0 +1,329 @@
+"""提示词批量导入
+
+支持 NDJSON（.ndjson/.jsonl，每行一个 JSON 对象）、单个 .txt/.md/.json 文件，
+以及包含这些文件的 zip 压缩包，均为流式读取。.json 文件可以是一个对象或对象数组。
+每条记录字段：title、content、sharing_mode（可选）、tags（标签名列表，可选）、commit_message（可选）；
+.txt/.md 文件以文件名作为标题、全文作为内容。
+
+单个文件（压缩包内的文件、NDJSON 的单行记录）受 storage.maxFileSize（MB）限制，
+文件类型受 storage.allowedFileTypes 限制。记录按批写入，每批一个事务；
+单条记录的错误只记录下来，不影响其他记录。
+"""
+import json
+import os
+import zipfile
+from collections import Counter
+from itertools import islice
+
+from django.db import DatabaseError, connection, transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from api import stats
+from api.models import SystemSetting
+from . import response_cache, search, tag_counts
+from .models import ContentBlob, Prompt, PromptVersion, Tag
+
+DEFAULT_TAG = 'Default'
+DEFAULT_TAG_COLOR = '#9e9e9e'
+SHARING_MODES = {choice for choice, _ in Prompt.SHARING_CHOICES}
+# NDJSON 与 JSON 同属 json 类型
+FILE_TYPE_ALIASES = {'ndjson': 'json', 'jsonl': 'json', 'markdown': 'md'}
+MAX_REPORTED_ERRORS = 100
+
+
+class RecordError(Exception):
+    """单条记录无法导入"""
+
+
+class ImportLimits:
+    """从系统设置读取的导入限制"""
+
+    def __init__(self, max_file_size=None, allowed_types=None):
+        if max_file_size is None:
+            max_file_size = SystemSetting.get_setting('maxFileSize', 10)
+        if allowed_types is None:
+            allowed_types = SystemSetting.get_setting('allowedFileTypes', 'txt,md,json')
+        self.max_bytes = int(float(max_file_size) * 1024 * 1024)
+        self.allowed_types = {
+            file_type.strip().lower().lstrip('.') for file_type in str(allowed_types).split(',') if file_type.strip()
+        }
+
+    def file_type(self, name):
+        extension = os.path.splitext(name)[1].lower().lstrip('.')
+        return FILE_TYPE_ALIASES.get(extension, extension)
+
+    def check_type(self, name):
+        file_type = self.file_type(name)
+        if file_type not in self.allowed_types:
+            raise RecordError(f'File type "{file_type or name}" is not allowed')
+        return file_type
+
+    def check_size(self, size):
+        if size > self.max_bytes:
+            raise RecordError(f'File exceeds the maximum size of {self.max_bytes / (1024 * 1024):g} MB')
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, source, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'source': source, 'error': message})
+
+    def as_dict(self):
+        return {'created': self.created, 'failed': self.failed, 'errors': self.errors}
+
+
+def iter_records(fileobj, name, limits):
+    """按文件类型流式产出 (来源, 记录或异常)"""
+    if name.lower().endswith('.zip'):
+        yield from _iter_zip(fileobj, limits)
+        return
+    try:
+        file_type = limits.check_type(name)
+    except RecordError as exc:
+        yield name, exc
+        return
+    if file_type != 'json':
+        yield from _iter_text_file(fileobj, name, limits)
+    elif name.lower().endswith('.json'):
+        yield from _iter_json_file(fileobj, name, limits)
+    else:
+        yield from _iter_ndjson(fileobj, name, limits)
+
+
+def _iter_ndjson(fileobj, name, limits):
+    for number, line in enumerate(fileobj, 1):
+        source = f'{name}:{number}'
+        if not line.strip():
+            continue
+        try:
+            limits.check_size(len(line))
+            record = json.loads(line)
+        except RecordError as exc:
+            yield source, exc
+            continue
+        except ValueError as exc:
+            yield source, RecordError(f'Invalid JSON: {exc}')
+            continue
+        yield source, record
+
+
+def _iter_json_file(fileobj, name, limits):
+    data = fileobj.read(limits.max_bytes + 1)
+    try:
+        limits.check_size(len(data))
+        document = json.loads(_decode(data))
+    except RecordError as exc:
+        yield name, exc
+        return
+    except ValueError as exc:
+        yield name, RecordError(f'Invalid JSON: {exc}')
+        return
+    if isinstance(document, list):
+        for index, record in enumerate(document, 1):
+            yield f'{name}#{index}', record
+    else:
+        yield name, document
+
+
+def _iter_text_file(fileobj, name, limits):
+    data = fileobj.read(limits.max_bytes + 1)
+    try:
+        limits.check_size(len(data))
+        text = _decode(data)
+    except RecordError as exc:
+        yield name, exc
+        return
+    title = os.path.splitext(os.path.basename(name))[0]
+    yield name, {'title': title, 'content': text}
+
+
+def _iter_zip(fileobj, limits):
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile:
+        yield 'archive', RecordError('Invalid zip archive')
+        return
+    with archive:
+        for info in archive.infolist():
+            if info.is_dir() or os.path.basename(info.filename).startswith('.'):
+                continue
+            try:
+                limits.check_type(info.filename)
+                limits.check_size(info.file_size)
+            except RecordError as exc:
+                yield info.filename, exc
+                continue
+            with archive.open(info) as member:
+                yield from iter_records(member, info.filename, limits)
+
+
+def _decode(data):
+    try:
+        return data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise RecordError('File is not valid UTF-8 text')
+
+
+def clean_record(record, default_sharing_mode):
+    """校验单条记录，返回规范化后的 dict"""
+    if not isinstance(record, dict):
+        raise RecordError('Record must be a JSON object')
+    title = record.get('title')
+    content = record.get('content')
+    if not isinstance(title, str) or not title.strip():
+        raise RecordError('title is required')
+    if len(title) > Prompt._meta.get_field('title').max_length:
+        raise RecordError('title is too long')
+    if not isinstance(content, str) or not content.strip():
+        raise RecordError('content is required')
+
+    sharing_mode = record.get('sharing_mode') or default_sharing_mode
+    if sharing_mode not in SHARING_MODES:
+        raise RecordError(f'Invalid sharing_mode "{sharing_mode}"')
+
+    tags = record.get('tags') or []
+    if isinstance(tags, str):
+        tags = tags.split(',')
+    if not isinstance(tags, list) or not all(isinstance(tag, str) for tag in tags):
+        raise RecordError('tags must be a list of tag names')
+    tag_names = list(dict.fromkeys(tag.strip() for tag in tags if tag.strip()))
+    if any(len(tag) > Tag._meta.get_field('name').max_length for tag in tag_names):
+        raise RecordError('tag name is too long')
+
+    commit_message = record.get('commit_message') or 'Imported'
+    if not isinstance(commit_message, str):
+        raise RecordError('commit_message must be a string')
+
+    return {
+        'title': title.strip(),
+        'content': content,
+        'sharing_mode': sharing_mode,
+        'tags': tag_names or [DEFAULT_TAG],
+        'commit_message': commit_message[:PromptVersion._meta.get_field('commit_message').max_length],
+    }
+
+
+def resolve_tags(names):
+    """按名称批量获取标签，不存在的一并创建，返回 {name: id}"""
+    names = list(names)
+    tag_ids = dict(Tag.objects.filter(name__in=names).values_list('name', 'id'))
+    missing = [name for name in names if name not in tag_ids]
+    if missing:
+        Tag.objects.bulk_create(
+            [Tag(name=name, color=DEFAULT_TAG_COLOR) if name == DEFAULT_TAG else Tag(name=name) for name in missing],
+            ignore_conflicts=True,
+        )
+        stats.adjust({'tags': len(missing)})
+        tag_ids.update(Tag.objects.filter(name__in=missing).values_list('name', 'id'))
+    return tag_ids
+
+
+def import_records(records, author, default_sharing_mode='private', batch_size=1000, result=None):
+    """导入 (来源, 记录) 序列，返回 ImportResult"""
+    result = result or ImportResult()
+    records = iter(records)
+    while batch := list(islice(records, batch_size)):
+        cleaned = []
+        for source, record in batch:
+            if isinstance(record, Exception):
+                result.add_error(source, str(record))
+                continue
+            try:
+                cleaned.append((source, clean_record(record, default_sharing_mode)))
+            except RecordError as exc:
+                result.add_error(source, str(exc))
+        if not cleaned:
+            continue
+        try:
+            with transaction.atomic():
+                _write_batch([record for _, record in cleaned], author)
+        except DatabaseError as exc:
+            for source, _ in cleaned:
+                result.add_error(source, f'Database error: {exc}')
+            continue
+        result.created += len(cleaned)
+    return result
+
+
+def _write_batch(records, author):
+    tag_ids = resolve_tags({name for record in records for name in record['tags']})
+    hashes = ContentBlob.objects.intern_many([record['content'] for record in records])
+
+    prompts = []
+    for record, digest in zip(records, hashes):
+        prompt = Prompt(
+            title=record['title'], content_blob_id=digest, author=author,
+            sharing_mode=record['sharing_mode'], version_count=1,
+        )
+        # 正文已写入 blob，缓存文本供索引使用
+        prompt.__dict__['_content_blob_text'] = record['content']
+        prompts.append(prompt)
+    Prompt.objects.bulk_create(prompts, batch_size=500)
+
+    # 版本与关联表行数多且字段简单，直接 executemany 以绕开模型实例化开销
+    created_at = PromptVersion._meta.get_field('created_at').get_db_prep_value(timezone.now(), connection)
+    _bulk_insert(
+        PromptVersion,
+        ('prompt_id', 'version_number', 'content_blob_id', 'is_delta', 'delta', 'author_id', 'created_at', 'commit_message'),
+        [
+            (prompt.pk, 1, prompt.content_blob_id, False, '', author.pk, created_at, record['commit_message'])
+            for prompt, record in zip(prompts, records)
+        ],
+    )
+    links = [
+        (prompt.pk, tag_ids[name])
+        for prompt, record in zip(prompts, records)
+        for name in record['tags']
+    ]
+    finish_new_prompts(
+        prompts, links, {prompt.pk: record['tags'] for prompt, record in zip(prompts, records)}, len(prompts)
+    )
+
+
+def finish_new_prompts(prompts, links, tag_names, version_count):
+    """bulk_create 写入提示词与版本之后的收尾，导入与 generate_dataset 共用
+
+    head_version 指向版本号等于 Prompt.version_count 的版本；写入 links [(提示词 id, 标签 id)]，
+    并更新标签计数、管理统计、搜索索引（tag_names 为 {提示词 id: [标签名]}）与响应缓存代号。
+    version_count 为本批新写入的版本总数。
+    """
+    prompt_ids = [prompt.pk for prompt in prompts]
+    for start in range(0, len(prompt_ids), 500):
+        Prompt.objects.filter(pk__in=prompt_ids[start:start + 500]).update(
+            head_version=Subquery(
+                PromptVersion.objects.filter(
+                    prompt=OuterRef('pk'), version_number=OuterRef('version_count')
+                ).values('pk')[:1]
+            )
+        )
+
+    # 直接写关联表不会触发 m2m_changed，计数器在这里一并更新
+    _bulk_insert(Prompt.tags.through, ('prompt_id', 'tag_id'), links)
+    sharing = {prompt.pk: (prompt.sharing_mode, prompt.author_id) for prompt in prompts}
+    tag_counts.adjust_links((tag_id, *sharing[prompt_id]) for prompt_id, tag_id in links)
+
+    stats.adjust({
+        'prompts': len(prompts),
+        'versions': version_count,
+        **Counter(stats.sharing_metric(prompt.sharing_mode) for prompt in prompts),
+    })
+
+    search.index_new_prompts(prompts, tag_names)
+    response_cache.bump_generation()
+
+
+def _bulk_insert(model, columns, rows):
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        connection.ops.quote_name(model._meta.db_table),
+        ', '.join(connection.ops.quote_name(column) for column in columns),
+        ', '.join(['%s'] * len(columns)),
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
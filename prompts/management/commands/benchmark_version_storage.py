@@ -0,0 +1,100 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from prompts.models import ContentBlob, Prompt, PromptVersion
+from users.models import User
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = '测量长版本历史在增量存储下的占用空间与还原延迟（数据在事务中生成并回滚）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--versions', type=int, default=500, help='生成的版本数')
+        parser.add_argument('--size', type=int, default=20000, help='提示词正文的大致字节数')
+        parser.add_argument('--interval', type=int, action='append', help='检查点间隔，可多次指定')
+        parser.add_argument('--samples', type=int, default=50, help='随机抽样还原的版本数')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        intervals = options['interval'] or [1, 10, 50]
+        contents = self.generate_history(options['versions'], options['size'], options['seed'])
+        raw_bytes = sum(len(content.encode('utf-8')) for content in contents)
+        self.stdout.write(f"{len(contents)} 个版本，原始内容共 {raw_bytes / 1024:.1f} KB")
+
+        for interval in intervals:
+            try:
+                with transaction.atomic(), override_settings(PROMPT_VERSION_CHECKPOINT_INTERVAL=interval):
+                    self.run_case(interval, contents, raw_bytes, options)
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def generate_history(self, count, size, seed):
+        """模拟逐步编辑：每个版本改写、插入或删除少量句子"""
+        rng = random.Random(seed)
+        sentences = [f'Instruction {i}: respond concisely and cite sources where possible. ' for i in range(size // 70 + 1)]
+        contents = []
+        for version in range(count):
+            for _ in range(rng.randint(1, 3)):
+                action = rng.random()
+                position = rng.randrange(len(sentences))
+                if action < 0.6:
+                    sentences[position] = f'Revised rule {version}-{position}: keep answers under {rng.randint(50, 500)} words. '
+                elif action < 0.8:
+                    sentences.insert(position, f'New rule {version}: always explain assumptions.\n')
+                elif len(sentences) > 1:
+                    del sentences[position]
+            contents.append(''.join(sentences))
+        return contents
+
+    def run_case(self, interval, contents, raw_bytes, options):
+        user = User.objects.create_user(username=f'benchmark-{time.monotonic_ns()}')
+        prompt = Prompt.objects.create(title='benchmark', content=contents[0], author=user)
+
+        started = time.perf_counter()
+        for content in contents:
+            prompt.commit_version(content=content, author=user)
+        write_seconds = time.perf_counter() - started
+
+        stored = PromptVersion.objects.filter(prompt=prompt).values_list('content_blob', 'delta', 'is_delta')
+        blob_bytes = sum(
+            len(data) for data in ContentBlob.objects.filter(
+                hash__in={digest for digest, _, _ in stored if digest}
+            ).values_list('data', flat=True)
+        )
+        stored_bytes = blob_bytes + sum(len(delta.encode('utf-8')) for _, delta, _ in stored)
+        delta_rows = sum(1 for _, _, is_delta in stored if is_delta)
+
+        rng = random.Random(options['seed'])
+        numbers = [rng.randint(1, len(contents)) for _ in range(options['samples'])]
+        timings = []
+        for number in numbers:
+            version = PromptVersion.objects.get(prompt=prompt, version_number=number)
+            started = time.perf_counter()
+            content = version.get_content()
+            timings.append((time.perf_counter() - started) * 1000)
+            if content != contents[number - 1]:
+                raise AssertionError(f'版本 {number} 还原结果不一致')
+
+        page = list(PromptVersion.objects.filter(prompt=prompt).order_by('version_number')[:20])
+        started = time.perf_counter()
+        PromptVersion.load_contents(page)
+        page_ms = (time.perf_counter() - started) * 1000
+
+        self.stdout.write(self.style.SUCCESS(f'检查点间隔 {interval}:'))
+        self.stdout.write(
+            f'  存储 {stored_bytes / 1024:.1f} KB（原始的 {stored_bytes / raw_bytes:.1%}），'
+            f'增量版本 {delta_rows}/{len(contents)}，写入耗时 {write_seconds:.2f}s'
+        )
+        self.stdout.write(
+            f'  单版本还原 p50 {statistics.median(timings):.2f}ms，最大 {max(timings):.2f}ms；'
+            f'最旧 20 个版本整页还原 {page_ms:.2f}ms'
+        )
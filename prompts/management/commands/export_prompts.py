@@ -0,0 +1,41 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from prompts import exporter
+
+class Command(BaseCommand):
+    help = '以 NDJSON 流式导出全部提示词（可选附带版本历史、gzip 压缩）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', default='-', help='输出文件，默认输出到标准输出')
+        parser.add_argument('--history', action='store_true', help='附带完整版本历史')
+        parser.add_argument('--gzip', action='store_true', help='以 gzip 压缩输出')
+        parser.add_argument('--tag', type=int, help='只导出该标签 id 下的提示词')
+        parser.add_argument('--author', help='只导出该用户名的提示词')
+        parser.add_argument('--updated-after', help='只导出在该时间及之后更新的提示词（ISO 日期或时间）')
+        parser.add_argument('--updated-before', help='只导出在该时间之前更新的提示词（ISO 日期或时间）')
+
+    def handle(self, *args, **options):
+        try:
+            updated_after = options['updated_after'] and exporter.parse_timestamp(options['updated_after'])
+            updated_before = options['updated_before'] and exporter.parse_timestamp(options['updated_before'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        prompts = exporter.export_queryset(
+            tag_id=options['tag'], author=options['author'],
+            updated_after=updated_after, updated_before=updated_before,
+        )
+        stream = exporter.iter_ndjson(exporter.iter_records(prompts, include_history=options['history']))
+        if options['gzip']:
+            stream = exporter.gzip_stream(stream)
+
+        output = sys.stdout.buffer if options['output'] == '-' else open(options['output'], 'wb')
+        try:
+            for chunk in stream:
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+        if options['output'] != '-':
+            self.stdout.write(self.style.SUCCESS(f"导出完成: {options['output']}"))
@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from prompts.models import ContentBlob, Prompt, PromptVersion
+
+class Command(BaseCommand):
+    help = '删除不再被提示词或版本引用的正文 blob'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', type=int, default=60,
+            help='只删除创建超过该分钟数的 blob，避免误删刚写入、尚未被引用的正文'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='只统计不删除')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(minutes=options['min_age'])
+        orphans = ContentBlob.objects.filter(created_at__lt=cutoff).exclude(
+            hash__in=Prompt.objects.values('content_blob')
+        ).exclude(
+            hash__in=PromptVersion.objects.filter(content_blob__isnull=False).values('content_blob')
+        )
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'发现 {orphans.count()} 个未引用的 blob。'))
+            return
+
+        deleted, _ = orphans.delete()
+        self.stdout.write(self.style.SUCCESS(f'清理完成! 删除了 {deleted} 个未引用的 blob。'))
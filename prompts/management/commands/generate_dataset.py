@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+from prompts.dataset import DatasetGenerator
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = '批量生成合成数据（用户、热门/冷门标签、带长版本历史的提示词），用于压测与基准测试'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100, help='用户数，第一个用户为管理员')
+        parser.add_argument('--prompts', type=int, default=1000, help='提示词数')
+        parser.add_argument('--versions', type=float, default=5, help='每个提示词的平均版本数')
+        parser.add_argument('--max-versions', type=int, default=200, help='单个提示词的最大版本数')
+        parser.add_argument('--tags', type=int, default=50, help='标签数')
+        parser.add_argument('--tags-per-prompt', type=int, default=3, help='每个提示词的最大标签数')
+        parser.add_argument('--skew', type=float, default=1.1, help='作者与标签分布的 Zipf 指数，越大越集中')
+        parser.add_argument('--team-ratio', type=float, default=0.5, help='团队共享提示词的比例')
+        parser.add_argument('--content-length', type=int, default=800, help='正文的平均字符数')
+        parser.add_argument('--password', default='password', help='所有生成用户的密码')
+        parser.add_argument('--prefix', default='bench', help='用户名与标签名前缀')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=1000, help='每个事务写入的提示词数')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}-user-').exists():
+            raise CommandError(f'Users with prefix "{prefix}" already exist, use another --prefix')
+        if options['users'] < 1:
+            raise CommandError('--users must be at least 1')
+
+        generator = DatasetGenerator(
+            users=options['users'],
+            prompts=options['prompts'],
+            mean_versions=options['versions'],
+            max_versions=options['max_versions'],
+            tags=options['tags'],
+            max_tags_per_prompt=options['tags_per_prompt'],
+            skew=options['skew'],
+            team_ratio=options['team_ratio'],
+            content_length=options['content_length'],
+            password=options['password'],
+            prefix=prefix,
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            log=self.stdout.write,
+        )
+        counts = generator.generate()
+        self.stdout.write(self.style.SUCCESS(
+            f"生成完成! {counts['users']} 个用户，{counts['tags']} 个标签，{counts['prompts']} 个提示词，"
+            f"{counts['versions']} 个版本（其中 {counts['delta_versions']} 个增量存储），用时 {counts['seconds']} 秒。"
+            f" 管理员: {prefix}-user-0"
+        ))
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from prompts import importer
+from users.models import User
+
+class Command(BaseCommand):
+    help = '从 NDJSON、.txt/.md/.json 文件或 zip 压缩包批量导入提示词'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='要导入的文件')
+        parser.add_argument('--user', required=True, help='提示词作者的用户名')
+        parser.add_argument('--sharing-mode', default='private', choices=sorted(importer.SHARING_MODES),
+                            help='记录未指定 sharing_mode 时使用的共享模式')
+        parser.add_argument('--batch-size', type=int, default=1000, help='每个事务写入的记录数')
+
+    def handle(self, *args, **options):
+        try:
+            author = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"用户 {options['user']} 不存在")
+
+        started = time.perf_counter()
+        with open(options['path'], 'rb') as fileobj:
+            records = importer.iter_records(fileobj, options['path'], importer.ImportLimits())
+            result = importer.import_records(
+                records, author, default_sharing_mode=options['sharing_mode'], batch_size=options['batch_size']
+            )
+
+        for error in result.errors:
+            self.stderr.write(f"{error['source']}: {error['error']}")
+        if result.failed > len(result.errors):
+            self.stderr.write(f'……另有 {result.failed - len(result.errors)} 条错误未显示')
+        self.stdout.write(self.style.SUCCESS(
+            f'导入完成! 成功 {result.created} 条，失败 {result.failed} 条，'
+            f'耗时 {time.perf_counter() - started:.1f}s'
+        ))
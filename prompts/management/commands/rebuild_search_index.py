@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from prompts import search
+
+class Command(BaseCommand):
+    help = '离线重建提示词全文检索索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='每批处理的提示词数量')
+
+    def handle(self, *args, **options):
+        total = search.rebuild_index(batch_size=options['batch_size'], stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f'索引重建完成，共索引 {total} 个提示词。'))
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from prompts import tag_counts
+
+class Command(BaseCommand):
+    help = '根据提示词与标签的关联全量重算标签计数'
+
+    def handle(self, *args, **options):
+        total = tag_counts.recount()
+        self.stdout.write(self.style.SUCCESS(f'重算完成! 共更新 {total} 个标签的计数。'))
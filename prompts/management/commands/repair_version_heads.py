@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery
+from prompts.models import Prompt, PromptVersion
+
+class Command(BaseCommand):
+    help = '根据版本表修复提示词的 head_version 与 version_count'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='每批处理的提示词数量')
+        parser.add_argument('--dry-run', action='store_true', help='只报告不一致的记录，不写入')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        checked = 0
+        repaired = 0
+        last_pk = 0
+
+        while True:
+            batch = list(
+                Prompt.objects.filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', 'head_version_id', 'version_count')[:batch_size]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+            pks = [row[0] for row in batch]
+
+            counts = dict(
+                PromptVersion.objects.filter(prompt_id__in=pks).order_by().values('prompt_id')
+                .annotate(count=Count('pk')).values_list('prompt_id', 'count')
+            )
+            heads = dict(
+                PromptVersion.objects.filter(
+                    prompt_id__in=pks,
+                    version_number=Subquery(
+                        PromptVersion.objects.filter(prompt=OuterRef('prompt'))
+                        .order_by('-version_number').values('version_number')[:1]
+                    ),
+                ).values_list('prompt_id', 'pk')
+            )
+
+            stale = [
+                Prompt(pk=pk, head_version_id=heads.get(pk), version_count=counts.get(pk, 0))
+                for pk, head_id, count in batch
+                if head_id != heads.get(pk) or count != counts.get(pk, 0)
+            ]
+            for prompt in stale:
+                self.stdout.write(
+                    self.style.WARNING(f'不一致: prompt {prompt.pk} -> head {prompt.head_version_id}, {prompt.version_count} 个版本')
+                )
+            if stale and not options['dry_run']:
+                Prompt.objects.bulk_update(stale, ['head_version', 'version_count'])
+
+            checked += len(batch)
+            repaired += len(stale)
+
+        action = '发现' if options['dry_run'] else '修复了'
+        self.stdout.write(self.style.SUCCESS(f'检查完成! 共检查 {checked} 个提示词，{action} {repaired} 个不一致的记录。'))
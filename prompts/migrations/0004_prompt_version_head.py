@@ -0,0 +1,56 @@
+# Generated by Django 5.2.4 on 2026-10-18 05:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+
+
+def backfill_version_heads(apps, schema_editor):
+    Prompt = apps.get_model('prompts', 'Prompt')
+    PromptVersion = apps.get_model('prompts', 'PromptVersion')
+    last_pk = 0
+    while True:
+        batch = list(
+            Prompt.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:1000]
+        )
+        if not batch:
+            break
+        last_pk = batch[-1]
+        counts = dict(
+            PromptVersion.objects.filter(prompt_id__in=batch).order_by().values('prompt_id')
+            .annotate(count=Count('pk')).values_list('prompt_id', 'count')
+        )
+        heads = dict(
+            PromptVersion.objects.filter(
+                prompt_id__in=batch,
+                version_number=Subquery(
+                    PromptVersion.objects.filter(prompt=OuterRef('prompt'))
+                    .order_by('-version_number').values('version_number')[:1]
+                ),
+            ).values_list('prompt_id', 'pk')
+        )
+        Prompt.objects.bulk_update(
+            [Prompt(pk=pk, head_version_id=heads.get(pk), version_count=counts.get(pk, 0)) for pk in batch],
+            ['head_version', 'version_count'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prompts', '0003_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prompt',
+            name='head_version',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='prompts.promptversion'),
+        ),
+        migrations.AddField(
+            model_name='prompt',
+            name='version_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_version_heads, migrations.RunPython.noop),
+    ]
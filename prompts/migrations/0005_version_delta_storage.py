@@ -0,0 +1,95 @@
+# Generated by Django 5.2.4 on 2026-10-18 05:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+from prompts.delta import apply_delta, make_delta
+
+
+def _iter_prompt_ids(Prompt, batch_size=500):
+    last_pk = 0
+    while True:
+        batch = list(Prompt.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            return
+        last_pk = batch[-1]
+        yield from batch
+
+
+def convert_to_deltas(apps, schema_editor):
+    Prompt = apps.get_model('prompts', 'Prompt')
+    PromptVersion = apps.get_model('prompts', 'PromptVersion')
+    interval = settings.PROMPT_VERSION_CHECKPOINT_INTERVAL
+    if interval <= 1:
+        return
+
+    pending = []
+    for prompt_id in _iter_prompt_ids(Prompt):
+        newer = None
+        versions = PromptVersion.objects.filter(prompt_id=prompt_id).order_by('-version_number').values_list(
+            'pk', 'version_number', 'content'
+        )
+        for pk, version_number, content in versions.iterator(chunk_size=100):
+            if (
+                newer is not None
+                and newer[0] == version_number + 1
+                and version_number % interval != 0
+            ):
+                delta = make_delta(newer[1], content)
+                if len(delta) < len(content):
+                    pending.append(PromptVersion(pk=pk, content='', delta=delta, is_delta=True))
+            newer = (version_number, content)
+            if len(pending) >= 500:
+                PromptVersion.objects.bulk_update(pending, ['content', 'delta', 'is_delta'])
+                pending = []
+    if pending:
+        PromptVersion.objects.bulk_update(pending, ['content', 'delta', 'is_delta'])
+
+
+def restore_full_contents(apps, schema_editor):
+    Prompt = apps.get_model('prompts', 'Prompt')
+    PromptVersion = apps.get_model('prompts', 'PromptVersion')
+
+    pending = []
+    for prompt_id in _iter_prompt_ids(Prompt):
+        current = None
+        versions = PromptVersion.objects.filter(prompt_id=prompt_id).order_by('-version_number').values_list(
+            'pk', 'is_delta', 'content', 'delta'
+        )
+        for pk, is_delta, content, delta in versions.iterator(chunk_size=100):
+            if is_delta:
+                current = apply_delta(current, delta)
+                pending.append(PromptVersion(pk=pk, content=current, delta='', is_delta=False))
+            else:
+                current = content
+            if len(pending) >= 500:
+                PromptVersion.objects.bulk_update(pending, ['content', 'delta', 'is_delta'])
+                pending = []
+    if pending:
+        PromptVersion.objects.bulk_update(pending, ['content', 'delta', 'is_delta'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prompts', '0004_prompt_version_head'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promptversion',
+            name='delta',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='promptversion',
+            name='is_delta',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='promptversion',
+            name='content',
+            field=models.TextField(blank=True),
+        ),
+        migrations.RunPython(convert_to_deltas, restore_full_contents),
+    ]
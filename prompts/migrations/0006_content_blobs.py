@@ -0,0 +1,111 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+from prompts import blobs
+
+
+def _batches(queryset, batch_size=1000):
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+        if not batch:
+            return
+        last_pk = batch[-1].pk
+        yield batch
+
+
+def _intern(ContentBlob, texts):
+    hashes = [blobs.content_hash(text) for text in texts]
+    new = {}
+    for digest, text in zip(hashes, texts):
+        if digest not in new:
+            codec, data = blobs.encode(text)
+            new[digest] = ContentBlob(hash=digest, codec=codec, data=data, size=len(text.encode('utf-8')))
+    ContentBlob.objects.bulk_create(new.values(), ignore_conflicts=True, batch_size=500)
+    return hashes
+
+
+def move_content_to_blobs(apps, schema_editor):
+    ContentBlob = apps.get_model('prompts', 'ContentBlob')
+    Prompt = apps.get_model('prompts', 'Prompt')
+    PromptVersion = apps.get_model('prompts', 'PromptVersion')
+
+    for batch in _batches(Prompt.objects.only('pk', 'content')):
+        hashes = _intern(ContentBlob, [prompt.content for prompt in batch])
+        for prompt, digest in zip(batch, hashes):
+            prompt.content_blob_id = digest
+        Prompt.objects.bulk_update(batch, ['content_blob'])
+
+    # 增量存储的版本没有完整正文，不需要 blob
+    for batch in _batches(PromptVersion.objects.filter(is_delta=False).only('pk', 'content')):
+        hashes = _intern(ContentBlob, [version.content for version in batch])
+        for version, digest in zip(batch, hashes):
+            version.content_blob_id = digest
+        PromptVersion.objects.bulk_update(batch, ['content_blob'])
+
+
+def move_content_from_blobs(apps, schema_editor):
+    Prompt = apps.get_model('prompts', 'Prompt')
+    PromptVersion = apps.get_model('prompts', 'PromptVersion')
+
+    for model in (Prompt, PromptVersion):
+        queryset = model.objects.filter(content_blob__isnull=False).select_related('content_blob')
+        for batch in _batches(queryset):
+            for obj in batch:
+                obj.content = blobs.decode(obj.content_blob.codec, obj.content_blob.data)
+            model.objects.bulk_update(batch, ['content'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prompts', '0005_version_delta_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContentBlob',
+            fields=[
+                ('hash', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('codec', models.CharField(default='none', max_length=8)),
+                ('data', models.BinaryField()),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='prompt',
+            name='content_blob',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='prompts.contentblob'),
+        ),
+        migrations.AddField(
+            model_name='promptversion',
+            name='content_blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='prompts.contentblob'),
+        ),
+        migrations.RunPython(move_content_to_blobs, move_content_from_blobs),
+        # 先补上默认值，回滚时重新添加的 content 列才能容纳已有行
+        migrations.AlterField(
+            model_name='prompt',
+            name='content',
+            field=models.TextField(default=''),
+        ),
+        migrations.AlterField(
+            model_name='promptversion',
+            name='content',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.RemoveField(
+            model_name='prompt',
+            name='content',
+        ),
+        migrations.RemoveField(
+            model_name='promptversion',
+            name='content',
+        ),
+        migrations.AlterField(
+            model_name='prompt',
+            name='content_blob',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='prompts.contentblob'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.4 on 2026-10-18 05:50
+
+from collections import Counter
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_tag_counts(apps, schema_editor):
+    Prompt = apps.get_model('prompts', 'Prompt')
+    Tag = apps.get_model('prompts', 'Tag')
+    TagPrivateCount = apps.get_model('prompts', 'TagPrivateCount')
+    links = Prompt.tags.through.objects.order_by()
+
+    team = dict(
+        links.filter(prompt__sharing_mode='team').values('tag_id')
+        .annotate(count=Count('pk')).values_list('tag_id', 'count')
+    )
+    private_totals = Counter()
+    rows = []
+    private = links.exclude(prompt__sharing_mode='team').values('tag_id', 'prompt__author_id').annotate(count=Count('pk'))
+    for row in private.iterator():
+        private_totals[row['tag_id']] += row['count']
+        rows.append(TagPrivateCount(tag_id=row['tag_id'], author_id=row['prompt__author_id'], count=row['count']))
+    TagPrivateCount.objects.bulk_create(rows, batch_size=1000)
+
+    tags = list(Tag.objects.only('pk'))
+    for tag in tags:
+        tag.team_prompt_count = team.get(tag.pk, 0)
+        tag.private_prompt_count = private_totals.get(tag.pk, 0)
+    Tag.objects.bulk_update(tags, ['team_prompt_count', 'private_prompt_count'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prompts', '0006_content_blobs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='private_prompt_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='team_prompt_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='TagPrivateCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.IntegerField(default=0)),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='private_counts', to='prompts.tag')),
+            ],
+            options={
+                'unique_together': {('tag', 'author')},
+            },
+        ),
+        migrations.RunPython(backfill_tag_counts, migrations.RunPython.noop),
+    ]
@@ -1,32 +1,142 @@
-from django.db import models
+from collections import defaultdict
+from django.db import models, transaction
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.conf import settings
 from django.utils import timezone
+from . import blobs
+from .delta import apply_delta, make_delta
+
+class TagQuerySet(models.QuerySet):
+    def with_visible_counts(self, user):
+        """注解 prompt_count：该用户可见的提示词数量，来自维护的计数器而非 COUNT"""
+        if user.role == 'admin':
+            return self.annotate(prompt_count=F('team_prompt_count') + F('private_prompt_count'))
+        own_private = TagPrivateCount.objects.filter(tag=OuterRef('pk'), author=user).values('count')[:1]
+        return self.annotate(
+            prompt_count=F('team_prompt_count') + Coalesce(Subquery(own_private), 0)
+        )
 
 class Tag(models.Model):
     name = models.CharField(max_length=50, unique=True)
     color = models.CharField(max_length=7, default='#1976d2')  # 默认颜色
     created_at = models.DateTimeField(auto_now_add=True)
+    # 计数器变化时也会更新，用于条件请求的校验值
+    updated_at = models.DateTimeField(auto_now=True)
+    # 由 prompts.tag_counts 维护的计数器
+    team_prompt_count = models.PositiveIntegerField(default=0)
+    private_prompt_count = models.PositiveIntegerField(default=0)
+    
+    objects = TagQuerySet.as_manager()
     
     class Meta:
         ordering = ['name']
     
     def __str__(self):
         return self.name
+    
+    def visible_prompt_count(self, user):
+        """该用户在此标签下可见的提示词数量"""
+        if user.role == 'admin':
+            return self.team_prompt_count + self.private_prompt_count
+        own_private = TagPrivateCount.objects.filter(tag=self, author=user).values_list('count', flat=True).first()
+        return self.team_prompt_count + (own_private or 0)
+
+class TagPrivateCount(models.Model):
+    """每个作者在某标签下的私有提示词数量"""
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='private_counts')
+    author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    count = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['tag', 'author']
+
+class ContentBlobManager(models.Manager):
+    def intern(self, text):
+        """保存正文（已存在则复用），返回其哈希"""
+        return self.intern_many([text])[0]
+    
+    def intern_many(self, texts):
+        """批量保存正文，返回与 texts 一一对应的哈希列表"""
+        hashes = [blobs.content_hash(text) for text in texts]
+        new = {}
+        for digest, text in zip(hashes, texts):
+            if digest not in new:
+                codec, data = blobs.encode(text)
+                new[digest] = ContentBlob(hash=digest, codec=codec, data=data, size=len(text.encode('utf-8')))
+        self.bulk_create(new.values(), ignore_conflicts=True, batch_size=500)
+        return hashes
+
+class ContentBlob(models.Model):
+    """按 sha256 去重保存的正文，较大的正文压缩保存"""
+    hash = models.CharField(max_length=64, primary_key=True)
+    codec = models.CharField(max_length=8, default=blobs.CODEC_NONE)
+    data = models.BinaryField()
+    size = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    objects = ContentBlobManager()
+    
+    @property
+    def text(self):
+        return blobs.decode(self.codec, self.data)
+
+def blob_text_property(field_name):
+    """以文本形式读写 blob 外键的属性：读取时才解压，保存模型时才写入 blob"""
+    cache_name = f'_{field_name}_text'
+    
+    def getter(self):
+        if cache_name not in self.__dict__:
+            blob = getattr(self, field_name)
+            self.__dict__[cache_name] = blob.text if blob is not None else ''
+        return self.__dict__[cache_name]
+    
+    def setter(self, value):
+        self.__dict__[cache_name] = value
+        self._dirty_blob_fields = getattr(self, '_dirty_blob_fields', set()) | {field_name}
+    
+    return property(getter, setter)
+
+class BlobContentMixin:
+    blob_text_fields = {}
+    
+    def save(self, *args, **kwargs):
+        for field_name in getattr(self, '_dirty_blob_fields', ()):
+            text = getattr(self, self.blob_text_fields[field_name])
+            setattr(self, f'{field_name}_id', ContentBlob.objects.intern(text))
+        self._dirty_blob_fields = set()
+        super().save(*args, **kwargs)
 
-class Prompt(models.Model):
+class PromptQuerySet(models.QuerySet):
+    def for_listing(self):
+        """预取列表/详情序列化所需的关联数据，避免逐行查询"""
+        return self.select_related(
+            'author', 'content_blob', 'head_version__author', 'head_version__content_blob'
+        ).prefetch_related('tags')
+
+class Prompt(BlobContentMixin, models.Model):
     SHARING_CHOICES = [
         ('private', 'Private'),
         ('team', 'Team Shared'),
     ]
     
     title = models.CharField(max_length=255)
-    content = models.TextField()
+    content_blob = models.ForeignKey(ContentBlob, on_delete=models.PROTECT, related_name='+')
+    content = blob_text_property('content_blob')
+    blob_text_fields = {'content_blob': 'content'}
     author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='prompts')
     sharing_mode = models.CharField(max_length=10, choices=SHARING_CHOICES, default='private')
     tags = models.ManyToManyField(Tag, blank=True, related_name='prompts')
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # 冗余维护的最新版本指针与版本数，由 commit_version() 在事务内更新
+    head_version = models.ForeignKey(
+        'PromptVersion', on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    version_count = models.PositiveIntegerField(default=0)
+    
+    objects = PromptQuerySet.as_manager()
     
     class Meta:
         ordering = ['-updated_at']
@@ -37,13 +147,68 @@ class Prompt(models.Model):
     @property
     def latest_version(self):
         """获取最新版本"""
-        return self.versions.first()  # 由于版本按 version_number 降序排列
+        return self.head_version
+    
+    def recover_head(self):
+        """head_version 为空时按现有版本行返回 (最新版本, 版本数)，避免新版本号与现有版本冲突"""
+        head = self.versions.select_related('content_blob').order_by('-version_number').first()
+        return head, self.versions.count()
+    
+    def commit_version(self, content, author, commit_message=''):
+        """追加新版本，并在同一事务中更新 head_version 与 version_count"""
+        with transaction.atomic():
+            locked = Prompt.objects.select_for_update(of=('self',)).select_related(
+                'head_version'
+            ).get(pk=self.pk)
+            head = locked.head_version
+            version_count = locked.version_count
+            if head is None:
+                head, version_count = locked.recover_head()
+            # 新版本完整存储；非检查点的旧 head 改为相对新版本的反向增量
+            if head and head.should_store_as_delta():
+                head.store_as_delta(content)
+            version = PromptVersion.objects.create(
+                prompt=self,
+                version_number=(head.version_number + 1) if head else 1,
+                content=content,
+                author=author,
+                commit_message=commit_message,
+            )
+            version_count += 1
+            # update() 不会触发 auto_now，显式更新 updated_at，使依赖它的缓存失效
+            updated_at = timezone.now()
+            Prompt.objects.filter(pk=self.pk).update(
+                head_version=version, version_count=version_count, updated_at=updated_at
+            )
+        self.head_version = version
+        self.version_count = version_count
+        self.updated_at = updated_at
+        return version
+
+class BrokenVersionChain(Exception):
+    """增量版本所依赖的下一版本缺失，无法还原内容"""
+    
+    def __init__(self, prompt_id, version_number):
+        super().__init__(
+            f'Cannot reconstruct version {version_number} of prompt {prompt_id}: '
+            f'the version its delta is based on is missing'
+        )
+        self.prompt_id = prompt_id
+        self.version_number = version_number
 
-class PromptVersion(models.Model):
+class PromptVersion(BlobContentMixin, models.Model):
     prompt = models.ForeignKey(Prompt, on_delete=models.CASCADE, related_name='versions')
     version_number = models.PositiveIntegerField()
-    content = models.TextField()
-    author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # 增量存储的版本没有 content_blob，内容通过 get_content() 还原
+    content_blob = models.ForeignKey(
+        ContentBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='+'
+    )
+    content = blob_text_property('content_blob')
+    blob_text_fields = {'content_blob': 'content'}
+    is_delta = models.BooleanField(default=False)
+    delta = models.TextField(blank=True, default='')
+    # 删除用户时保留其提交的版本：版本链与 head_version 依赖这些行
+    author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     commit_message = models.CharField(max_length=500, blank=True)
     
@@ -53,3 +218,102 @@ class PromptVersion(models.Model):
     
     def __str__(self):
         return f"{self.prompt.title} v{self.version_number}"
+    
+    def get_content(self):
+        """返回版本内容，增量存储的版本按需还原"""
+        if not self.is_delta:
+            return self.content
+        if not hasattr(self, '_content'):
+            PromptVersion.load_contents([self])
+        return self._content
+    
+    def store_in_full(self):
+        """将增量存储的版本改为完整存储，删除它所依赖的下一版本之前调用"""
+        if not self.is_delta:
+            return
+        content = self.get_content()
+        digest = ContentBlob.objects.intern(content)
+        PromptVersion.objects.filter(pk=self.pk).update(content_blob_id=digest, delta='', is_delta=False)
+        self.content_blob_id = digest
+        self.__dict__['_content_blob_text'] = content
+        self.delta = ''
+        self.is_delta = False
+    
+    def should_store_as_delta(self):
+        """有了更新的版本后，该版本是否应改为增量存储（检查点版本始终完整保存）"""
+        interval = settings.PROMPT_VERSION_CHECKPOINT_INTERVAL
+        return not self.is_delta and interval > 1 and self.version_number % interval != 0
+    
+    def store_as_delta(self, newer_content, save=True):
+        """将完整存储的版本改写为相对下一版本内容的增量，增量不更小时保持原样
+
+        save=False 时只修改实例，由调用方批量写回 content_blob、delta、is_delta。
+        """
+        delta = make_delta(newer_content, self.content)
+        if len(delta) >= len(self.content):
+            return False
+        if save:
+            PromptVersion.objects.filter(pk=self.pk).update(content_blob=None, delta=delta, is_delta=True)
+        self._content = self.content
+        self.content_blob = None
+        self.__dict__['_content_blob_text'] = ''
+        self.delta = delta
+        self.is_delta = True
+        return True
+    
+    @classmethod
+    def load_contents(cls, versions):
+        """批量还原增量存储的版本内容，每个提示词只读取一段连续的版本"""
+        pending = defaultdict(dict)
+        for version in versions:
+            if version.is_delta and not hasattr(version, '_content'):
+                pending[version.prompt_id][version.version_number] = version
+        
+        for prompt_id, wanted in pending.items():
+            newest_wanted = max(wanted)
+            # 从最旧的目标版本向新版本读取，直到遇到覆盖所有目标版本之后的完整版本
+            chain = []
+            rows = cls.objects.filter(
+                prompt_id=prompt_id, version_number__gte=min(wanted)
+            ).order_by('version_number').values_list(
+                'version_number', 'is_delta', 'delta', 'content_blob__codec', 'content_blob__data'
+            )
+            for row in rows.iterator(chunk_size=64):
+                chain.append(row)
+                if row[0] >= newest_wanted and not row[1]:
+                    break
+            
+            current = newer = None
+            for version_number, is_delta, delta, codec, data in reversed(chain):
+                if not is_delta:
+                    current = blobs.decode(codec, data)
+                elif current is None or newer != version_number + 1:
+                    raise BrokenVersionChain(prompt_id, version_number)
+                else:
+                    current = apply_delta(current, delta)
+                newer = version_number
+                if version_number in wanted:
+                    wanted[version_number]._content = current
+
+class SearchTerm(models.Model):
+    """全文检索词典：每个词项及其文档频率"""
+    term = models.CharField(max_length=64, unique=True)
+    document_frequency = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        return self.term
+
+class SearchDocument(models.Model):
+    """已索引的提示词及其（加权）词项总数"""
+    prompt = models.OneToOneField(Prompt, on_delete=models.CASCADE, primary_key=True, related_name='search_document')
+    length = models.PositiveIntegerField(default=0)
+
+class SearchPosting(models.Model):
+    """倒排表：weight 为索引时计算好的 BM25 词频分量，按其降序读取"""
+    term = models.ForeignKey(SearchTerm, on_delete=models.CASCADE, related_name='postings')
+    prompt = models.ForeignKey(Prompt, on_delete=models.CASCADE, related_name='search_postings')
+    weight = models.FloatField()
+    
+    class Meta:
+        unique_together = ['term', 'prompt']
+        indexes = [models.Index(fields=['term', '-weight'], name='prompts_posting_term_weight')]
@@ -0,0 +1,83 @@
+"""提示词列表的响应缓存
+
+缓存键由 (数据代号, 可见范围, 视图, 查询参数) 组成。任何提示词、标签或用户信息的写入都会在事务提交后
+递增数据代号，旧代号下的缓存自然失效（随超时淘汰），失效代价为 O(1)，无需扫描键。
+
+可见范围：管理员共用一份；没有私有提示词的用户看到的就是团队共享集合，共用一份；
+其他用户各自一份。由系统设置 performance.cacheEnabled / performance.cacheTimeout 控制。
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+
+from api import metrics
+from api.models import SystemSetting
+from .models import Prompt
+
+GENERATION_KEY = 'prompts:generation'
+KEY_PREFIX = 'prompts:response'
+
+stats = metrics.counter('prompt_cache_events_total', 'Prompt list response and fragment cache events', label='event')
+
+
+def get_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # 用时间戳作为初始值，代号被淘汰后重新生成也不会与旧缓存重合
+        cache.add(GENERATION_KEY, time.time_ns(), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def _bump():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, time.time_ns(), None)
+
+
+def bump_generation():
+    """数据变化后调用；在事务中时推迟到提交之后"""
+    transaction.on_commit(_bump)
+
+
+def visibility_scope(user):
+    if user.role == 'admin':
+        return 'admin'
+    if not Prompt.objects.filter(author=user).exclude(sharing_mode='team').exists():
+        return 'team'
+    return f'user:{user.pk}'
+
+
+def cache_key(request, view_name):
+    params = sorted(
+        (key, value) for key, values in request.query_params.lists() for value in values
+    )
+    # 分页链接是绝对地址，主机名也需参与
+    raw = repr((request.get_host(), params))
+    digest = hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+    return f'{KEY_PREFIX}:{get_generation()}:{visibility_scope(request.user)}:{view_name}:{digest}'
+
+
+def cached_response(request, view_name, compute):
+    """返回缓存的响应数据，未命中时调用 compute() 并缓存其 200 响应"""
+    if not SystemSetting.get_bool('cacheEnabled', True):
+        return compute()
+
+    key = cache_key(request, view_name)
+    data = cache.get(key)
+    if data is not None:
+        stats['hits'] += 1
+        response = Response(data)
+        response['X-Cache'] = 'HIT'
+        return response
+
+    stats['misses'] += 1
+    response = compute()
+    if response.status_code == 200:
+        cache.set(key, response.data, SystemSetting.get_int('cacheTimeout', 3600))
+    response['X-Cache'] = 'MISS'
+    return response
@@ -0,0 +1,409 @@
+"""提示词全文检索
+
+基于数据库的倒排索引（SearchTerm / SearchPosting / SearchDocument），无需外部服务。
+- 标题、正文、标签名分词后按字段加权计入词频，CJK 文本按双字切分
+- 倒排项保存索引时算好的 BM25 词频分量，查询时按权重降序只读取前若干条
+- 最后一个查询词支持前缀匹配，较长的查询词支持编辑距离容错
+- 词项变体与倒排项各用一条查询取出，查询数不随查询词数量增长
+"""
+import math
+import re
+from collections import Counter, defaultdict
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Avg, Count, Exists, F, Q
+from django.db.models.functions import Length
+
+from .models import Prompt, SearchDocument, SearchPosting, SearchTerm
+
+K1 = 1.2
+B = 0.75
+FIELD_WEIGHTS = {'title': 3, 'tags': 2, 'content': 1}
+MAX_TERM_LENGTH = 64
+POSTINGS_PER_TERM = 1000
+PREFIX_EXPANSIONS = 10
+FUZZY_CANDIDATES = 5000
+FUZZY_EXPANSIONS = 5
+PREFIX_FACTOR = 0.8
+FUZZY_FACTOR = 0.6
+STATS_CACHE_KEY = 'prompt_search_stats'
+STATS_CACHE_TIMEOUT = 300
+
+WORD_RE = re.compile(r'[^\W_]+')
+CJK_SPLIT_RE = re.compile(r'([\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]+)')
+
+
+def tokenize(text):
+    """分词：转小写按单词切分，CJK 连续片段切成双字词"""
+    tokens = []
+    for word in WORD_RE.findall((text or '').lower()):
+        for index, part in enumerate(CJK_SPLIT_RE.split(word)):
+            if not part:
+                continue
+            if index % 2 == 1:
+                if len(part) == 1:
+                    tokens.append(part)
+                else:
+                    tokens.extend(part[i:i + 2] for i in range(len(part) - 1))
+            elif len(part) <= MAX_TERM_LENGTH:
+                tokens.append(part)
+    return tokens
+
+
+def document_terms(prompt, tag_names=None):
+    """返回提示词的加权词频 Counter"""
+    if tag_names is None:
+        tag_names = [tag.name for tag in prompt.tags.all()]
+    counts = Counter()
+    for field, text in (('title', prompt.title), ('content', prompt.content), ('tags', ' '.join(tag_names))):
+        weight = FIELD_WEIGHTS[field]
+        for token in tokenize(text):
+            counts[token] += weight
+    return counts
+
+
+def bm25_weight(frequency, length, avg_length):
+    return frequency * (K1 + 1) / (frequency + K1 * (1 - B + B * length / avg_length))
+
+
+def get_stats():
+    """返回 (文档数, 平均文档长度)，短时间缓存"""
+    stats = cache.get(STATS_CACHE_KEY)
+    if stats is None:
+        result = SearchDocument.objects.aggregate(count=Count('pk'), avg=Avg('length'))
+        stats = (result['count'] or 0, result['avg'] or 1.0)
+        cache.set(STATS_CACHE_KEY, stats, STATS_CACHE_TIMEOUT)
+    return stats
+
+
+def _ensure_terms(terms):
+    """确保词项存在，返回 {term: id}"""
+    term_ids = dict(SearchTerm.objects.filter(term__in=terms).values_list('term', 'id'))
+    missing = [term for term in terms if term not in term_ids]
+    if missing:
+        SearchTerm.objects.bulk_create(
+            [SearchTerm(term=term) for term in missing], ignore_conflicts=True, batch_size=500
+        )
+        term_ids.update(SearchTerm.objects.filter(term__in=missing).values_list('term', 'id'))
+    return term_ids
+
+
+@transaction.atomic
+def index_prompt(prompt):
+    """增量更新单个提示词的索引"""
+    counts = document_terms(prompt)
+    length = sum(counts.values())
+    _, avg_length = get_stats()
+
+    old_terms = dict(
+        SearchPosting.objects.filter(prompt=prompt).values_list('term__term', 'term_id')
+    )
+    term_ids = _ensure_terms(list(counts)) if counts else {}
+
+    removed = [term_id for term, term_id in old_terms.items() if term not in counts]
+    added = [term_ids[term] for term in counts if term not in old_terms]
+    if removed:
+        SearchTerm.objects.filter(id__in=removed).update(document_frequency=F('document_frequency') - 1)
+    if added:
+        SearchTerm.objects.filter(id__in=added).update(document_frequency=F('document_frequency') + 1)
+
+    SearchPosting.objects.filter(prompt=prompt).delete()
+    SearchPosting.objects.bulk_create([
+        SearchPosting(
+            term_id=term_ids[term], prompt=prompt,
+            weight=bm25_weight(frequency, length, avg_length),
+        )
+        for term, frequency in counts.items()
+    ], batch_size=500)
+    SearchDocument.objects.update_or_create(prompt=prompt, defaults={'length': length})
+
+
+@transaction.atomic
+def index_new_prompts(prompts, tag_names):
+    """批量索引新建的提示词（尚无索引项），tag_names 为 {prompt_id: [标签名]}"""
+    _, avg_length = get_stats()
+    terms = {}
+    document_frequency = Counter()
+    for prompt in prompts:
+        counts = document_terms(prompt, tag_names.get(prompt.pk, []))
+        terms[prompt.pk] = counts
+        document_frequency.update(counts.keys())
+    if not terms:
+        return
+
+    term_ids = {}
+    vocabulary = list(document_frequency)
+    for start in range(0, len(vocabulary), 500):
+        term_ids.update(_ensure_terms(vocabulary[start:start + 500]))
+    by_increment = defaultdict(list)
+    for term, frequency in document_frequency.items():
+        by_increment[frequency].append(term_ids[term])
+    for increment, ids in by_increment.items():
+        for start in range(0, len(ids), 500):
+            SearchTerm.objects.filter(id__in=ids[start:start + 500]).update(
+                document_frequency=F('document_frequency') + increment
+            )
+
+    documents = []
+    postings = []
+    for prompt_id, counts in terms.items():
+        length = sum(counts.values())
+        documents.append((prompt_id, length))
+        postings.extend(
+            (term_ids[term], prompt_id, bm25_weight(frequency, length, avg_length))
+            for term, frequency in counts.items()
+        )
+    # 按词项排序后写入，索引页的插入位置更集中
+    postings.sort()
+    with connection.cursor() as cursor:
+        cursor.executemany(_insert_sql(SearchDocument, ('prompt_id', 'length')), documents)
+        cursor.executemany(_insert_sql(SearchPosting, ('term_id', 'prompt_id', 'weight')), postings)
+    cache.delete(STATS_CACHE_KEY)
+
+
+@transaction.atomic
+def reindex_prompts(prompts):
+    """批量重建一组提示词的索引（需预取 content_blob 与 tags）"""
+    prompts = list(prompts)
+    remove_prompts([prompt.pk for prompt in prompts])
+    index_new_prompts(prompts, {prompt.pk: [tag.name for tag in prompt.tags.all()] for prompt in prompts})
+
+
+def reindex_prompt_ids(prompt_ids, batch_size=500):
+    """按 id 分批重建索引，用于标签改名、删除等一次影响多个提示词的变化"""
+    prompt_ids = list(prompt_ids)
+    for start in range(0, len(prompt_ids), batch_size):
+        reindex_prompts(
+            Prompt.objects.filter(pk__in=prompt_ids[start:start + batch_size])
+            .select_related('content_blob').prefetch_related('tags')
+        )
+
+
+def remove_prompt(prompt):
+    """删除提示词前调用，回收其词项的文档频率"""
+    remove_prompts([prompt.pk])
+
+
+@transaction.atomic
+def remove_prompts(prompt_ids):
+    """批量删除提示词的索引"""
+    postings = SearchPosting.objects.filter(prompt_id__in=prompt_ids)
+    by_decrement = defaultdict(list)
+    for term_id, count in Counter(postings.values_list('term_id', flat=True)).items():
+        by_decrement[count].append(term_id)
+    for decrement, term_ids in by_decrement.items():
+        for start in range(0, len(term_ids), 500):
+            SearchTerm.objects.filter(id__in=term_ids[start:start + 500]).update(
+                document_frequency=F('document_frequency') - decrement
+            )
+    postings.delete()
+    SearchDocument.objects.filter(prompt_id__in=prompt_ids).delete()
+
+
+def _insert_sql(model, columns):
+    return 'INSERT INTO {} ({}) VALUES ({})'.format(
+        connection.ops.quote_name(model._meta.db_table),
+        ', '.join(connection.ops.quote_name(column) for column in columns),
+        ', '.join(['%s'] * len(columns)),
+    )
+
+
+def rebuild_index(batch_size=1000, stdout=None):
+    """离线全量重建索引，返回已索引的提示词数量"""
+    prompts = Prompt.objects.order_by('pk').select_related('content_blob').prefetch_related('tags')
+
+    # 第一遍：统计文档频率与平均长度
+    document_frequency = Counter()
+    total_length = 0
+    total = 0
+    for prompt in prompts.iterator(chunk_size=batch_size):
+        counts = document_terms(prompt)
+        document_frequency.update(counts.keys())
+        total_length += sum(counts.values())
+        total += 1
+    avg_length = (total_length / total) if total else 1.0
+
+    with transaction.atomic():
+        SearchPosting.objects.all().delete()
+        SearchDocument.objects.all().delete()
+        SearchTerm.objects.all().delete()
+        SearchTerm.objects.bulk_create(
+            [SearchTerm(term=term, document_frequency=df) for term, df in document_frequency.items()],
+            batch_size=batch_size,
+        )
+        term_ids = dict(SearchTerm.objects.values_list('term', 'id'))
+
+        # 第二遍：写入倒排项。数据量大，直接 executemany 以绕开模型实例化开销
+        posting_sql = _insert_sql(SearchPosting, ('term_id', 'prompt_id', 'weight'))
+        document_sql = _insert_sql(SearchDocument, ('prompt_id', 'length'))
+        postings = []
+        documents = []
+        done = 0
+        with connection.cursor() as cursor:
+            for prompt in prompts.iterator(chunk_size=batch_size):
+                counts = document_terms(prompt)
+                length = sum(counts.values())
+                documents.append((prompt.pk, length))
+                postings.extend(
+                    (term_ids[term], prompt.pk, bm25_weight(frequency, length, avg_length))
+                    for term, frequency in counts.items()
+                )
+                if len(documents) >= batch_size:
+                    cursor.executemany(document_sql, documents)
+                    cursor.executemany(posting_sql, postings)
+                    done += len(documents)
+                    documents, postings = [], []
+                    if stdout:
+                        stdout.write(f'已索引 {done}/{total}')
+            if documents:
+                cursor.executemany(document_sql, documents)
+                cursor.executemany(posting_sql, postings)
+
+    cache.delete(STATS_CACHE_KEY)
+    return total
+
+
+def edit_distance(a, b, limit):
+    """带上限的 Levenshtein 距离，超过 limit 时返回 limit + 1"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b),
+            ))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def max_edits(token):
+    if len(token) >= 8:
+        return 2
+    if len(token) >= 4:
+        return 1
+    return 0
+
+
+def is_cjk(token):
+    return bool(CJK_SPLIT_RE.fullmatch(token))
+
+
+def expand_tokens(tokens):
+    """一次查询取出全部查询词的词项变体，返回与 tokens 对应的 [[(term_id, document_frequency, factor)]]
+
+    精确匹配、最后一个词的前缀扩展与容错候选合并为一条查询；容错候选只在该词没有精确
+    （最后一个词：精确或前缀）匹配时才会读取，由 NOT EXISTS 在数据库中判定。
+    """
+    live = SearchTerm.objects.filter(document_frequency__gt=0)
+    last = len(tokens) - 1
+    prefix_allowed = not is_cjk(tokens[last])
+    conditions = Q(term__in=tokens)
+    if prefix_allowed:
+        # 使用范围查询以便利用 term 上的唯一索引
+        prefixed = live.filter(term__gt=tokens[last], term__lt=tokens[last] + '\uffff')
+        conditions |= Q(pk__in=prefixed.order_by('-document_frequency').values('pk')[:PREFIX_EXPANSIONS])
+    for index, token in enumerate(tokens):
+        edits = 0 if is_cjk(token) else max_edits(token)
+        if not edits:
+            continue
+        if index == last and prefix_allowed:
+            matched = live.filter(term__gte=token, term__lt=token + '\uffff')
+        else:
+            matched = live.filter(term=token)
+        # 容错匹配假定前两个字符输入正确，以将候选集限制在索引范围扫描内
+        head = token[:2]
+        candidates = live.annotate(term_length=Length('term')).filter(
+            term__gte=head, term__lt=head + '\uffff',
+            term_length__gte=len(token) - edits, term_length__lte=len(token) + edits,
+        ).values('pk')[:FUZZY_CANDIDATES]
+        conditions |= Q(pk__in=candidates) & ~Exists(matched)
+    rows = list(live.filter(conditions).values_list('id', 'term', 'document_frequency'))
+
+    by_term = {term: (term_id, df) for term_id, term, df in rows}
+    expanded = []
+    for index, token in enumerate(tokens):
+        variants = {}
+        if token in by_term:
+            term_id, df = by_term[token]
+            variants[term_id] = (df, 1.0)
+        if index == last and prefix_allowed:
+            prefixed = sorted(
+                (row for row in rows if row[1].startswith(token) and row[1] != token), key=lambda row: -row[2]
+            )
+            for term_id, term, df in prefixed[:PREFIX_EXPANSIONS]:
+                variants.setdefault(term_id, (df, PREFIX_FACTOR))
+
+        # 仅在词典中没有精确匹配时才做容错匹配
+        edits = 0 if (is_cjk(token) or variants) else max_edits(token)
+        if edits:
+            fuzzy = []
+            for term_id, term, df in rows:
+                if term[:2] != token[:2] or abs(len(term) - len(token)) > edits:
+                    continue
+                distance = edit_distance(token, term, edits)
+                if distance <= edits:
+                    fuzzy.append((distance, -df, term_id))
+            for distance, neg_df, term_id in sorted(fuzzy)[:FUZZY_EXPANSIONS]:
+                variants[term_id] = (-neg_df, FUZZY_FACTOR / distance)
+        expanded.append([(term_id, df, factor) for term_id, (df, factor) in variants.items()])
+    return expanded
+
+
+def top_postings(term_ids, visible):
+    """一次查询读取每个词项权重最高的 POSTINGS_PER_TERM 条可见倒排项，返回 [(term_id, prompt_id, weight)]
+
+    每个词项一个带 LIMIT 的子查询，各自沿 (term, -weight) 索引读取，读到上限即停止。
+    """
+    if not term_ids:
+        return []
+    conditions = Q()
+    for term_id in term_ids:
+        top = SearchPosting.objects.filter(visible, term_id=term_id).order_by('-weight').values('pk')
+        conditions |= Q(pk__in=top[:POSTINGS_PER_TERM])
+    return list(SearchPosting.objects.filter(conditions).values_list('term_id', 'prompt_id', 'weight'))
+
+
+def search(user, query, limit=20, offset=0):
+    """检索对 user 可见的提示词，返回 ([(prompt_id, score)], 命中总数)
+
+    每个词项只读取权重最高的 POSTINGS_PER_TERM 条倒排项，命中总数是这些倒排项涉及的提示词数：
+    匹配的提示词都在其中时是准确值，常见词的匹配数超过上限时是下限。
+    """
+    tokens = list(dict.fromkeys(tokenize(query)))
+    if not tokens:
+        return [], 0
+
+    total_documents, _ = get_stats()
+    visible = Q()
+    if user.role != 'admin':
+        visible = Q(prompt__author=user) | Q(prompt__sharing_mode='team')
+
+    expanded = expand_tokens(tokens)
+    factors = defaultdict(list)
+    for index, variants in enumerate(expanded):
+        for term_id, df, factor in variants:
+            # 统计信息有缓存，文档数可能略滞后，保证 idf 为正
+            documents = max(total_documents, df)
+            idf = math.log(1 + (documents - df + 0.5) / (df + 0.5))
+            factors[term_id].append((index, idf * factor))
+
+    # 同一查询词的多个变体只取最高分，不同查询词的得分相加
+    best = defaultdict(float)
+    for term_id, prompt_id, weight in top_postings(list(factors), visible):
+        for index, multiplier in factors[term_id]:
+            score = weight * multiplier
+            if score > best[index, prompt_id]:
+                best[index, prompt_id] = score
+    scores = defaultdict(float)
+    for (_, prompt_id), score in best.items():
+        scores[prompt_id] += score
+
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+    return ranked[offset:offset + limit], len(ranked)
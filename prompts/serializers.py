@@ -1,5 +1,7 @@
 from rest_framework import serializers
+from django.db import models, transaction
 from .models import Prompt, PromptVersion, Tag
+from . import bulk, fragment_cache, search
 
 class TagSerializer(serializers.ModelSerializer):
     class Meta:
@@ -7,16 +9,43 @@ class TagSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'color', 'created_at')
         read_only_fields = ('id', 'created_at')
 
+class TagWithCountSerializer(TagSerializer):
+    """附带当前用户可见提示词数量的标签，prompt_count 由 with_visible_counts() 注解"""
+    prompt_count = serializers.IntegerField(read_only=True)
+    
+    class Meta(TagSerializer.Meta):
+        fields = TagSerializer.Meta.fields + ('prompt_count',)
+
+class PromptVersionListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # 一次性还原整页增量存储的版本，避免逐条回溯
+        versions = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        PromptVersion.load_contents(versions)
+        return super().to_representation(versions)
+
 class PromptVersionSerializer(serializers.ModelSerializer):
-    author_username = serializers.CharField(source='author.username', read_only=True)
+    # 作者被删除的版本保留，author_username 为 null
+    author_username = serializers.CharField(source='author.username', read_only=True, default=None)
+    content = serializers.SerializerMethodField()
     
     class Meta:
         model = PromptVersion
         fields = ('id', 'version_number', 'content', 'author_username', 'created_at', 'commit_message')
         read_only_fields = ('id', 'version_number', 'created_at')
+        list_serializer_class = PromptVersionListSerializer
+    
+    def get_content(self, obj):
+        return obj.get_content()
+
+class PromptListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # 输出与用户无关，整页从片段缓存取出，只序列化未命中的提示词
+        prompts = data.all() if isinstance(data, models.manager.BaseManager) else data
+        return fragment_cache.serialize_many(prompts, self.child.to_representation)
 
 class PromptSerializer(serializers.ModelSerializer):
     author_username = serializers.CharField(source='author.username', read_only=True)
+    content = serializers.CharField(read_only=True)
     # versions = PromptVersionSerializer(many=True, read_only=True)
     version_count = serializers.SerializerMethodField()
     latest_version = PromptVersionSerializer(read_only=True)
@@ -35,11 +64,13 @@ class PromptSerializer(serializers.ModelSerializer):
                  'is_active', 'created_at', 'updated_at', 'version_count', 'latest_version', 
                  'tags', 'tag_ids')
         read_only_fields = ('id', 'created_at', 'updated_at')
+        list_serializer_class = PromptListSerializer
 
     def get_version_count(self, obj):
-        return obj.versions.count()
+        return obj.version_count
 
 class PromptCreateSerializer(serializers.ModelSerializer):
+    content = serializers.CharField()
     commit_message = serializers.CharField(required=False, allow_blank=True)
     tag_ids = serializers.PrimaryKeyRelatedField(
         many=True, 
@@ -52,6 +83,7 @@ class PromptCreateSerializer(serializers.ModelSerializer):
         model = Prompt
         fields = ('title', 'content', 'sharing_mode', 'commit_message', 'tag_ids')
     
+    @transaction.atomic
     def create(self, validated_data):
         commit_message = validated_data.pop('commit_message', '')
         tags = validated_data.pop('tags', [])
@@ -67,17 +99,17 @@ class PromptCreateSerializer(serializers.ModelSerializer):
         
         prompt.tags.set(tags)
         
-        PromptVersion.objects.create(
-            prompt=prompt,
-            version_number=1,
+        prompt.commit_version(
             content=validated_data['content'],
             author=validated_data['author'],
             commit_message=commit_message
         )
         
+        search.index_prompt(prompt)
         return prompt
 
 class PromptUpdateSerializer(serializers.ModelSerializer):
+    content = serializers.CharField()
     commit_message = serializers.CharField(required=False, allow_blank=True)
     tag_ids = serializers.PrimaryKeyRelatedField(
         many=True, 
@@ -90,6 +122,7 @@ class PromptUpdateSerializer(serializers.ModelSerializer):
         model = Prompt
         fields = ('title', 'content', 'sharing_mode', 'commit_message', 'tag_ids')
     
+    @transaction.atomic
     def update(self, instance, validated_data):
         commit_message = validated_data.pop('commit_message', '')
         tags = validated_data.pop('tags', None)
@@ -108,12 +141,7 @@ class PromptUpdateSerializer(serializers.ModelSerializer):
         # 如果tags为None，保持原有标签不变
         
         if 'content' in validated_data:
-            latest_version = instance.versions.first()
-            next_version = (latest_version.version_number + 1) if latest_version else 1
-            
-            PromptVersion.objects.create(
-                prompt=instance,
-                version_number=next_version,
+            instance.commit_version(
                 content=validated_data['content'],
                 author=validated_data.get('author', instance.author),
                 commit_message=commit_message
@@ -123,4 +151,34 @@ class PromptUpdateSerializer(serializers.ModelSerializer):
             setattr(instance, attr, value)
         
         instance.save()
-        return instance
\ No newline at end of file
+        search.index_prompt(instance)
+        return instance
+class BulkOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=bulk.OPERATIONS)
+    tag_ids = serializers.PrimaryKeyRelatedField(many=True, queryset=Tag.objects.all(), required=False)
+    sharing_mode = serializers.ChoiceField(choices=Prompt.SHARING_CHOICES, required=False)
+    content = serializers.CharField(required=False)
+    commit_message = serializers.CharField(required=False, allow_blank=True, max_length=500)
+    
+    REQUIRED_FIELDS = {
+        'add_tags': 'tag_ids',
+        'remove_tags': 'tag_ids',
+        'set_sharing_mode': 'sharing_mode',
+        'update_content': 'content',
+    }
+    
+    def validate(self, attrs):
+        field = self.REQUIRED_FIELDS.get(attrs['op'])
+        if field and not attrs.get(field):
+            raise serializers.ValidationError({field: f"This field is required for {attrs['op']}."})
+        return attrs
+
+class BulkOperationsSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=1000)
+    operations = BulkOperationSerializer(many=True, allow_empty=False)
+    
+    def validate_operations(self, operations):
+        ops = [operation['op'] for operation in operations]
+        if 'delete' in ops and ops.index('delete') != len(ops) - 1:
+            raise serializers.ValidationError('delete must be the last operation.')
+        return operations
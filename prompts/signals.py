@@ -0,0 +1,177 @@
+from django.contrib.auth import get_user_model
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from api import stats
+from . import fragment_cache, response_cache, search, tag_counts
+from .models import Prompt, PromptVersion, Tag
+
+
+@receiver(m2m_changed, sender=Prompt.tags.through)
+def update_tag_counts_on_link_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        # clear 之后无法再知道原有关联，先记下来
+        related = instance.prompts if reverse else instance.tags
+        instance._cleared_link_pks = set(related.values_list('pk', flat=True))
+        return
+    if action == 'post_clear':
+        pk_set, delta = instance.__dict__.pop('_cleared_link_pks', set()), -1
+    elif action == 'post_add':
+        delta = 1
+    elif action == 'post_remove':
+        delta = -1
+    else:
+        return
+    if not pk_set:
+        return
+
+    if reverse:
+        tag_counts.adjust_for_prompts(instance.pk, pk_set, delta)
+    else:
+        tag_counts.adjust(pk_set, instance.sharing_mode, instance.author_id, delta)
+
+
+@receiver(pre_save, sender=Prompt)
+def remember_previous_sharing(sender, instance, **kwargs):
+    # 标签计数按 (共享模式, 作者) 分组，编辑时两者都可能变化
+    if instance.pk is None:
+        instance._previous_sharing = None
+        return
+    instance._previous_sharing = Prompt.objects.filter(pk=instance.pk).values_list(
+        'sharing_mode', 'author_id'
+    ).first()
+
+
+@receiver(post_save, sender=Prompt)
+def update_counts_on_prompt_save(sender, instance, created, **kwargs):
+    previous = instance.__dict__.pop('_previous_sharing', None)
+    if created:
+        stats.adjust({'prompts': 1, stats.sharing_metric(instance.sharing_mode): 1})
+        return
+    if previous is None or previous == (instance.sharing_mode, instance.author_id):
+        return
+    previous_mode, previous_author_id = previous
+    tag_ids = list(instance.tags.values_list('pk', flat=True))
+    tag_counts.adjust(tag_ids, previous_mode, previous_author_id, -1)
+    tag_counts.adjust(tag_ids, instance.sharing_mode, instance.author_id, 1)
+    if previous_mode != instance.sharing_mode:
+        stats.adjust({stats.sharing_metric(previous_mode): -1, stats.sharing_metric(instance.sharing_mode): 1})
+
+
+@receiver(pre_delete, sender=Prompt)
+def update_tag_counts_on_delete(sender, instance, **kwargs):
+    tag_ids = list(instance.tags.values_list('pk', flat=True))
+    tag_counts.adjust(tag_ids, instance.sharing_mode, instance.author_id, -1)
+
+
+@receiver(post_delete, sender=Prompt)
+def update_stats_on_prompt_delete(sender, instance, **kwargs):
+    # 版本随提示词级联删除，按 version_count 扣减，避免为每个版本发送信号
+    stats.adjust({
+        'prompts': -1,
+        stats.sharing_metric(instance.sharing_mode): -1,
+        'versions': -instance.version_count,
+    })
+
+
+@receiver(post_save, sender=PromptVersion)
+def update_stats_on_version_create(sender, instance, created, **kwargs):
+    if created:
+        stats.adjust({'versions': 1})
+
+
+def deletes_whole_history(origin):
+    """删除由提示词或其作者发起时，版本随提示词整段删除"""
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model is Prompt or model is get_user_model()
+
+
+@receiver(pre_delete, sender=PromptVersion)
+def materialize_dependent_version(sender, instance, origin=None, **kwargs):
+    # 前一版本可能是相对本版本的反向增量，删除本版本前先改为完整存储
+    if deletes_whole_history(origin):
+        return
+    previous = PromptVersion.objects.filter(
+        prompt_id=instance.prompt_id, version_number__lt=instance.version_number
+    ).order_by('-version_number').first()
+    if previous is not None:
+        previous.store_in_full()
+
+
+@receiver(post_delete, sender=PromptVersion)
+def update_prompt_on_version_delete(sender, instance, origin=None, **kwargs):
+    if deletes_whole_history(origin):
+        return
+    versions = PromptVersion.objects.filter(prompt_id=instance.prompt_id)
+    Prompt.objects.filter(pk=instance.prompt_id).update(
+        head_version_id=versions.order_by('-version_number').values_list('pk', flat=True).first(),
+        version_count=versions.count(),
+        updated_at=timezone.now(),
+    )
+    stats.adjust({'versions': -1})
+    response_cache.bump_generation()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def update_stats_on_tag_change(sender, instance, created=None, **kwargs):
+    if created is None:
+        stats.adjust({'tags': -1})
+    elif created:
+        stats.adjust({'tags': 1})
+
+
+@receiver(post_save, sender=Prompt)
+@receiver(post_delete, sender=Prompt)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(m2m_changed, sender=Prompt.tags.through)
+def invalidate_list_cache(sender, **kwargs):
+    response_cache.bump_generation()
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def invalidate_list_cache_on_user_change(sender, created=False, update_fields=None, **kwargs):
+    # 列表响应中包含作者与版本作者的用户名；新建用户或登录只更新 last_login 时无需失效
+    if created or (update_fields and set(update_fields) == {'last_login'}):
+        return
+    response_cache.bump_generation()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_prompt_fragments(sender, created=False, **kwargs):
+    # 新建的标签尚未出现在任何片段中
+    if not created:
+        fragment_cache.bump_tag_generation()
+
+
+@receiver(pre_save, sender=Tag)
+def remember_previous_tag_name(sender, instance, **kwargs):
+    if instance.pk is None:
+        instance._previous_name = None
+        return
+    instance._previous_name = Tag.objects.filter(pk=instance.pk).values_list('name', flat=True).first()
+
+
+@receiver(post_save, sender=Tag)
+def reindex_on_tag_rename(sender, instance, created, **kwargs):
+    # 标签名参与索引，改名后重建相关提示词的索引（API 与管理后台都经过这里）
+    previous = instance.__dict__.pop('_previous_name', None)
+    if created or previous is None or previous == instance.name:
+        return
+    search.reindex_prompt_ids(instance.prompts.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_tagged_prompts(sender, instance, **kwargs):
+    # 关联行随标签级联删除，不会发送 m2m_changed，先记下受影响的提示词
+    instance._tagged_prompt_ids = list(instance.prompts.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def reindex_on_tag_delete(sender, instance, **kwargs):
+    search.reindex_prompt_ids(instance.__dict__.pop('_tagged_prompt_ids', []))
@@ -0,0 +1,75 @@
+"""标签计数器维护
+
+Tag.team_prompt_count 记录团队共享提示词数，Tag.private_prompt_count 记录私有提示词总数，
+TagPrivateCount 按作者记录私有提示词数。用户可见数 = 团队共享数 + 自己的私有数。
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from . import response_cache
+from .models import Prompt, Tag, TagPrivateCount
+
+
+def adjust(tag_ids, sharing_mode, author_id, delta):
+    """为一组标签上的同一作者、同一共享模式的提示词增减计数"""
+    tag_ids = list(tag_ids)
+    if not tag_ids or not delta:
+        return
+    now = timezone.now()
+    if sharing_mode == 'team':
+        Tag.objects.filter(pk__in=tag_ids).update(team_prompt_count=F('team_prompt_count') + delta, updated_at=now)
+        return
+    Tag.objects.filter(pk__in=tag_ids).update(private_prompt_count=F('private_prompt_count') + delta, updated_at=now)
+    TagPrivateCount.objects.bulk_create(
+        [TagPrivateCount(tag_id=tag_id, author_id=author_id) for tag_id in tag_ids], ignore_conflicts=True
+    )
+    TagPrivateCount.objects.filter(tag_id__in=tag_ids, author_id=author_id).update(count=F('count') + delta)
+
+
+def adjust_for_prompts(tag_id, prompt_ids, delta):
+    """某个标签增减一批提示词时更新计数"""
+    groups = Counter(Prompt.objects.filter(pk__in=prompt_ids).values_list('sharing_mode', 'author_id'))
+    for (sharing_mode, author_id), count in groups.items():
+        adjust([tag_id], sharing_mode, author_id, delta * count)
+
+
+def adjust_links(links, delta=1):
+    """按 (tag_id, sharing_mode, author_id) 三元组批量增减计数，用于绕过 m2m 信号的批量写入"""
+    per_tag = Counter(links)
+    groups = defaultdict(list)
+    for (tag_id, sharing_mode, author_id), count in per_tag.items():
+        groups[sharing_mode, author_id, count].append(tag_id)
+    for (sharing_mode, author_id, count), tag_ids in groups.items():
+        adjust(tag_ids, sharing_mode, author_id, delta * count)
+
+
+@transaction.atomic
+def recount():
+    """根据关联表全量重算所有标签计数，返回处理的标签数"""
+    links = Prompt.tags.through.objects.order_by()
+    team = dict(
+        links.filter(prompt__sharing_mode='team').values('tag_id')
+        .annotate(count=Count('pk')).values_list('tag_id', 'count')
+    )
+    private = links.exclude(prompt__sharing_mode='team').values('tag_id', 'prompt__author_id').annotate(count=Count('pk'))
+
+    private_totals = Counter()
+    TagPrivateCount.objects.all().delete()
+    rows = []
+    for row in private.iterator():
+        private_totals[row['tag_id']] += row['count']
+        rows.append(TagPrivateCount(tag_id=row['tag_id'], author_id=row['prompt__author_id'], count=row['count']))
+    TagPrivateCount.objects.bulk_create(rows, batch_size=1000)
+
+    now = timezone.now()
+    tags = list(Tag.objects.only('pk'))
+    for tag in tags:
+        tag.team_prompt_count = team.get(tag.pk, 0)
+        tag.private_prompt_count = private_totals.get(tag.pk, 0)
+        tag.updated_at = now
+    Tag.objects.bulk_update(tags, ['team_prompt_count', 'private_prompt_count', 'updated_at'], batch_size=1000)
+    response_cache.bump_generation()
+    return len(tags)
@@ -0,0 +1,731 @@
+import datetime
+import gzip
+import io
+import json
+import zipfile
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api import stats
+from api.models import SystemSetting
+from . import blobs, dataset, diff, exporter, importer, response_cache, search, tag_counts
+from .models import ContentBlob, Prompt, PromptVersion, SearchDocument, Tag, TagPrivateCount
+from users.models import User
+
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'prompts-tests'},
+    'throttle': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+}
+
+
+def set_performance_settings(test_case, **values):
+    """写入性能设置并立即执行提交回调：测试事务不会提交，否则设置版本不变，进程内的快照不会重新加载"""
+    with test_case.captureOnCommitCallbacks(execute=True):
+        SystemSetting.set_many(values, dict.fromkeys(values, 'performance'))
+
+
+@override_settings(CACHES=TEST_CACHES, QUERY_BUDGET_MODE='off')
+class PromptQueryCountTests(TestCase):
+    """列表、详情与标签列表的查询数不随每页条数增长（防止逐行查询回归）"""
+
+    @classmethod
+    def setUpTestData(cls):
+        # 关闭响应缓存，测量的是实际查询
+        set_performance_settings(cls, cacheEnabled=False, rateLimit=0)
+        cls.owner = User.objects.create_user('owner', password='x')
+        cls.other = User.objects.create_user('other', password='x')
+        cls.tag = Tag.objects.create(name='shared')
+        extra = Tag.objects.create(name='extra')
+        for i in range(30):
+            author = cls.owner if i % 2 else cls.other
+            prompt = Prompt.objects.create(
+                title=f'prompt {i}', content=f'content {i}', author=author, sharing_mode='team'
+            )
+            prompt.commit_version(f'content {i}', author, 'Initial version')
+            prompt.commit_version(f'content {i} edited', cls.owner, 'Edit')
+            prompt.tags.add(cls.tag, extra)
+        cls.prompt = Prompt.objects.filter(author=cls.other).first()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        # 预热进程内缓存（设置快照等），与页面大小无关的一次性查询不计入
+        self.client.get('/api/prompts/')
+
+    def assert_queries(self, count, url):
+        with self.assertNumQueries(count):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_prompt_list(self):
+        # 30 条数据，第 1 页 20 条，第 2 页 10 条
+        for page, page_size in ((1, 20), (2, 10)):
+            response = self.assert_queries(3, f'/api/prompts/?page={page}')
+            self.assertEqual(len(response.data['results']), page_size)
+
+    def test_prompt_list_cursor(self):
+        for page_size in (5, 25):
+            response = self.assert_queries(2, f'/api/prompts/?pagination=cursor&page_size={page_size}')
+            self.assertEqual(len(response.data['results']), page_size)
+
+    def test_prompt_detail(self):
+        response = self.assert_queries(3, f'/api/prompts/{self.prompt.pk}/')
+        self.assertEqual(response.data['latest_version']['version_number'], 2)
+        self.assertEqual(response.data['latest_version']['author_username'], 'owner')
+
+    def test_prompts_by_tag(self):
+        for page_size in (5, 25):
+            response = self.assert_queries(3, f'/api/prompts/tags/{self.tag.pk}/prompts/?page_size={page_size}')
+            self.assertEqual(len(response.data['prompts']), page_size)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SearchTests(TestCase):
+    """全文检索：排序、前缀与容错扩展、可见性，以及标签改名、删除后的索引更新"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', password='x')
+        cls.bob = User.objects.create_user('bob', password='x')
+        cls.admin = User.objects.create_user('root', password='x', role='admin')
+        cls.tag = Tag.objects.create(name='writing')
+        cls.title_match = cls.create(cls.alice, 'Summarise meeting notes', 'Keep it short.', 'team', [cls.tag])
+        cls.content_match = cls.create(cls.alice, 'Translate email', 'Summarise the email, then translate it.', 'team')
+        cls.private = cls.create(cls.bob, 'Summarise contract', 'Private notes.', 'private')
+        cls.unrelated = cls.create(cls.bob, 'Refactor python code', 'Explain each step.', 'team')
+
+    @classmethod
+    def create(cls, author, title, content, sharing_mode, tags=()):
+        prompt = Prompt.objects.create(title=title, content=content, author=author, sharing_mode=sharing_mode)
+        prompt.tags.set(tags)
+        search.index_prompt(prompt)
+        return prompt
+
+    def ids(self, user, query):
+        hits, total = search.search(user, query)
+        self.assertEqual(total, len(hits))
+        return [prompt_id for prompt_id, _ in hits]
+
+    def test_title_matches_rank_first(self):
+        self.assertEqual(self.ids(self.alice, 'summarise'), [self.title_match.pk, self.content_match.pk])
+
+    def test_visibility(self):
+        self.assertNotIn(self.private.pk, self.ids(self.alice, 'summarise'))
+        self.assertIn(self.private.pk, self.ids(self.bob, 'summarise'))
+        self.assertIn(self.private.pk, self.ids(self.admin, 'contract'))
+        self.assertEqual(self.ids(self.alice, 'contract'), [])
+
+    def test_prefix_expansion_on_last_token(self):
+        self.assertEqual(set(self.ids(self.alice, 'summ')), {self.title_match.pk, self.content_match.pk})
+        # 只有最后一个查询词做前缀匹配
+        self.assertEqual(self.ids(self.alice, 'summ email'), [self.content_match.pk])
+        self.assertEqual(self.ids(self.alice, 'email summ'), [self.content_match.pk, self.title_match.pk])
+
+    def test_typo_tolerance(self):
+        self.assertEqual(self.ids(self.alice, 'sumarise'), [self.title_match.pk, self.content_match.pk])
+        self.assertEqual(self.ids(self.bob, 'refactr pyhton'), [self.unrelated.pk])
+        # 有精确匹配时不做容错扩展
+        self.assertEqual(self.ids(self.alice, 'email'), [self.content_match.pk])
+
+    def test_query_count_does_not_grow_with_tokens(self):
+        search.get_stats()
+        for query in ('summ', 'sumarise', 'summarise meeting notes translate email'):
+            with self.assertNumQueries(2):
+                search.search(self.alice, query)
+
+    def test_tag_rename_and_delete_reindex(self):
+        self.assertEqual(self.ids(self.alice, 'writing'), [self.title_match.pk])
+        self.tag.name = 'drafting'
+        self.tag.save()
+        self.assertEqual(self.ids(self.alice, 'writing'), [])
+        self.assertEqual(self.ids(self.alice, 'drafting'), [self.title_match.pk])
+        self.tag.delete()
+        self.assertEqual(self.ids(self.alice, 'drafting'), [])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class VersionStorageTests(TestCase):
+    """反向增量存储：跨检查点还原每个版本"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('writer', password='x')
+
+    def commit_versions(self, count):
+        prompt = Prompt.objects.create(title='history', content='', author=self.user)
+        contents = []
+        for number in range(1, count + 1):
+            content = '\n'.join(f'line {line} of version {number if line % 3 == 0 else 0}' for line in range(30))
+            prompt.commit_version(content, self.user, f'v{number}')
+            contents.append(content)
+        return prompt, contents
+
+    def assert_reconstructs(self, prompt, contents):
+        # 逐个还原与批量还原都要得到原内容
+        for version in PromptVersion.objects.filter(prompt=prompt).select_related('content_blob'):
+            self.assertEqual(version.get_content(), contents[version.version_number - 1])
+        versions = list(PromptVersion.objects.filter(prompt=prompt).select_related('content_blob'))
+        PromptVersion.load_contents(versions)
+        self.assertEqual([version.get_content() for version in versions], contents[::-1])
+
+    @override_settings(PROMPT_VERSION_CHECKPOINT_INTERVAL=10)
+    def test_across_checkpoints(self):
+        prompt, contents = self.commit_versions(25)
+        full = set(PromptVersion.objects.filter(prompt=prompt, is_delta=False).values_list('version_number', flat=True))
+        self.assertEqual(full, {10, 20, 25})
+        self.assert_reconstructs(prompt, contents)
+
+    @override_settings(PROMPT_VERSION_CHECKPOINT_INTERVAL=1)
+    def test_every_version_is_a_checkpoint(self):
+        prompt, contents = self.commit_versions(5)
+        self.assertFalse(PromptVersion.objects.filter(prompt=prompt, is_delta=True).exists())
+        self.assert_reconstructs(prompt, contents)
+
+    @override_settings(PROMPT_VERSION_CHECKPOINT_INTERVAL=10)
+    def test_deleting_a_version_keeps_the_chain(self):
+        prompt, contents = self.commit_versions(12)
+        PromptVersion.objects.get(prompt=prompt, version_number=5).delete()
+        PromptVersion.objects.get(prompt=prompt, version_number=12).delete()
+        del contents[11], contents[4]
+        versions = list(PromptVersion.objects.filter(prompt=prompt).select_related('content_blob'))
+        PromptVersion.load_contents(versions)
+        self.assertEqual([version.get_content() for version in versions], contents[::-1])
+        prompt.refresh_from_db()
+        self.assertEqual((prompt.head_version.version_number, prompt.version_count), (11, 10))
+
+
+@override_settings(CACHES=TEST_CACHES, CONTENT_BLOB_COMPRESS_THRESHOLD=100)
+class ContentBlobTests(TestCase):
+    """正文按 sha256 去重，超过阈值时压缩保存，清理只删除未引用的 blob"""
+
+    def test_identical_content_is_stored_once(self):
+        user = User.objects.create_user('writer', password='x')
+        first = Prompt.objects.create(title='a', content='same body', author=user)
+        second = Prompt.objects.create(title='b', content='same body', author=user)
+        self.assertEqual(first.content_blob_id, blobs.content_hash('same body'))
+        self.assertEqual(first.content_blob_id, second.content_blob_id)
+        self.assertEqual(ContentBlob.objects.count(), 1)
+        hashes = ContentBlob.objects.intern_many(['same body', 'other body', 'other body'])
+        self.assertEqual(hashes[1], hashes[2])
+        self.assertEqual(ContentBlob.objects.count(), 2)
+
+    def test_compression_threshold_round_trip(self):
+        short = 'short text'
+        long = 'compressible line\n' * 50
+        ContentBlob.objects.intern_many([short, long])
+        short_blob = ContentBlob.objects.get(hash=blobs.content_hash(short))
+        long_blob = ContentBlob.objects.get(hash=blobs.content_hash(long))
+        self.assertEqual(short_blob.codec, blobs.CODEC_NONE)
+        self.assertNotEqual(long_blob.codec, blobs.CODEC_NONE)
+        self.assertLess(len(long_blob.data), len(long))
+        self.assertEqual((short_blob.text, long_blob.text), (short, long))
+        self.assertEqual(long_blob.size, len(long.encode('utf-8')))
+
+    def test_gc_keeps_referenced_blobs(self):
+        user = User.objects.create_user('writer', password='x')
+        prompt = Prompt.objects.create(title='a', content='', author=user)
+        prompt.commit_version('first body', user)
+        prompt.commit_version('second body', user)
+        prompt.content = 'second body'
+        prompt.save()
+        orphan = ContentBlob.objects.intern('nobody uses this')
+
+        call_command('gc_content_blobs', min_age=0, stdout=io.StringIO())
+        remaining = set(ContentBlob.objects.values_list('hash', flat=True))
+        self.assertNotIn(orphan, remaining)
+        self.assertEqual(remaining, {blobs.content_hash('first body'), blobs.content_hash('second body')})
+        for version in PromptVersion.objects.filter(prompt=prompt).select_related('content_blob'):
+            self.assertIn(version.get_content(), ('first body', 'second body'))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class VersionDiffTests(TestCase):
+    """差异结果缓存与超大内容的线性时间回退"""
+
+    def setUp(self):
+        diff.diff_cache.clear()
+        self.addCleanup(diff.diff_cache.clear)
+        user = User.objects.create_user('writer', password='x')
+        prompt = Prompt.objects.create(title='diff', content='', author=user)
+        self.old = prompt.commit_version('one\ntwo\nthree', user)
+        self.new = prompt.commit_version('one\n2\nthree\nfour', user)
+
+    def test_cache_hit_skips_queries(self):
+        first = diff.version_diff(self.old.pk, self.new.pk)
+        self.assertEqual(first['stats'], {'insertions': 2, 'deletions': 1})
+        with self.assertNumQueries(0):
+            self.assertIs(diff.version_diff(self.old.pk, self.new.pk), first)
+
+    def test_cache_evicts_by_entries_and_size(self):
+        result = diff.compute_diff('a\nb', 'a\nc')
+        size = diff.result_size(result)
+        cache = diff.DiffCache(max_entries=2, max_chars=size * 3)
+        for key in range(3):
+            cache.set(key, result)
+        self.assertEqual((cache.get(0), list(cache.entries)), (None, [1, 2]))
+
+        cache = diff.DiffCache(max_entries=10, max_chars=size * 2)
+        for key in range(3):
+            cache.set(key, result)
+        self.assertEqual(list(cache.entries), [1, 2])
+        self.assertLessEqual(cache.chars, size * 2)
+        # 超过总量上限的单个结果不缓存
+        cache = diff.DiffCache(max_entries=10, max_chars=size - 1)
+        cache.set(0, result)
+        self.assertIsNone(cache.get(0))
+
+    def check_linear(self, old, new):
+        result = diff.compute_diff(old, new)
+        self.assertEqual(result['algorithm'], 'linear')
+        self.assertEqual(
+            [(change['op'], change['old_lines'], change['new_lines']) for change in result['changes'] if change['op'] != 'equal'],
+            [('replace', ['middle'], ['changed', 'added'])],
+        )
+        self.assertEqual(result['stats'], {'insertions': 2, 'deletions': 1})
+        self.assertIn('-middle\n+changed\n+added', result['unified'])
+
+    def test_linear_fallback_past_line_limit(self):
+        old = 'first\nmiddle\nlast'
+        new = 'first\nchanged\nadded\nlast'
+        self.assertEqual(diff.compute_diff(old, new)['algorithm'], 'sequence')
+        with override_settings(PROMPT_DIFF_MAX_LINES=6):
+            self.check_linear(old, new)
+
+    def test_linear_fallback_past_char_limit(self):
+        old = 'first\nmiddle\nlast'
+        new = 'first\nchanged\nadded\nlast'
+        with override_settings(PROMPT_DIFF_MAX_CHARS=len(old) + len(new) - 1):
+            self.check_linear(old, new)
+
+
+@override_settings(CACHES=TEST_CACHES, QUERY_BUDGET_MODE='off')
+class TagCountTests(TestCase):
+    """编辑改变共享模式或作者时，标签计数随之移动，与全量重算一致"""
+
+    def setUp(self):
+        set_performance_settings(self, cacheEnabled=False, rateLimit=0)
+        self.alice = User.objects.create_user('alice', password='x')
+        self.admin = User.objects.create_user('root', password='x', role='admin')
+        self.tag = Tag.objects.create(name='drafts')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+        response = self.client.post('/api/prompts/', {
+            'title': 'private', 'content': 'body', 'sharing_mode': 'private', 'tag_ids': [self.tag.pk],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.prompt = Prompt.objects.get(title='private')
+
+    def counts(self):
+        tag = Tag.objects.get(pk=self.tag.pk)
+        private = dict(TagPrivateCount.objects.filter(tag=tag).exclude(count=0).values_list('author_id', 'count'))
+        return tag.team_prompt_count, tag.private_prompt_count, private
+
+    def assert_matches_recount(self):
+        maintained = self.counts()
+        tag_counts.recount()
+        self.assertEqual(maintained, self.counts())
+
+    def listed(self, user):
+        self.client.force_authenticate(user)
+        response = self.client.get(f'/api/prompts/tags/{self.tag.pk}/prompts/?pagination=cursor')
+        return response.data['tag']['prompt_count'], len(response.data['prompts'])
+
+    def test_author_change_moves_private_count(self):
+        self.assertEqual(self.listed(self.alice), (1, 1))
+        admin = APIClient()
+        admin.force_authenticate(self.admin)
+        # 编辑会把作者改为编辑者
+        response = admin.patch(f'/api/prompts/{self.prompt.pk}/', {'content': 'edited'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Prompt.objects.get(pk=self.prompt.pk).author, self.admin)
+        self.assertEqual(self.listed(self.alice), (0, 0))
+        self.assertEqual(self.counts(), (0, 1, {self.admin.pk: 1}))
+        self.assert_matches_recount()
+
+    def test_sharing_mode_change(self):
+        response = self.client.patch(f'/api/prompts/{self.prompt.pk}/', {'content': 'body', 'sharing_mode': 'team'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.counts(), (1, 0, {}))
+        self.assert_matches_recount()
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ImporterTests(TestCase):
+    """导入限制与逐条错误报告：出错的记录或批次不影响其他记录"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('importer', password='x')
+        self.limits = importer.ImportLimits(max_file_size=0.0001, allowed_types='txt,md,json')
+
+    def run_import(self, data, name, **kwargs):
+        records = importer.iter_records(io.BytesIO(data), name, self.limits)
+        return importer.import_records(records, self.user, **kwargs).as_dict()
+
+    def test_malformed_and_oversize_rows(self):
+        lines = [
+            json.dumps({'title': 'first', 'content': 'ok', 'tags': ['a']}),
+            '{not json',
+            json.dumps({'title': '', 'content': 'no title'}),
+            json.dumps({'title': 'huge', 'content': 'x' * 200}),
+            json.dumps({'title': 'bad tags', 'content': 'ok', 'tags': [1]}),
+            json.dumps({'title': 'last', 'content': 'ok', 'sharing_mode': 'team'}),
+        ]
+        result = self.run_import('\n'.join(lines).encode(), 'data.ndjson')
+        self.assertEqual((result['created'], result['failed']), (2, 4))
+        errors = {error['source']: error['error'] for error in result['errors']}
+        self.assertEqual(sorted(errors), ['data.ndjson:2', 'data.ndjson:3', 'data.ndjson:4', 'data.ndjson:5'])
+        self.assertIn('Invalid JSON', errors['data.ndjson:2'])
+        self.assertEqual(errors['data.ndjson:3'], 'title is required')
+        self.assertIn('maximum size', errors['data.ndjson:4'])
+        self.assertEqual(set(Prompt.objects.values_list('title', flat=True)), {'first', 'last'})
+
+    def test_zip_members_checked_individually(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as output:
+            output.writestr('notes.txt', 'small body')
+            output.writestr('tool.exe', 'binary')
+            output.writestr('big.md', 'x' * 200)
+        result = self.run_import(archive.getvalue(), 'upload.zip')
+        self.assertEqual((result['created'], result['failed']), (1, 2))
+        self.assertEqual({error['source'] for error in result['errors']}, {'tool.exe', 'big.md'})
+        self.assertEqual(Prompt.objects.get().title, 'notes')
+
+    def test_failed_batch_does_not_affect_others(self):
+        lines = '\n'.join(json.dumps({'title': f'p{i}', 'content': 'body'}) for i in range(5)).encode()
+        write_batch = importer._write_batch
+        calls = []
+
+        def failing_second_batch(records, author):
+            calls.append(len(records))
+            if len(calls) == 2:
+                raise DatabaseError('disk full')
+            write_batch(records, author)
+
+        with mock.patch.object(importer, '_write_batch', side_effect=failing_second_batch):
+            result = self.run_import(lines, 'data.ndjson', batch_size=2)
+        # 最后一批不足 batch_size 条
+        self.assertEqual(calls, [2, 2, 1])
+        self.assertEqual((result['created'], result['failed']), (3, 2))
+        self.assertTrue(all(error['error'].startswith('Database error') for error in result['errors']))
+        self.assertEqual(sorted(Prompt.objects.values_list('title', flat=True)), ['p0', 'p1', 'p4'])
+        for prompt in Prompt.objects.select_related('head_version'):
+            self.assertEqual((prompt.version_count, prompt.head_version.version_number), (1, 1))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class BulkWriteTests(TestCase):
+    """导入与合成数据共用的批量写入收尾：head_version、标签计数、统计与搜索索引与逐条创建一致"""
+
+    def assert_consistent(self, prompts):
+        for prompt in prompts:
+            self.assertEqual(prompt.head_version.version_number, prompt.version_count)
+            self.assertEqual(prompt.head_version.get_content(), prompt.content)
+        maintained = list(Tag.objects.order_by('pk').values_list('pk', 'team_prompt_count', 'private_prompt_count'))
+        tag_counts.recount()
+        self.assertEqual(
+            maintained, list(Tag.objects.order_by('pk').values_list('pk', 'team_prompt_count', 'private_prompt_count'))
+        )
+        self.assertEqual(stats.current(), stats.compute())
+
+    def test_import(self):
+        records = [(str(i), {'title': f'note {i}', 'content': f'quarterly report {i}', 'tags': ['finance']}) for i in range(3)]
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.create_user('bulk-writer', password='x')
+            importer.import_records(records, user)
+        self.assert_consistent(Prompt.objects.select_related('head_version'))
+        hits, total = search.search(user, 'finance quarterly')
+        self.assertEqual(total, 3)
+
+    def test_generated_dataset(self):
+        generator = dataset.DatasetGenerator(users=3, prompts=20, mean_versions=4, tags=4, content_length=80, seed=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            counts = generator.generate()
+        prompts = Prompt.objects.select_related('head_version')
+        self.assertEqual(len(prompts), 20)
+        self.assertEqual(PromptVersion.objects.count(), counts['versions'])
+        self.assert_consistent(prompts)
+        self.assertEqual(SearchDocument.objects.count(), 20)
+
+
+@override_settings(CACHES=TEST_CACHES, QUERY_BUDGET_MODE='off', PROMPT_VERSION_CHECKPOINT_INTERVAL=5)
+class ExportTests(TestCase):
+    """流式导出：筛选条件、可见性、版本历史还原与 gzip 输出"""
+
+    @classmethod
+    def setUpTestData(cls):
+        set_performance_settings(cls, rateLimit=0)
+        cls.alice = User.objects.create_user('alice', password='x')
+        cls.bob = User.objects.create_user('bob', password='x')
+        cls.tag = Tag.objects.create(name='exported')
+        filler = 'shared line of text\n' * 10
+        cls.history = [f'{filler}revision {number}\n{filler}' for number in range(1, 8)]
+        cls.tagged = Prompt.objects.create(title='tagged', content=cls.history[-1], author=cls.alice, sharing_mode='team')
+        for content in cls.history:
+            cls.tagged.commit_version(content, cls.alice)
+        cls.tagged.tags.add(cls.tag)
+        cls.old = Prompt.objects.create(title='old', content='old body', author=cls.bob, sharing_mode='team')
+        cls.old.commit_version('old body', cls.bob)
+        Prompt.objects.filter(pk=cls.old.pk).update(updated_at=timezone.now() - datetime.timedelta(days=30))
+        cls.private = Prompt.objects.create(title='private', content='secret', author=cls.bob)
+        cls.private.commit_version('secret', cls.bob)
+
+    def export(self, user, query=''):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get(f'/api/prompts/export/{query}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def records(self, user, query=''):
+        _, body = self.export(user, query)
+        return [json.loads(line) for line in body.decode('utf-8').splitlines()]
+
+    def titles(self, user, query=''):
+        return [record['title'] for record in self.records(user, query)]
+
+    def test_visibility_and_filters(self):
+        self.assertEqual(self.titles(self.alice), ['tagged', 'old'])
+        self.assertEqual(self.titles(self.bob), ['tagged', 'old', 'private'])
+        self.assertEqual(self.titles(self.alice, f'?tag={self.tag.pk}'), ['tagged'])
+        self.assertEqual(self.titles(self.alice, '?author=bob'), ['old'])
+        since = (timezone.now() - datetime.timedelta(days=1)).date().isoformat()
+        self.assertEqual(self.titles(self.alice, f'?updated_after={since}'), ['tagged'])
+        self.assertEqual(self.titles(self.alice, f'?updated_before={since}'), ['old'])
+
+    def test_history_is_reconstructed(self):
+        self.assertTrue(PromptVersion.objects.filter(prompt=self.tagged, is_delta=True).exists())
+        record = self.records(self.alice, f'?history=1&tag={self.tag.pk}')[0]
+        self.assertEqual(record['tags'], ['exported'])
+        self.assertEqual([version['version_number'] for version in record['versions']], list(range(7, 0, -1)))
+        self.assertEqual([version['content'] for version in record['versions']], self.history[::-1])
+        self.assertNotIn('versions', self.records(self.alice)[0])
+
+    def test_gzip_stream(self):
+        response, body = self.export(self.alice, '?compress=gzip')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertTrue(response['Content-Disposition'].endswith('.ndjson.gz"'))
+        lines = gzip.decompress(body).decode('utf-8').splitlines()
+        self.assertEqual([json.loads(line)['title'] for line in lines], ['tagged', 'old'])
+        # 每累积 flush_bytes 输入即输出一段可独立解压的数据
+        chunks = list(exporter.gzip_stream((b'x' * 100 for _ in range(10)), flush_bytes=250))
+        self.assertGreater(len(chunks), 3)
+        self.assertEqual(gzip.decompress(b''.join(chunks)), b'x' * 1000)
+
+
+@override_settings(CACHES=TEST_CACHES, QUERY_BUDGET_MODE='off')
+class BulkOperationTests(TestCase):
+    """批量操作：逐项权限判定，标签计数与统计计数保持与全量重算一致"""
+
+    def setUp(self):
+        set_performance_settings(self, rateLimit=0)
+        # 统计增量在提交回调中写入，测试事务不会提交，需要立即执行
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alice = User.objects.create_user('alice', password='x')
+            self.bob = User.objects.create_user('bob', password='x')
+            self.tag = Tag.objects.create(name='bulk')
+            self.private = self.create(self.alice, 'private')
+            self.shared = self.create(self.alice, 'team')
+            self.others = self.create(self.bob, 'private')
+
+    def create(self, author, sharing_mode):
+        prompt = Prompt.objects.create(title=f'{author} {sharing_mode}', content='body', author=author, sharing_mode=sharing_mode)
+        prompt.commit_version('body', author)
+        prompt.tags.add(self.tag)
+        return prompt
+
+    def bulk(self, user, ids, *operations):
+        client = APIClient()
+        client.force_authenticate(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post('/api/prompts/bulk/', {'ids': ids, 'operations': list(operations)}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return {result['id']: result['status'] for result in response.data['results']}
+
+    def assert_counters_consistent(self):
+        tag = Tag.objects.get(pk=self.tag.pk)
+        maintained = (
+            tag.team_prompt_count, tag.private_prompt_count,
+            dict(TagPrivateCount.objects.filter(tag=tag).exclude(count=0).values_list('author_id', 'count')),
+        )
+        tag_counts.recount()
+        tag.refresh_from_db()
+        recounted = (
+            tag.team_prompt_count, tag.private_prompt_count,
+            dict(TagPrivateCount.objects.filter(tag=tag).values_list('author_id', 'count')),
+        )
+        self.assertEqual(maintained, recounted)
+        self.assertEqual(stats.current(), stats.compute())
+
+    def test_non_owner_is_denied(self):
+        results = self.bulk(self.bob, [self.private.pk, self.shared.pk, 999999], {'op': 'set_sharing_mode', 'sharing_mode': 'private'})
+        self.assertEqual(results, {self.private.pk: 'forbidden', self.shared.pk: 'updated', 999999: 'not_found'})
+        self.assertEqual(Prompt.objects.get(pk=self.private.pk).updated_at, self.private.updated_at)
+        results = self.bulk(self.bob, [self.private.pk], {'op': 'delete'})
+        self.assertEqual(results, {self.private.pk: 'forbidden'})
+        self.assertTrue(Prompt.objects.filter(pk=self.private.pk).exists())
+
+    def test_share_keeps_counters(self):
+        results = self.bulk(self.alice, [self.private.pk, self.shared.pk], {'op': 'set_sharing_mode', 'sharing_mode': 'team'})
+        self.assertEqual(set(results.values()), {'updated'})
+        tag = Tag.objects.get(pk=self.tag.pk)
+        self.assertEqual((tag.team_prompt_count, tag.private_prompt_count), (2, 1))
+        self.assert_counters_consistent()
+
+    def test_delete_keeps_counters(self):
+        results = self.bulk(self.alice, [self.private.pk, self.shared.pk], {'op': 'update_content', 'content': 'new'}, {'op': 'delete'})
+        self.assertEqual(set(results.values()), {'deleted'})
+        tag = Tag.objects.get(pk=self.tag.pk)
+        self.assertEqual((tag.team_prompt_count, tag.private_prompt_count), (0, 1))
+        self.assert_counters_consistent()
+
+
+@override_settings(CACHES=TEST_CACHES, QUERY_BUDGET_MODE='off')
+class BatchGetTests(TestCase):
+    """按 id 批量获取：保持请求顺序，分别报告不存在与无权查看的 id"""
+
+    @classmethod
+    def setUpTestData(cls):
+        set_performance_settings(cls, rateLimit=0)
+        cls.alice = User.objects.create_user('alice', password='x')
+        cls.bob = User.objects.create_user('bob', password='x')
+        cls.ids = []
+        for index in range(4):
+            prompt = Prompt.objects.create(title=f'shared {index}', content='body', author=cls.alice, sharing_mode='team')
+            prompt.commit_version('body', cls.alice)
+            cls.ids.append(prompt.pk)
+        cls.secret = Prompt.objects.create(title='secret title', content='secret body', author=cls.alice)
+        cls.secret.commit_version('secret body', cls.alice)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.bob)
+
+    def test_keeps_requested_order(self):
+        requested = [self.ids[2], self.ids[0], self.ids[3], self.ids[2]]
+        response = self.client.get('/api/prompts/batch/?ids=' + ','.join(map(str, requested)))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.data['results']], [self.ids[2], self.ids[0], self.ids[3]])
+        self.assertEqual((response.data['missing'], response.data['forbidden']), ([], []))
+
+    def test_missing_and_forbidden(self):
+        requested = [999999, self.secret.pk, self.ids[1]]
+        response = self.client.post('/api/prompts/batch/', {'ids': requested}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.data['results']], [self.ids[1]])
+        self.assertEqual(response.data['missing'], [999999])
+        self.assertEqual(response.data['forbidden'], [self.secret.pk])
+        # 无权查看的提示词只报告 id，内容不出现在响应中
+        self.assertNotIn(b'secret', response.content)
+
+        self.client.force_authenticate(self.alice)
+        response = self.client.post('/api/prompts/batch/', {'ids': requested}, format='json')
+        self.assertEqual([item['id'] for item in response.data['results']], [self.secret.pk, self.ids[1]])
+        self.assertEqual(response.data['forbidden'], [])
+
+    def test_invalid_ids(self):
+        self.assertEqual(self.client.get('/api/prompts/batch/?ids=1,x').status_code, 400)
+        self.assertEqual(self.client.post('/api/prompts/batch/', {'ids': '1,2'}, format='json').status_code, 400)
+        self.assertEqual(self.client.get('/api/prompts/batch/').status_code, 400)
+
+
+@override_settings(CACHES=TEST_CACHES, QUERY_BUDGET_MODE='off')
+class ConditionalRequestTests(TestCase):
+    """条件请求：最新版本作者改名后，详情与版本列表的校验值随之变化"""
+
+    def setUp(self):
+        set_performance_settings(self, rateLimit=0)
+        self.alice = User.objects.create_user('alice', password='x')
+        self.bob = User.objects.create_user('bob', password='x')
+        self.prompt = Prompt.objects.create(title='shared', content='v1', author=self.alice, sharing_mode='team')
+        self.prompt.commit_version('v1', self.alice)
+        # 最新版本由另一个用户提交（例如恢复版本），提示词作者不变
+        self.prompt.commit_version('v2', self.bob)
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def revalidate(self, url, extract):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.bob.username = 'robert'
+        self.bob.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(extract(response.data), 'robert')
+
+    def test_detail_changes_when_head_author_is_renamed(self):
+        self.revalidate(f'/api/prompts/{self.prompt.pk}/', lambda data: data['latest_version']['author_username'])
+
+    def test_versions_change_when_author_is_renamed(self):
+        self.revalidate(f'/api/prompts/{self.prompt.pk}/versions/', lambda data: data['results'][0]['author_username'])
+
+
+@override_settings(CACHES=TEST_CACHES, QUERY_BUDGET_MODE='off')
+class ResponseCacheTests(TestCase):
+    """写入在提交后递增数据代号，之后的列表请求不再命中旧缓存"""
+
+    def setUp(self):
+        set_performance_settings(self, cacheEnabled=True, rateLimit=0)
+        self.user = User.objects.create_user('writer', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def list_cache_status(self):
+        response = self.client.get('/api/prompts/')
+        self.assertEqual(response.status_code, 200)
+        return response['X-Cache']
+
+    def assert_write_invalidates(self, write):
+        self.list_cache_status()
+        self.assertEqual(self.list_cache_status(), 'HIT')
+        generation = response_cache.get_generation()
+        with self.captureOnCommitCallbacks(execute=True):
+            write()
+        self.assertGreater(response_cache.get_generation(), generation)
+        self.assertEqual(self.list_cache_status(), 'MISS')
+
+    def test_prompt_write(self):
+        self.assert_write_invalidates(lambda: self.client.post(
+            '/api/prompts/', {'title': 'new', 'content': 'body', 'sharing_mode': 'team'}, format='json'
+        ))
+        self.assertEqual(self.client.get('/api/prompts/').data['count'], 1)
+
+    def test_user_rename(self):
+        def rename():
+            self.user.username = 'renamed'
+            self.user.save()
+        self.assert_write_invalidates(rename)
+
+
+@override_settings(CACHES=TEST_CACHES, QUERY_BUDGET_MODE='off')
+class FragmentCacheTests(TestCase):
+    """片段缓存键包含最新版本作者，版本作者改名后列表不再返回旧用户名"""
+
+    def setUp(self):
+        set_performance_settings(self, cacheEnabled=True, rateLimit=0)
+        self.alice = User.objects.create_user('alice', password='x')
+        self.bob = User.objects.create_user('bob', password='x')
+        prompt = Prompt.objects.create(title='shared', content='v1', author=self.alice, sharing_mode='team')
+        prompt.commit_version('v1', self.alice)
+        prompt.commit_version('v2', self.bob)
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def head_authors(self):
+        response = self.client.get('/api/prompts/')
+        return [item['latest_version']['author_username'] for item in response.data['results']]
+
+    def test_version_author_rename(self):
+        self.assertEqual(self.head_authors(), ['bob'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bob.username = 'robert'
+            self.bob.save()
+        hits = response_cache.stats['fragment_hits']
+        self.assertEqual(self.head_authors(), ['robert'])
+        self.assertEqual(response_cache.stats['fragment_hits'], hits)
@@ -3,10 +3,17 @@ from . import views
 
 urlpatterns = [
     path('', views.PromptListCreateView.as_view(), name='prompt-list-create'),
+    path('search/', views.search_prompts, name='prompt-search'),
+    path('import/', views.import_prompts, name='prompt-import'),
+    path('export/', views.export_prompts, name='prompt-export'),
+    path('bulk/', views.bulk_operations, name='prompt-bulk'),
+    path('batch/', views.batch_get_prompts, name='prompt-batch'),
     path('<int:id>/', views.PromptDetailView.as_view(), name='prompt-detail'),
     path('<int:prompt_id>/versions/', views.PromptVersionListView.as_view(), name='prompt-versions'),
     path('<int:prompt_id>/versions/<int:version_id>/restore/', 
          views.restore_version, name='restore-version'),
+    path('<int:prompt_id>/versions/<int:from_version_id>/diff/<int:to_version_id>/',
+         views.VersionDiffView.as_view(), name='version-diff'),
     path('tags/', views.TagListCreateView.as_view(), name='tag-list-create'),
     path('tags/<int:id>/', views.TagDetailView.as_view(), name='tag-detail'),
     path('tags/<int:tag_id>/prompts/', views.prompts_by_tag, name='prompts-by-tag'),
@@ -1,12 +1,27 @@
+from itertools import islice
 from rest_framework import status, generics, permissions
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, parser_classes, permission_classes
 from rest_framework.response import Response
-from django.db.models import Q
+from rest_framework.views import APIView
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.parsers import MultiPartParser
+from rest_framework.utils.encoders import JSONEncoder
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from api.budgets import query_budget
+from api.conditional import conditional, latest, make_etag
+from api.pagination import KeysetPagination, KeysetPaginationMixin, wants_keyset_pagination
 from .models import Prompt, PromptVersion, Tag
 from .serializers import (
     PromptSerializer, PromptCreateSerializer, PromptUpdateSerializer, 
-    PromptVersionSerializer, TagSerializer
+    PromptVersionSerializer, TagSerializer, TagWithCountSerializer, BulkOperationsSerializer
 )
+from . import bulk, exporter, importer, response_cache, search
+from .diff import version_diff
 
 class IsOwnerOrReadOnly(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
@@ -24,31 +39,117 @@ class IsAdminOrOwnerOrShared(permissions.BasePermission):
             return True
         return False
 
-class PromptListCreateView(generics.ListCreateAPIView):
+class PromptKeysetPagination(KeysetPagination):
+    ordering = ('-updated_at', '-id')
+
+class PromptVersionKeysetPagination(KeysetPagination):
+    ordering = ('-version_number',)
+
+MAX_BATCH_IDS = 2000
+
+class CountedPaginator(Paginator):
+    """总数已知时跳过 COUNT 查询的分页器"""
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        if count is not None:
+            self.count = count
+
+class TagPromptPagination(PageNumberPagination):
+    """标签下提示词的分页，总数取自标签计数器"""
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    
+    def paginate_queryset(self, queryset, request, view=None, count=None):
+        self.known_count = count
+        return super().paginate_queryset(queryset, request, view)
+    
+    def django_paginator_class(self, object_list, per_page):
+        return CountedPaginator(object_list, per_page, count=self.known_count)
+
+def visible_prompts(user):
+    """该用户可见的提示词：管理员可见全部，其他用户可见自己的和团队共享的"""
+    if user.role == 'admin':
+        return Prompt.objects.all()
+    return Prompt.objects.filter(Q(author=user) | Q(sharing_mode='team'))
+
+def can_view_prompt(user, author_id, sharing_mode):
+    return user.role == 'admin' or author_id == user.pk or sharing_mode == 'team'
+
+def prompt_list_validators(request, *args, **kwargs):
+    # 提示词、标签及作者信息的任何写入都会递增数据代号，无需扫描可见集合；只提供 ETag
+    etag = make_etag('prompts', response_cache.get_generation(), request.user.pk, request.get_full_path())
+    return etag, None
+
+def prompt_detail_validators(request, id, **kwargs):
+    # 响应中的 latest_version.author_username 来自最新版本的作者，可能不是提示词作者
+    rows = list(Prompt.objects.filter(pk=id).values_list(
+        'author_id', 'sharing_mode', 'updated_at', 'version_count', 'head_version_id',
+        'author__username', 'author__updated_at',
+        'head_version__author_id', 'head_version__author__username', 'head_version__author__updated_at',
+        'tags__id', 'tags__name', 'tags__color',
+    ))
+    if not rows or not can_view_prompt(request.user, rows[0][0], rows[0][1]):
+        return None, None
+    _, _, updated_at, _, _, _, author_updated_at, _, _, head_author_updated_at, _, _, _ = rows[0]
+    return make_etag('prompt', id, rows), latest(updated_at, author_updated_at, head_author_updated_at)
+
+def version_list_validators(request, prompt_id, **kwargs):
+    row = Prompt.objects.filter(pk=prompt_id).values_list(
+        'author_id', 'sharing_mode', 'head_version_id', 'version_count', 'head_version__created_at'
+    ).first()
+    if row is None or not can_view_prompt(request.user, row[0], row[1]):
+        return None, None
+    # 版本不可变，只需关注新增版本与作者信息的变化；作者被删除时 updated 未必变化，计数会变
+    authors = PromptVersion.objects.filter(prompt_id=prompt_id).aggregate(
+        updated=Max('author__updated_at'), authored=Count('author'),
+    )
+    etag = make_etag('versions', prompt_id, request.get_full_path(), row, authors)
+    return etag, latest(row[4], authors['updated'])
+
+def tag_list_validators(request, *args, **kwargs):
+    tags = Tag.objects.aggregate(count=Count('pk'), updated=Max('updated_at'))
+    return make_etag('tags', request.user.pk, request.get_full_path(), tags), tags['updated']
+
+@query_budget(queries=43, methods=['POST'])
+@query_budget(queries=6, db_ms=200, methods=['GET'])
+@method_decorator(conditional(prompt_list_validators), name='get')
+class PromptListCreateView(KeysetPaginationMixin, generics.ListCreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
+    keyset_pagination_class = PromptKeysetPagination
     
     def get_queryset(self):
-        user = self.request.user
-        if user.role == 'admin':
-            return Prompt.objects.all()
-        
-        return Prompt.objects.filter(
-            Q(author=user) | Q(sharing_mode='team')
-        ).distinct()
+        queryset = visible_prompts(self.request.user)
+        if self.request.method == 'GET':
+            queryset = queryset.for_listing()
+        return queryset
     
     def get_serializer_class(self):
         if self.request.method == 'POST':
             return PromptCreateSerializer
         return PromptSerializer
     
+    def list(self, request, *args, **kwargs):
+        compute = super().list
+        return response_cache.cached_response(request, 'prompts', lambda: compute(request, *args, **kwargs))
+    
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+@query_budget(queries=34, methods=['PUT', 'PATCH'])
+@query_budget(queries=5, db_ms=50, methods=['GET'])
+@method_decorator(conditional(prompt_detail_validators), name='get')
+@method_decorator(conditional(prompt_detail_validators), name='put')
+@method_decorator(conditional(prompt_detail_validators), name='patch')
+@method_decorator(conditional(prompt_detail_validators), name='delete')
 class PromptDetailView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [permissions.IsAuthenticated, IsAdminOrOwnerOrShared]
-    queryset = Prompt.objects.all()
     lookup_field = 'id'
     
+    def get_queryset(self):
+        if self.request.method == 'GET':
+            return Prompt.objects.for_listing()
+        return Prompt.objects.select_related('author')
+    
     def get_serializer_class(self):
         if self.request.method in ['PUT', 'PATCH']:
             return PromptUpdateSerializer
@@ -56,14 +157,21 @@ class PromptDetailView(generics.RetrieveUpdateDestroyAPIView):
     
     def perform_update(self, serializer):
         serializer.save(author=self.request.user)
+    
+    def perform_destroy(self, instance):
+        search.remove_prompt(instance)
+        instance.delete()
 
-class PromptVersionListView(generics.ListAPIView):
+@query_budget(queries=7, db_ms=50, methods=['GET'])
+@method_decorator(conditional(version_list_validators), name='get')
+class PromptVersionListView(KeysetPaginationMixin, generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated, IsAdminOrOwnerOrShared]
+    keyset_pagination_class = PromptVersionKeysetPagination
     serializer_class = PromptVersionSerializer
     
     def get_queryset(self):
         prompt_id = self.kwargs['prompt_id']
-        return PromptVersion.objects.filter(prompt_id=prompt_id)
+        return PromptVersion.objects.filter(prompt_id=prompt_id).select_related('author', 'content_blob')
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated, IsAdminOrOwnerOrShared])
@@ -72,28 +180,71 @@ def restore_version(request, prompt_id, version_id):
         prompt = Prompt.objects.get(id=prompt_id)
         version = PromptVersion.objects.get(id=version_id, prompt=prompt)
         
-        next_version = prompt.versions.first().version_number + 1
-        
-        PromptVersion.objects.create(
-            prompt=prompt,
-            version_number=next_version,
-            content=version.content,
-            author=request.user,
-            commit_message=f"Restored from version {version.version_number}"
-        )
-        
-        prompt.content = version.content
-        prompt.save()
+        with transaction.atomic():
+            content = version.get_content()
+            prompt.commit_version(
+                content=content,
+                author=request.user,
+                commit_message=f"Restored from version {version.version_number}"
+            )
+            
+            prompt.content = content
+            prompt.save()
+            search.index_prompt(prompt)
         
         return Response({'message': 'Version restored successfully'}, status=status.HTTP_200_OK)
     
     except (Prompt.DoesNotExist, PromptVersion.DoesNotExist):
         return Response({'error': 'Prompt or version not found'}, status=status.HTTP_404_NOT_FOUND)
 
+class VersionDiffView(APIView):
+    """比较同一提示词的两个版本，返回 unified 文本和结构化的行/词级差异"""
+    permission_classes = [permissions.IsAuthenticated, IsAdminOrOwnerOrShared]
+    
+    def get(self, request, prompt_id, from_version_id, to_version_id):
+        try:
+            prompt = Prompt.objects.select_related('author').get(id=prompt_id)
+        except Prompt.DoesNotExist:
+            return Response({'error': 'Prompt not found'}, status=status.HTTP_404_NOT_FOUND)
+        self.check_object_permissions(request, prompt)
+        
+        versions = dict(
+            PromptVersion.objects.filter(
+                prompt=prompt, id__in=[from_version_id, to_version_id]
+            ).values_list('id', 'version_number')
+        )
+        if from_version_id not in versions or to_version_id not in versions:
+            return Response({'error': 'Version not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        diff = version_diff(from_version_id, to_version_id)
+        data = {
+            'prompt_id': prompt.id,
+            'from_version': {'id': from_version_id, 'version_number': versions[from_version_id]},
+            'to_version': {'id': to_version_id, 'version_number': versions[to_version_id]},
+            'algorithm': diff['algorithm'],
+            'stats': diff['stats'],
+        }
+        mode = request.GET.get('mode', 'all')
+        if mode in ('all', 'unified'):
+            data['unified'] = diff['unified']
+        if mode in ('all', 'structured'):
+            data['changes'] = diff['changes']
+        return Response(data)
+
+@query_budget(queries=5, db_ms=50, methods=['GET'])
+@method_decorator(conditional(tag_list_validators), name='get')
 class TagListCreateView(generics.ListCreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
-    queryset = Tag.objects.all()
-    serializer_class = TagSerializer
+    
+    def get_queryset(self):
+        if self.request.method == 'GET':
+            return Tag.objects.with_visible_counts(self.request.user)
+        return Tag.objects.all()
+    
+    def get_serializer_class(self):
+        if self.request.method == 'GET':
+            return TagWithCountSerializer
+        return TagSerializer
 
 class TagDetailView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -107,25 +258,205 @@ class TagDetailView(generics.RetrieveUpdateDestroyAPIView):
             return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
         return super().delete(request, *args, **kwargs)
 
+@query_budget(queries=5, db_ms=200)
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def prompts_by_tag(request, tag_id):
-    """获取指定标签的所有提示词"""
+    """分页获取指定标签下的提示词
+
+    默认按页码分页（?page=、?page_size=），?pagination=cursor 使用游标分页，
+    ?stream=1 以流式 JSON 返回全部结果（不缓存）。
+    """
+    if request.query_params.get('stream') in ('1', 'true'):
+        return _tag_prompts_response(request, tag_id)
+    return response_cache.cached_response(
+        request, f'tag:{tag_id}', lambda: _tag_prompts_response(request, tag_id)
+    )
+
+def _tag_prompts_response(request, tag_id):
+    user = request.user
     try:
-        tag = Tag.objects.get(id=tag_id)
-        user = request.user
-        
-        if user.role == 'admin':
-            prompts = tag.prompts.all()
-        else:
-            prompts = tag.prompts.filter(
-                Q(author=user) | Q(sharing_mode='team')
-            ).distinct()
-        
-        serializer = PromptSerializer(prompts, many=True)
-        return Response({
-            'tag': TagSerializer(tag).data,
-            'prompts': serializer.data
-        })
+        tag = Tag.objects.with_visible_counts(user).get(id=tag_id)
     except Tag.DoesNotExist:
         return Response({'error': 'Tag not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    if user.role == 'admin':
+        prompts = tag.prompts.all()
+    else:
+        prompts = tag.prompts.filter(Q(author=user) | Q(sharing_mode='team'))
+    prompts = prompts.for_listing().order_by('-updated_at', '-id')
+    tag_data = TagWithCountSerializer(tag).data
+    
+    if request.query_params.get('stream') in ('1', 'true'):
+        return StreamingHttpResponse(
+            _stream_tag_prompts(tag_data, prompts), content_type='application/json'
+        )
+    
+    if wants_keyset_pagination(request):
+        paginator = PromptKeysetPagination()
+        page = paginator.paginate_queryset(prompts, request)
+        data = paginator.get_paginated_data(PromptSerializer(page, many=True).data)
+        data['prompts'] = data.pop('results')
+        return Response({'tag': tag_data, **data})
+    
+    paginator = TagPromptPagination()
+    page = paginator.paginate_queryset(prompts, request, count=tag.prompt_count)
+    return Response({
+        'tag': tag_data,
+        'count': paginator.page.paginator.count,
+        'next': paginator.get_next_link(),
+        'previous': paginator.get_previous_link(),
+        'prompts': PromptSerializer(page, many=True).data,
+    })
+
+def _stream_tag_prompts(tag_data, prompts, chunk_size=500):
+    """逐批序列化并输出 JSON，内存占用与结果总数无关"""
+    encoder = JSONEncoder(ensure_ascii=False)
+    yield '{"tag": %s, "count": %d, "prompts": [' % (encoder.encode(tag_data), tag_data['prompt_count'])
+    separator = ''
+    rows = prompts.iterator(chunk_size=chunk_size)
+    while batch := list(islice(rows, chunk_size)):
+        for item in PromptSerializer(batch, many=True).data:
+            yield separator + encoder.encode(item)
+            separator = ','
+    yield ']}'
+
+@query_budget(queries=7, db_ms=200)
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def search_prompts(request):
+    """全文检索提示词（标题、内容、标签名）"""
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return Response({'error': 'Query parameter q is required'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), 100)
+        offset = max(int(request.GET.get('offset', 0)), 0)
+    except (ValueError, TypeError):
+        return Response({'error': 'Invalid limit or offset'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    hits, total = search.search(request.user, query, limit=limit, offset=offset)
+    prompts = Prompt.objects.for_listing().in_bulk([prompt_id for prompt_id, _ in hits])
+    
+    results = []
+    for prompt_id, score in hits:
+        if prompt_id in prompts:
+            data = PromptSerializer(prompts[prompt_id]).data
+            data['score'] = round(score, 4)
+            results.append(data)
+    
+    return Response({
+        'query': query,
+        'count': total,
+        'results': results,
+    })
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+@parser_classes([MultiPartParser])
+def import_prompts(request):
+    """批量导入提示词（NDJSON、.txt/.md/.json 文件或 zip 压缩包），作者为当前用户"""
+    upload = request.FILES.get('file')
+    if upload is None:
+        return Response({'error': 'file is required'}, status=status.HTTP_400_BAD_REQUEST)
+    sharing_mode = request.data.get('sharing_mode', 'private')
+    if sharing_mode not in importer.SHARING_MODES:
+        return Response({'error': 'Invalid sharing_mode'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    records = importer.iter_records(upload, upload.name, importer.ImportLimits())
+    result = importer.import_records(records, request.user, default_sharing_mode=sharing_mode)
+    return Response(result.as_dict())
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def export_prompts(request):
+    """流式导出可见的提示词（NDJSON）
+
+    ?history=1 附带完整版本历史，?compress=gzip 压缩输出；
+    可按 tag（标签 id）、author（用户名）、updated_after / updated_before 筛选。
+    """
+    params = request.query_params
+    try:
+        tag_id = int(params['tag']) if params.get('tag') else None
+        updated_after = exporter.parse_timestamp(params['updated_after']) if params.get('updated_after') else None
+        updated_before = exporter.parse_timestamp(params['updated_before']) if params.get('updated_before') else None
+    except ValueError:
+        return Response({'error': 'Invalid tag or date filter'}, status=status.HTTP_400_BAD_REQUEST)
+    compress = params.get('compress')
+    if compress not in (None, '', 'gzip'):
+        return Response({'error': 'Unsupported compression'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    prompts = exporter.export_queryset(
+        request.user, tag_id=tag_id, author=params.get('author'),
+        updated_after=updated_after, updated_before=updated_before,
+    )
+    records = exporter.iter_records(prompts, include_history=params.get('history') in ('1', 'true'))
+    stream = exporter.iter_ndjson(records)
+    filename = f"prompts-{timezone.now():%Y%m%d%H%M%S}.ndjson"
+    if compress == 'gzip':
+        stream = exporter.gzip_stream(stream)
+        filename += '.gz'
+    
+    response = StreamingHttpResponse(
+        stream, content_type='application/gzip' if compress == 'gzip' else 'application/x-ndjson'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def bulk_operations(request):
+    """在一个事务中对多个提示词依次执行操作，返回逐项结果"""
+    serializer = BulkOperationsSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    results = bulk.apply_operations(
+        request.user, serializer.validated_data['ids'], serializer.validated_data['operations']
+    )
+    return Response({'results': results})
+
+@query_budget(queries=4, db_ms=200)
+@api_view(['GET', 'POST'])
+@permission_classes([permissions.IsAuthenticated])
+def batch_get_prompts(request):
+    """按 id 批量获取提示词，结果保持请求顺序
+
+    GET 使用 ?ids=1,2,3，id 较多时 POST {"ids": [...]}。
+    不存在与无权查看的 id 分别在 missing、forbidden 中返回。
+    """
+    if request.method == 'POST':
+        raw_ids = request.data.get('ids')
+        if not isinstance(raw_ids, list):
+            return Response({'error': 'ids must be a list of integers'}, status=status.HTTP_400_BAD_REQUEST)
+    else:
+        raw_ids = request.query_params.get('ids', '').split(',')
+    try:
+        ids = list(dict.fromkeys(int(value) for value in raw_ids if str(value).strip()))
+    except (TypeError, ValueError):
+        return Response({'error': 'ids must be a list of integers'}, status=status.HTTP_400_BAD_REQUEST)
+    if not ids:
+        return Response({'error': 'ids is required'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(ids) > MAX_BATCH_IDS:
+        return Response({'error': f'At most {MAX_BATCH_IDS} ids per request'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    user = request.user
+    prompts = Prompt.objects.for_listing().in_bulk(ids)
+    visible = []
+    missing = []
+    forbidden = []
+    for prompt_id in ids:
+        prompt = prompts.get(prompt_id)
+        if prompt is None:
+            missing.append(prompt_id)
+        elif can_view_prompt(user, prompt.author_id, prompt.sharing_mode):
+            visible.append(prompt)
+        else:
+            forbidden.append(prompt_id)
+    
+    return Response({
+        'results': PromptSerializer(visible, many=True).data,
+        'missing': missing,
+        'forbidden': forbidden,
+    })
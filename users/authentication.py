@@ -0,0 +1,97 @@
+"""带缓存与过期的 Token 认证
+
+令牌到用户的解析结果短时间缓存在共享缓存中，命中时不查询数据库；
+缓存只保存用户 id、是否启用、角色与令牌签发时间，不含密码哈希等敏感字段，
+命中时据此构造只含这些字段的用户，访问其余字段时一次查询加载。
+用户或令牌变化时由 users.signals 清除对应缓存。
+令牌签发超过系统设置 security.sessionTimeout（小时，0 表示不过期）后失效，下次登录时轮换。
+"""
+import datetime
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from api.models import SystemSetting
+from .models import User
+
+# 缓存内容只含基本字段；格式变化时更换前缀，避免读到旧格式的条目
+CACHE_PREFIX = 'auth:token:v2'
+CACHE_TIMEOUT = getattr(settings, 'AUTH_TOKEN_CACHE_TIMEOUT', 60)
+
+
+def token_cache_key(key):
+    # 缓存键可能写入日志或共享后端，不使用令牌原文
+    return f'{CACHE_PREFIX}:{hashlib.sha256(key.encode()).hexdigest()}'
+
+
+def forget_tokens(keys):
+    cache.delete_many([token_cache_key(key) for key in keys])
+
+
+def forget_user_tokens(user_id):
+    forget_tokens(Token.objects.filter(user_id=user_id).values_list('key', flat=True))
+
+
+def token_expiry(created):
+    """返回令牌的过期时间，未启用过期时返回 None"""
+    hours = SystemSetting.get_int('sessionTimeout', 24)
+    if hours <= 0:
+        return None
+    return created + datetime.timedelta(hours=hours)
+
+
+def is_expired(created):
+    expiry = token_expiry(created)
+    return expiry is not None and expiry <= timezone.now()
+
+
+def issue_token(user):
+    """返回用户的有效令牌，已过期的令牌删除后重新签发"""
+    token, created = Token.objects.get_or_create(user=user)
+    if not created and is_expired(token.created):
+        token.delete()
+        token = Token.objects.create(user=user)
+    return token
+
+
+def revoke_tokens(user):
+    """删除用户的全部令牌（例如重置密码后），缓存由信号清除"""
+    Token.objects.filter(user=user).delete()
+
+
+def cached_user(user_id, is_active, role):
+    """按缓存的字段构造用户，其余字段延迟加载"""
+    user = User.from_db(router.db_for_read(User), ['id', 'is_active', 'role'], [user_id, is_active, role])
+    user._load_deferred_together = True
+    return user
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        cache_key = token_cache_key(key)
+        cached = cache.get(cache_key)
+        if cached is None:
+            try:
+                token = Token.objects.select_related('user').get(key=key)
+            except Token.DoesNotExist:
+                raise exceptions.AuthenticationFailed('Invalid token.')
+            user, created = token.user, token.created
+            if user.is_active and not is_expired(created):
+                cache.set(cache_key, (user.pk, user.is_active, user.role, created), CACHE_TIMEOUT)
+        else:
+            user_id, is_active, role, created = cached
+            user = cached_user(user_id, is_active, role)
+
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        if is_expired(created):
+            Token.objects.filter(key=key).delete()
+            cache.delete(cache_key)
+            raise exceptions.AuthenticationFailed('Token has expired.')
+        return user, Token(key=key, user=user, created=created)
@@ -17,9 +17,27 @@ class User(AbstractUser):
     two_factor_enabled = models.BooleanField(default=False)
     two_factor_secret = models.CharField(max_length=255, blank=True, null=True)
 
+    # 认证缓存构造的用户只含少数字段（见 users.authentication），访问其余字段时一次查询全部加载
+    _load_deferred_together = False
+
     def __str__(self):
         return self.username
 
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        if self._load_deferred_together and fields:
+            deferred = self.get_deferred_fields()
+            if set(fields) <= deferred:
+                fields = list(deferred)
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+
+    def save(self, *args, **kwargs):
+        # 含延迟字段的实例只保存已加载的字段，auto_now 的 updated_at 会被跳过，先补齐
+        if self._load_deferred_together and not kwargs.get('update_fields'):
+            deferred = self.get_deferred_fields()
+            if deferred:
+                self.refresh_from_db(fields=list(deferred))
+        super().save(*args, **kwargs)
+
     def generate_two_factor_secret(self):
         if not self.two_factor_secret:
             self.two_factor_secret = pyotp.random_base32()
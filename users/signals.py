@@ -0,0 +1,42 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api import stats
+from .authentication import forget_tokens, forget_user_tokens
+from .models import User
+
+
+@receiver(post_save, sender=User)
+def forget_cached_user(sender, instance, created, update_fields=None, **kwargs):
+    # 角色、停用、密码等变化都要让缓存的认证结果失效；登录时只更新 last_login，无需处理
+    if created or (update_fields and set(update_fields) == {'last_login'}):
+        return
+    forget_user_tokens(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    forget_tokens([instance.key])
+
+
+@receiver(pre_save, sender=User)
+def remember_previous_active_state(sender, instance, update_fields=None, **kwargs):
+    if instance.pk is None or (update_fields and 'is_active' not in update_fields):
+        instance._previous_is_active = None
+        return
+    instance._previous_is_active = User.objects.filter(pk=instance.pk).values_list('is_active', flat=True).first()
+
+
+@receiver(post_save, sender=User)
+def update_user_stats(sender, instance, created, **kwargs):
+    previous = instance.__dict__.pop('_previous_is_active', None)
+    if created:
+        stats.adjust({'users': 1, 'active_users': int(instance.is_active)})
+    elif previous is not None and previous != instance.is_active:
+        stats.adjust({'active_users': 1 if instance.is_active else -1})
+
+
+@receiver(post_delete, sender=User)
+def update_user_stats_on_delete(sender, instance, **kwargs):
+    stats.adjust({'users': -1, 'active_users': -int(instance.is_active)})
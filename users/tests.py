@@ -0,0 +1,95 @@
+from django.contrib.auth.tokens import default_token_generator
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .authentication import issue_token, token_cache_key
+from .models import User
+
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'users-tests'},
+    'throttle': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+}
+
+
+@override_settings(CACHES=TEST_CACHES, QUERY_BUDGET_MODE='off')
+class CachedTokenAuthenticationTests(TestCase):
+    """令牌缓存：只保存基本字段，用户或令牌变化时失效"""
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user('admin', password='x', role='admin')
+        self.user = User.objects.create_user('member', email='member@example.com', password='old-password')
+        self.user.two_factor_secret = 'SECRET'
+        self.user.save()
+        self.token = issue_token(self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.cache_key = token_cache_key(self.token.key)
+        # 第一次请求写入缓存
+        self.assertEqual(self.client.get('/api/users/profile/').status_code, 200)
+
+    def admin_client(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {issue_token(self.admin).key}')
+        return client
+
+    def assertRejected(self, detail):
+        # 认证类列表中 SessionAuthentication 在前，认证失败返回 403
+        response = self.client.get('/api/users/profile/')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(str(response.data['detail']), detail)
+
+    def test_cache_holds_no_secrets(self):
+        cached = cache.get(self.cache_key)
+        self.assertEqual(cached[:3], (self.user.pk, True, 'user'))
+        self.assertEqual(len(cached), 4)
+        self.assertNotIn(self.user.password, repr(cached))
+        self.assertNotIn('SECRET', repr(cached))
+
+    def test_cached_user_loads_remaining_fields_once(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/users/profile/')
+        self.assertEqual(response.data['username'], 'member')
+        self.assertEqual(response.data['email'], 'member@example.com')
+
+    def test_cached_user_save_updates_timestamp(self):
+        before = User.objects.get(pk=self.user.pk).updated_at
+        response = self.client.put('/api/users/profile/', {'first_name': 'Ann'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(user.first_name, 'Ann')
+        self.assertEqual(user.email, 'member@example.com')
+        self.assertGreater(user.updated_at, before)
+
+    def test_logout_invalidates(self):
+        self.assertEqual(self.client.post('/api/users/logout/').status_code, 200)
+        self.assertIsNone(cache.get(self.cache_key))
+        self.assertRejected('Invalid token.')
+
+    def test_password_reset_invalidates(self):
+        response = APIClient().post('/api/users/reset-password/', {
+            'uid': urlsafe_base64_encode(force_bytes(self.user.pk)),
+            'token': default_token_generator.make_token(self.user),
+            'new_password': 'new-password',
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(cache.get(self.cache_key))
+        self.assertFalse(Token.objects.filter(key=self.token.key).exists())
+        self.assertRejected('Invalid token.')
+
+    def test_role_change_invalidates(self):
+        response = self.admin_client().put(f'/api/users/admin/users/{self.user.pk}/', {'role': 'admin'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(cache.get(self.cache_key))
+        self.assertEqual(self.client.get('/api/users/admin/stats/').status_code, 200)
+        self.assertEqual(cache.get(self.cache_key)[2], 'admin')
+
+    def test_deactivation_invalidates(self):
+        response = self.admin_client().put(f'/api/users/admin/users/{self.user.pk}/', {'is_active': False}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(cache.get(self.cache_key))
+        self.assertRejected('User inactive or deleted.')
@@ -1,8 +1,7 @@
 from rest_framework import status, permissions
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
-from rest_framework.authtoken.models import Token
 from django.contrib.auth import login
 from django.core.paginator import Paginator
 from django.db.models import Q
@@ -18,6 +17,11 @@ from .serializers import (
     ForgotPasswordSerializer, ResetPasswordSerializer
 )
 from .models import User
+from .authentication import issue_token, revoke_tokens
+from api import stats
+from api.budgets import query_budget
+from api.pagination import KeysetPagination, wants_keyset_pagination
+from api.throttling import AnonRateThrottle, AuthRateThrottle, TwoFactorRateThrottle
 import qrcode
 import io
 import base64
@@ -26,8 +30,12 @@ class IsAdmin(permissions.BasePermission):
     def has_permission(self, request, view):
         return request.user.is_authenticated and request.user.role == 'admin'
 
+class UserKeysetPagination(KeysetPagination):
+    ordering = ('id',)
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([AnonRateThrottle, AuthRateThrottle])
 def register(request):
     # 检查是否是第一个用户，如果是则设为管理员
     is_first_user = User.objects.count() == 0
@@ -41,7 +49,7 @@ def register(request):
             user.role = 'admin'
             user.save()
         
-        token, created = Token.objects.get_or_create(user=user)
+        token = issue_token(user)
         return Response({
             'user': UserSerializer(user).data,
             'token': token.key
@@ -50,6 +58,7 @@ def register(request):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([AnonRateThrottle, AuthRateThrottle])
 def login_view(request):
     serializer = UserLoginSerializer(data=request.data)
     if serializer.is_valid():
@@ -63,7 +72,7 @@ def login_view(request):
             }, status=status.HTTP_200_OK)
 
         login(request, user)
-        token, created = Token.objects.get_or_create(user=user)
+        token = issue_token(user)
         return Response({
             'user': UserSerializer(user).data,
             'token': token.key
@@ -72,6 +81,7 @@ def login_view(request):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([AnonRateThrottle, AuthRateThrottle, TwoFactorRateThrottle])
 def verify_two_factor(request):
     user_id = request.data.get('user_id')
     code = request.data.get('code')
@@ -83,7 +93,7 @@ def verify_two_factor(request):
 
     if user.verify_two_factor_code(code):
         login(request, user)
-        token, created = Token.objects.get_or_create(user=user)
+        token = issue_token(user)
         return Response({
             'user': UserSerializer(user).data,
             'token': token.key
@@ -104,6 +114,7 @@ def logout(request):
         logger.warning(f"Error during logout: {e}")
     return Response({'message': 'Successfully logged out'}, status=status.HTTP_200_OK)
 
+@query_budget(queries=2, methods=['GET'])
 @api_view(['GET', 'PUT'])
 @permission_classes([IsAuthenticated])
 def profile(request):
@@ -186,6 +197,7 @@ def two_factor_disable(request):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([AnonRateThrottle, AuthRateThrottle])
 def forgot_password(request):
     """发送密码重置邮件"""
     email = request.data.get('email')
@@ -247,6 +259,7 @@ PromptManager 团队
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([AnonRateThrottle, AuthRateThrottle])
 def reset_password(request):
     """重置密码"""
     token = request.data.get('token')
@@ -267,29 +280,35 @@ def reset_password(request):
     if not default_token_generator.check_token(user, token):
         return Response({'error': 'Invalid or expired reset token'}, status=status.HTTP_400_BAD_REQUEST)
     
-    # 重置密码
+    # 重置密码，并注销已签发的令牌
     user.set_password(new_password)
     user.save()
+    revoke_tokens(user)
     
     return Response({'message': 'Password has been reset successfully'})
 
 # Admin endpoints
+@query_budget(queries=5, db_ms=50)
 @api_view(['GET'])
 @permission_classes([IsAdmin])
 def admin_stats(request):
-    from prompts.models import Prompt
-    
-    total_users = User.objects.count()
-    total_prompts = Prompt.objects.count()
-    active_users = User.objects.filter(is_active=True).count()
+    """管理统计：总数直接读取计数器，history 为最近 ?days= 天（默认 30，最多 365）的每日汇总"""
+    try:
+        days = min(max(int(request.GET.get('days', 30)), 1), 365)
+    except (TypeError, ValueError):
+        days = 30
+    counters = stats.current()
     
     return Response({
-        'total_users': total_users,
-        'total_prompts': total_prompts,
-        'active_users': active_users,
-        'system_health': 'good'
+        'total_users': counters['users'],
+        'total_prompts': counters['prompts'],
+        'active_users': counters['active_users'],
+        'system_health': 'good',
+        'counters': counters,
+        'history': stats.history(days),
     })
 
+@query_budget(queries=4, db_ms=100, methods=['GET'])
 @api_view(['GET', 'POST'])
 @permission_classes([IsAdmin])
 def admin_users(request):
@@ -312,6 +331,16 @@ def admin_users(request):
                 Q(last_name__icontains=search)
             )
         
+        if wants_keyset_pagination(request):
+            # 游标分页：按 id 定位，不执行 COUNT(*) 和 OFFSET
+            paginator = UserKeysetPagination()
+            page_users = paginator.paginate_queryset(users, request)
+            data = paginator.get_paginated_data(UserSerializer(page_users, many=True).data)
+            data['users'] = data.pop('results')
+            if 'count' in data:
+                data['total_users'] = data.pop('count')
+            return Response(data)
+        
         paginator = Paginator(users, 20)
         try:
             page_obj = paginator.get_page(page)
@@ -332,6 +361,7 @@ def admin_users(request):
             return Response(UserSerializer(user).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+@query_budget(queries=3, db_ms=50, methods=['GET'])
 @api_view(['GET', 'PUT', 'DELETE'])
 @permission_classes([IsAdmin])
 def admin_user_detail(request, user_id):